@@ -0,0 +1,106 @@
+#------------------------------------------------------------------------------
+# Name:        array_encoder.py
+# Purpose:     Benchmark of array to text conversion
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+'''Compares the array encoder with the per element formatting used before.
+
+Run from the repository root:
+    blender --background --python benchmarks/array_encoder.py -- \
+        --values 100000 1000000
+
+Every encoder result is checked against the old text, round trip output
+against the values it was made from.
+'''
+
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from io_export_cryblend import array_encoder
+
+
+def old_floats_to_string(floats):
+    return " ".join("%.6f" % x for x in floats)
+
+
+def old_ints_to_string(ints):
+    return "".join("%s " % x for x in ints)
+
+
+def make_values(count, seed=0):
+    generator = random.Random(seed)
+    floats = array('f', (generator.uniform(-10.0, 10.0)
+                         for _ in range(count)))
+    ints = array('i', (generator.randrange(count) for _ in range(count)))
+    names = ["bone_{:d}".format(index) for index in range(count // 100)]
+    return floats, ints, names
+
+
+def _time(repeat, function, *args):
+    best = None
+    for _ in range(repeat):
+        start_time = time.time()
+        result = function(*args)
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--values", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print("{:>9} {:>8} {:>10} {:>10} {:>8}".format(
+          "values", "stream", "old [s]", "new [s]", "speedup"))
+    for count in args.values:
+        floats, ints, names = make_values(count)
+
+        old_time, expected = _time(args.repeat, old_floats_to_string, floats)
+        new_time, text = _time(args.repeat, array_encoder.encode_floats,
+                               floats)
+        assert text == expected
+        _print_row(count, "float", old_time, new_time)
+
+        old_time, expected = _time(args.repeat, old_ints_to_string, ints)
+        new_time, text = _time(args.repeat, array_encoder.encode_ints, ints)
+        assert text + " " == expected
+        _print_row(count, "int", old_time, new_time)
+
+        old_time, expected = _time(args.repeat, " ".join, names)
+        new_time, text = _time(args.repeat, array_encoder.encode_names,
+                               names)
+        assert text == expected
+        _print_row(len(names), "name", old_time, new_time)
+
+        new_time, text = _time(args.repeat, array_encoder.encode_floats,
+                               floats, 6, True)
+        assert array('f', map(float, text.split())) == floats
+        print("{:>9} {:>8} {:>10} {:>10.4f} {:>8}".format(
+              count, "exact", "-", new_time, "-"))
+
+
+def _print_row(count, stream, old_time, new_time):
+    print("{:>9} {:>8} {:>10.4f} {:>10.4f} {:>7.1f}x".format(
+          count, stream, old_time, new_time, old_time / max(new_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    main(argv)
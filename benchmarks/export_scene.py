@@ -0,0 +1,413 @@
+#------------------------------------------------------------------------------
+# Name:        export_scene.py
+# Purpose:     Benchmark of whole exports of a synthetic scene
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+'''Times exports of a generated scene, stage by stage, with a fake RC.
+
+Run from the repository root, no Windows or RC needed:
+    blender --background --python benchmarks/export_scene.py -- \
+        --meshes 20 --vertices 10000 --materials 4 --bones 16 \
+        --keyframes 50 --textures 8
+
+Exporter options are set with --option, e.g. --option rc_jobs=8
+--option split_export_nodes=True. Configuration.rc_path points at
+benchmarks/fake_rc.py for the runs, its latency is set by --rc-startup and
+--rc-file-time. The blend file, textures and output go to a temporary
+directory, or to --directory. --json writes the results for comparisons
+between versions.
+
+The DAEs of all runs have to be the same, leaving out their times, else
+the RC cache misses. Their hashes are in the --json results, to compare
+them between Blender sessions or machines give both the same --directory.
+'''
+
+import argparse
+import ast
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import stat
+import sys
+import tempfile
+import time
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io_export_cryblend
+from io_export_cryblend import cache, export
+from io_export_cryblend.configuration import Configuration
+
+
+FAKE_RC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "fake_rc.py")
+
+BONE_LENGTH = 0.5
+
+
+def build_scene(args, directory):
+    '''Makes the scene in an empty blend file saved in 'directory', returns
+    how many vertices its meshes have.
+    '''
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.join(directory,
+                                                      "benchmark.blend"))
+    scene = bpy.context.scene
+    generator = random.Random(0)
+
+    node_type = "cga" if args.keyframes else "cgf"
+    static_node = bpy.data.groups.new("benchmark.{}".format(node_type))
+    images = make_images(args.textures, os.path.join(directory, "textures"))
+
+    vertex_count = 0
+    for index in range(args.meshes):
+        name = "mesh_{:03d}".format(index)
+        materials = make_materials(name, args.materials, images, index)
+        object_ = make_mesh_object(name, args.vertices, materials, generator)
+        object_.location = (index * 3.0, 0.0, 0.0)
+        scene.objects.link(object_)
+        vertex_count += len(object_.data.vertices)
+
+        if index == 0 and args.bones:
+            armature = make_armature(args.bones)
+            scene.objects.link(armature)
+            skin(object_, armature, args.bones)
+            character_node = bpy.data.groups.new("benchmark_character.chr")
+            character_node.objects.link(armature)
+            character_node.objects.link(object_)
+        else:
+            if args.keyframes:
+                animate(object_, args.keyframes, generator)
+            static_node.objects.link(object_)
+
+    scene.frame_start = 1
+    scene.frame_end = max(1, args.keyframes)
+    scene.update()
+
+    return vertex_count
+
+
+def make_images(count, directory):
+    os.makedirs(directory, exist_ok=True)
+    images = []
+    for index in range(count):
+        image = bpy.data.images.new("texture_{:03d}".format(index), 64, 64)
+        image.filepath_raw = os.path.join(directory,
+                                          "{}.png".format(image.name))
+        image.file_format = 'PNG'
+        image.save()
+        images.append(image)
+
+    return images
+
+
+def make_materials(name, count, images, offset):
+    materials = []
+    for index in range(count):
+        # named the way RC wants them, see SetMaterialNames
+        material = bpy.data.materials.new("benchmark__{:03d}__{}_{:d}__"
+                                          "physDefault".format(
+                                              offset * count + index + 1,
+                                              name, index))
+        if images:
+            image = images[(offset * count + index) % len(images)]
+            texture = bpy.data.textures.new(material.name, 'IMAGE')
+            texture.image = image
+            texture_slot = material.texture_slots.add()
+            texture_slot.texture = texture
+            texture_slot.texture_coords = 'UV'
+            if index % 2:
+                texture_slot.use_map_color_diffuse = False
+                texture_slot.use_map_normal = True
+        materials.append(material)
+
+    return materials
+
+
+def make_mesh_object(name, vertex_count, materials, generator):
+    '''A bumpy grid of about 'vertex_count' vertices.'''
+    side = max(2, int(round(math.sqrt(vertex_count))))
+    vertices = []
+    for row in range(side):
+        for column in range(side):
+            x = 2.0 * column / (side - 1) - 1.0
+            y = 2.0 * row / (side - 1) - 1.0
+            z = 0.1 * math.sin(4.0 * x) * math.cos(4.0 * y) \
+                + generator.uniform(-0.01, 0.01)
+            vertices.append((x, y, z))
+
+    faces = []
+    for row in range(side - 1):
+        for column in range(side - 1):
+            corner = row * side + column
+            faces.append((corner, corner + 1, corner + side + 1,
+                          corner + side))
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(vertices, [], faces)
+    for material in materials:
+        mesh.materials.append(material)
+    if materials:
+        for polygon in mesh.polygons:
+            polygon.material_index = polygon.index % len(materials)
+    mesh.uv_textures.new()
+    mesh.update(calc_tessface=True)
+
+    return bpy.data.objects.new(name, mesh)
+
+
+def make_armature(bone_count):
+    armature_data = bpy.data.armatures.new("benchmark_armature")
+    armature = bpy.data.objects.new("benchmark_armature", armature_data)
+    bpy.context.scene.objects.link(armature)
+    bpy.context.scene.objects.active = armature
+
+    bpy.ops.object.mode_set(mode='EDIT')
+    parent = None
+    for index in range(bone_count):
+        bone = armature_data.edit_bones.new("bone_{:03d}".format(index))
+        bone.head = (0.0, 0.0, index * BONE_LENGTH)
+        bone.tail = (0.0, 0.0, (index + 1) * BONE_LENGTH)
+        bone.parent = parent
+        parent = bone
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    bpy.context.scene.objects.unlink(armature)
+    return armature
+
+
+def skin(object_, armature, bone_count):
+    '''Weights every vertex to the two bones nearest to it along x.'''
+    object_.parent = armature
+    modifier = object_.modifiers.new("Armature", 'ARMATURE')
+    modifier.object = armature
+
+    groups = [object_.vertex_groups.new("bone_{:03d}".format(index))
+              for index in range(bone_count)]
+    for vertex in object_.data.vertices:
+        position = (vertex.co.x + 1.0) / 2.0 * (bone_count - 1)
+        index = min(int(position), bone_count - 1)
+        weight = position - index
+        groups[index].add([vertex.index], 1.0 - weight, 'REPLACE')
+        if index + 1 < bone_count and weight > 0.0:
+            groups[index + 1].add([vertex.index], weight, 'REPLACE')
+
+
+def animate(object_, keyframe_count, generator):
+    for frame in range(1, keyframe_count + 1):
+        object_.location.z = generator.uniform(-1.0, 1.0)
+        object_.rotation_euler.z = generator.uniform(-math.pi, math.pi)
+        object_.keyframe_insert("location", frame=frame)
+        object_.keyframe_insert("rotation_euler", frame=frame)
+
+
+def make_fake_rc(directory, startup_time, file_time):
+    '''Returns the path of an executable which runs fake_rc.py with
+    Blender's Python.
+    '''
+    path = os.path.join(directory, "rc")
+    with open(path, "w") as script:
+        script.write("#!/bin/sh\n"
+                     "CRYBLEND_FAKE_RC_STARTUP={!r} "
+                     "CRYBLEND_FAKE_RC_FILE_TIME={!r} "
+                     "exec '{}' '{}' \"$@\"\n".format(
+                         str(startup_time), str(file_time),
+                         bpy.app.binary_path_python, FAKE_RC_PATH))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    return path
+
+
+def get_config(filepath, options):
+    '''The Config of the export operator with its defaults and 'options'.'''
+    values = {}
+    for prop in io_export_cryblend.Export.bl_rna.properties:
+        if prop.identifier != "rna_type":
+            values[prop.identifier] = getattr(prop, "default", None)
+    values.update(options)
+    values["filepath"] = filepath
+
+    return io_export_cryblend.Export.Config(
+        config=argparse.Namespace(**values))
+
+
+def parse_options(items):
+    options = {"save_dae": True}
+    for item in items:
+        name, _, text = item.partition("=")
+        try:
+            options[name] = ast.literal_eval(text)
+        except (SyntaxError, ValueError):
+            options[name] = text
+
+    return options
+
+
+def run_export(config, output_directory, verbose):
+    for file_name in os.listdir(output_directory):
+        os.remove(os.path.join(output_directory, file_name))
+
+    progress = export.ExportProgress()
+    exporter = export.CrytekDaeExporter(config, progress)
+    output = io.StringIO()
+    start_time = time.time()
+    with contextlib.redirect_stdout(sys.stdout if verbose else output):
+        exporter.export()
+    total_time = time.time() - start_time
+
+    dae_size = 0
+    dae_hashes = {}
+    rc_files = 0
+    for file_name in os.listdir(output_directory):
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension == ".dae":
+            path = os.path.join(output_directory, file_name)
+            dae_size += os.path.getsize(path)
+            dae_hashes[file_name] = cache.hash_dae(path)
+        elif extension[1:] in export.RC_SECOND_PASS_TYPES:
+            rc_files += 1
+
+    return {"time": total_time,
+            "stages": dict(progress.get_stage_times()),
+            "dae_size": dae_size,
+            "dae_hashes": dae_hashes,
+            "rc_files": rc_files}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meshes", type=int, default=10)
+    parser.add_argument("--vertices", type=int, default=10000,
+                        help="per mesh")
+    parser.add_argument("--materials", type=int, default=4,
+                        help="per mesh")
+    parser.add_argument("--bones", type=int, default=0,
+                        help="of an armature skinning the first mesh")
+    parser.add_argument("--keyframes", type=int, default=0,
+                        help="of every other mesh")
+    parser.add_argument("--textures", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--rc-startup", type=float, default=0.5)
+    parser.add_argument("--rc-file-time", type=float, default=0.05)
+    parser.add_argument("--option", action="append", default=[],
+                        metavar="NAME=VALUE")
+    parser.add_argument("--directory")
+    parser.add_argument("--json", metavar="PATH")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    directory = args.directory or tempfile.mkdtemp(prefix="cryblend-bench-")
+    output_directory = os.path.join(directory, "output")
+    os.makedirs(output_directory, exist_ok=True)
+
+    io_export_cryblend.register()
+    previous_rc_path = Configuration.rc_path
+    previous_texture_rc_path = Configuration.rc_for_texture_conversion_path
+    previous_textures_directory = Configuration.textures_directory
+    try:
+        start_time = time.time()
+        vertex_count = build_scene(args, directory)
+        print("Scene of {:d} vertices built in {:.2f} sec.".format(
+              vertex_count, time.time() - start_time))
+
+        # the configuration is not saved, the user's RC is kept
+        Configuration.rc_path = make_fake_rc(directory, args.rc_startup,
+                                             args.rc_file_time)
+        Configuration.rc_for_texture_conversion_path = ""
+        Configuration.textures_directory = os.path.join(directory,
+                                                        "textures")
+        config = get_config(os.path.join(output_directory, "benchmark.dae"),
+                            parse_options(args.option))
+
+        results = [run_export(config, output_directory, args.verbose)
+                   for _ in range(args.runs)]
+    finally:
+        Configuration.rc_path = previous_rc_path
+        Configuration.rc_for_texture_conversion_path = \
+            previous_texture_rc_path
+        Configuration.textures_directory = previous_textures_directory
+        io_export_cryblend.unregister()
+
+    summary = summarise(args, vertex_count, results)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(summary, json_file, indent=2)
+
+    return 0 if not summary["changed_daes"] else 1
+
+
+def summarise(args, vertex_count, results):
+    best = min(results, key=lambda result: result["time"])
+    stages = {}
+    for result in results:
+        for stage, seconds in result["stages"].items():
+            stages[stage] = min(stages.get(stage, seconds), seconds)
+
+    rc_time = stages.get("Running RC", 0.0)
+    export_time = best["time"] - rc_time
+    return {"version": io_export_cryblend.VERSION,
+            "scene": {"meshes": args.meshes,
+                      "vertices": vertex_count,
+                      "materials": args.materials,
+                      "bones": args.bones,
+                      "keyframes": args.keyframes,
+                      "textures": args.textures},
+            "options": args.option,
+            "runs": [result["time"] for result in results],
+            "dae_hashes": results[0]["dae_hashes"],
+            "changed_daes": sorted(
+                file_name for file_name, dae_hash
+                in results[0]["dae_hashes"].items()
+                if any(result["dae_hashes"].get(file_name) != dae_hash
+                       for result in results)),
+            "stages": stages,
+            "throughput": {
+                "vertices_per_sec": vertex_count / max(best["time"], 1e-9),
+                "meshes_per_sec": args.meshes / max(best["time"], 1e-9),
+                "dae_mb_per_sec": best["dae_size"] / 1048576.0
+                                  / max(export_time, 1e-9),
+                "rc_files_per_sec": best["rc_files"] / max(rc_time, 1e-9)}}
+
+
+def print_summary(summary):
+    print("CryBlend {}, {}".format(summary["version"], ", ".join(
+          "{:d} {}".format(count, name)
+          for name, count in sorted(summary["scene"].items()))))
+    print("Runs [s]: {}".format(" ".join("{:.3f}".format(seconds)
+                                          for seconds in summary["runs"])))
+    print("{:<24} {:>10}".format("stage", "best [s]"))
+    for stage, seconds in sorted(summary["stages"].items(),
+                                 key=lambda item: -item[1]):
+        print("{:<24} {:>10.4f}".format(stage, seconds))
+
+    throughput = summary["throughput"]
+    print("{:.0f} vertices/s, {:.2f} meshes/s, {:.2f} MB of DAE/s without "
+          "RC, {:.2f} RC files/s".format(throughput["vertices_per_sec"],
+                                         throughput["meshes_per_sec"],
+                                         throughput["dae_mb_per_sec"],
+                                         throughput["rc_files_per_sec"]))
+
+    if summary["changed_daes"]:
+        print("DAEs differ between runs: {}".format(
+              ", ".join(summary["changed_daes"])))
+    else:
+        print("DAEs of all runs are the same.")
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sys.exit(main(argv))
@@ -0,0 +1,125 @@
+#------------------------------------------------------------------------------
+# Name:        fake_rc.py
+# Purpose:     Stand-in for the Resource Compiler in benchmarks
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+'''Takes the arguments the exporter gives RC and makes files like RC would.
+
+A DAE gets one file per CryExportNode in it, named after the node and of
+its type, and an MTL with a normal map if /createmtl=1 is given. Other
+files are touched, as the second pass and TIFF conversion would change
+them; TIFFs get a DDS in /targetroot. Paths may start with the 'z:' drive
+Wine gives the root directory, file lists may come in a /listfile.
+
+Latency is set in seconds by the environment:
+    CRYBLEND_FAKE_RC_STARTUP    once per run, RC under Wine starts slowly
+    CRYBLEND_FAKE_RC_FILE_TIME  per file
+'''
+
+import os
+import re
+import sys
+import time
+
+
+STARTUP_TIME = float(os.environ.get("CRYBLEND_FAKE_RC_STARTUP", "0.5"))
+FILE_TIME = float(os.environ.get("CRYBLEND_FAKE_RC_FILE_TIME", "0.05"))
+
+WINE_DRIVE = "z:"
+
+NODE_PATTERN = re.compile(r'<node id="CryExportNode_([^"]*)">.*?'
+                          r'fileType=(\w+)', re.DOTALL)
+
+MTL_TEXT = '''<Material MtlFlags="524544">
+ <SubMaterials>
+  <Material Name="{0}" Shader="Illum">
+   <Textures>
+    <Texture Map="Diffuse" File="textures/{0}_diff.dds"/>
+    <Texture Map="NormalMap" File="textures/{0}_ddn.dds"/>
+   </Textures>
+  </Material>
+ </SubMaterials>
+</Material>
+'''
+
+
+def main(argv):
+    time.sleep(STARTUP_TIME)
+
+    files = [argument for argument in argv if not argument.startswith("/")]
+    options = {}
+    for argument in argv:
+        if argument.startswith("/"):
+            name, _, value = argument[1:].partition("=")
+            options[name] = value
+
+    if "listfile" in options:
+        with open(to_local_path(options["listfile"])) as list_file:
+            files.extend(line.strip() for line in list_file if line.strip())
+
+    for file_name in files:
+        path = to_local_path(file_name)
+        print("   0:00 Processing {}".format(os.path.basename(path)))
+        sys.stdout.flush()
+        time.sleep(FILE_TIME)
+
+        if not os.path.isfile(path):
+            print("   0:00 E: Cannot open {}".format(path))
+            return 1
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".dae":
+            compile_dae(path, options.get("createmtl") == "1")
+        elif extension in (".tif", ".tiff"):
+            convert_texture(path, options.get("targetroot"))
+        else:
+            os.utime(path, None)
+
+    return 0
+
+
+def to_local_path(path):
+    if sys.platform != 'win32' and path.lower().startswith(WINE_DRIVE):
+        return path[len(WINE_DRIVE):]
+
+    return path
+
+
+def compile_dae(path, create_mtl):
+    with open(path) as dae_file:
+        text = dae_file.read()
+
+    directory = os.path.dirname(path)
+    for node_name, file_type in NODE_PATTERN.findall(text):
+        output_path = os.path.join(directory, "{}.{}".format(node_name,
+                                                             file_type))
+        with open(output_path, "w") as output_file:
+            output_file.write("fake {} of {:d} bytes of DAE\n".format(
+                              file_type, len(text)))
+
+        if create_mtl:
+            mtl_path = os.path.join(directory, "{}.mtl".format(node_name))
+            with open(mtl_path, "w") as mtl_file:
+                mtl_file.write(MTL_TEXT.format(node_name))
+
+
+def convert_texture(path, target_root):
+    directory = os.path.dirname(path)
+    if target_root:
+        directory = to_local_path(target_root)
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(directory, stem + ".dds"), "wb") as dds_file:
+        dds_file.write(b"DDS ")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+#------------------------------------------------------------------------------
+# Name:        planar_normals.py
+# Purpose:     Benchmark of planar face normal averaging
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+'''Shows how planar normal averaging scales with face count.
+
+Run from the repository root:
+    blender --background --python benchmarks/planar_normals.py -- \
+        --faces 1000 4000 16000 64000
+
+The plain all-pairs scan the exporter used before is timed next to the
+indexed one for face counts up to --max-scan-faces.
+'''
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from io_export_cryblend import geometry
+
+
+def make_face_normals(face_count, seed=0):
+    '''Hard surface like normals: most faces lie on flat panels sharing
+    one normal, some panels are slightly bent and the rest of the faces
+    point anywhere.'''
+    generator = random.Random(seed)
+    planes = [_random_unit_vector(generator)
+              for _ in range(max(16, face_count // 64))]
+
+    normals = array('f')
+    for _ in range(face_count):
+        chance = generator.random()
+        if chance < 0.7:
+            normal = generator.choice(planes)
+        elif chance < 0.8:
+            x, y, z = generator.choice(planes)
+            normal = _normalized((x + generator.gauss(0.0, 0.01),
+                                  y + generator.gauss(0.0, 0.01),
+                                  z + generator.gauss(0.0, 0.01)))
+        else:
+            normal = _random_unit_vector(generator)
+        normals.extend(normal)
+
+    return normals
+
+
+def plain_scan(face_normals, faces):
+    tolerance = geometry.PLANAR_ANGLE_TOLERANCE
+    face_count = len(face_normals) // 3
+    averaged = {}
+    for index in faces:
+        x, y, z = face_normals[index * 3:index * 3 + 3]
+        nx, ny, nz = x, y, z
+        count = 1
+        for other in range(face_count):
+            ox, oy, oz = face_normals[other * 3:other * 3 + 3]
+            cos = ((x * ox + y * oy + z * oz)
+                   / math.sqrt((x * x + y * y + z * z)
+                               * (ox * ox + oy * oy + oz * oz)))
+            if math.acos(max(-1.0, min(1.0, cos))) < tolerance:
+                nx += ox
+                ny += oy
+                nz += oz
+                count += 1
+        averaged[index] = (nx / count, ny / count, nz / count)
+
+    return averaged
+
+
+def _random_unit_vector(generator):
+    return _normalized((generator.gauss(0.0, 1.0),
+                        generator.gauss(0.0, 1.0),
+                        generator.gauss(0.0, 1.0)))
+
+
+def _normalized(vector):
+    length = math.sqrt(sum(component * component for component in vector))
+    return tuple(component / length for component in vector)
+
+
+def _time(function, *args):
+    start_time = time.time()
+    result = function(*args)
+    return time.time() - start_time, result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--faces", type=int, nargs="+",
+                        default=[1000, 2000, 4000, 8000, 16000, 32000, 64000])
+    parser.add_argument("--max-scan-faces", type=int, default=4000)
+    args = parser.parse_args(argv)
+
+    print("{:>8} {:>12} {:>14} {:>12}".format("faces", "indexed [s]",
+                                              "us per face", "scan [s]"))
+    for face_count in args.faces:
+        face_normals = make_face_normals(face_count)
+        faces = list(range(face_count))
+
+        indexed_time, averaged = _time(geometry.average_planar_normals,
+                                       face_normals, faces)
+        scan_column = "-"
+        if face_count <= args.max_scan_faces:
+            scan_time, expected = _time(plain_scan, face_normals, faces)
+            scan_column = "{:.3f}".format(scan_time)
+            for index in faces:
+                for got, wanted in zip(averaged[index], expected[index]):
+                    assert abs(got - wanted) < 1e-6, index
+
+        print("{:>8} {:>12.3f} {:>14.2f} {:>12}".format(
+            face_count, indexed_time, indexed_time * 1e6 / face_count,
+            scan_column))
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    main(argv)
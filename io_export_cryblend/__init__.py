@@ -54,9 +54,10 @@ if "bpy" in locals():
     imp.reload(export)
     imp.reload(exceptions)
     imp.reload(utils)
+    imp.reload(watch)
 else:
     import bpy
-    from io_export_cryblend import add, export, exceptions, utils
+    from io_export_cryblend import add, export, exceptions, utils, watch
 
 from bpy.props import BoolProperty, EnumProperty, FloatVectorProperty, \
     FloatProperty, IntProperty, StringProperty
@@ -250,6 +251,45 @@ class SelectedToCryExportNodes(bpy.types.Operator):
         layout.label("Confirm...")
 
 
+class SetCryExportNodeLods(bpy.types.Operator):
+    '''Generate $lod meshes for the CryExportNodes of selected objects'''
+    bl_label = "Set LODs"
+    bl_idname = "object.set_cry_export_node_lods"
+    bl_options = {"REGISTER", "UNDO"}
+
+    lod_ratios = StringProperty(
+        name="Triangle Ratios",
+        description="Share of triangles kept in $lod1, $lod2 and so on, separated by spaces. Leave empty to remove the LODs.",
+        default="0.5 0.25 0.125",
+    )
+
+    def execute(self, context):
+        try:
+            ratios = utils.parse_lod_ratios(self.lod_ratios)
+        except ValueError as exception:
+            self.report({"ERROR"}, str(exception))
+            return {"CANCELLED"}
+
+        groups = set()
+        for object_ in bpy.context.selected_objects:
+            for group in object_.users_group:
+                if utils.is_export_node(group.name):
+                    groups.add(group)
+
+        if groups:
+            for group in groups:
+                utils.set_lod_ratios(group, ratios)
+            message = "Set LODs of {:d} Export Nodes".format(len(groups))
+        else:
+            message = "No Export Nodes Selected"
+
+        self.report({"INFO"}, message)
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+
 class ApplyTransforms(bpy.types.Operator):
     '''Click to apply transforms on selected objects.'''
     bl_label = "Apply Transforms"
@@ -1517,17 +1557,100 @@ class Export(bpy.types.Operator, ExportHelper):
     bl_idname = "scene.export_to_game"
     filename_ext = ".dae"
     filter_glob = StringProperty(default="*.dae", options={'HIDDEN'})
+    # the ExportWatcher while the modal operator watches the export nodes
+    _watcher = None
 
     apply_modifiers = BoolProperty(
             name="Apply Modifiers",
             description="Apply all modifiers before exporting.",
             default=True,
             )
+    evaluate_modifiers = BoolProperty(
+            name="Evaluate Modifiers",
+            description="Export the result of the modifiers of exported objects without applying them. Takes precedence over Apply Modifiers.",
+            default=False,
+            )
     donot_merge = BoolProperty(
             name="Do Not Merge Nodes",
             description="Generally a good idea.",
             default=True,
             )
+    deduplicate_geometry = BoolProperty(
+            name="Deduplicate Geometry",
+            description="Merge equal normals, UVs and colors and drop unused vertices to make the DAE smaller.",
+            default=False,
+            )
+    instance_shared_meshes = BoolProperty(
+            name="Instance Shared Meshes",
+            description="Write one geometry for objects sharing a mesh (linked duplicates) instead of one per object.",
+            default=False,
+            )
+    cache_geometry = BoolProperty(
+            name="Cache Geometry",
+            description="Reuse geometries and skins of unchanged meshes from earlier exports of this blend file.",
+            default=False,
+            )
+    geometry_cache_size = IntProperty(
+            name="Cache Size (MB)",
+            description="Oldest cached geometries are removed above this size.",
+            default=512,
+            min=1,
+            )
+    parallel_geometry = BoolProperty(
+            name="Parallel Geometry",
+            description="Write geometries in one process per CPU core. Pays off for many or big meshes.",
+            default=False,
+            )
+    split_export_nodes = BoolProperty(
+            name="One DAE per Export Node",
+            description="Write every export node to its own DAE next to the selected file and run RC on them in parallel. A failing node does not stop the others.",
+            default=False,
+            )
+    incremental_export = BoolProperty(
+            name="Incremental Export",
+            description="Only write the DAEs, run the RC passes and convert the textures whose inputs changed since the last export to this file. What was built is kept in a .build.json file next to it.",
+            default=False,
+            )
+    background_export = BoolProperty(
+            name="Export in Background",
+            description="Keep working while the export runs, its progress is shown in the header. Press Esc to cancel it.",
+            default=False,
+            )
+    watch_changes = BoolProperty(
+            name="Watch and Re-export",
+            description="After the export, keep exporting the export nodes which change, in the background once the edits pause, until Stop Watching. Implies One DAE per Export Node.",
+            default=False,
+            )
+    watch_delay = FloatProperty(
+            name="Watch Delay (s)",
+            description="How long edits have to pause before the changed export nodes are exported again.",
+            default=1.0,
+            min=0.1,
+            )
+    rc_jobs = IntProperty(
+            name="Parallel RC Jobs",
+            description="How many RC processes, DDS conversions, MTL fixes or Incremental Export targets run at the same time.",
+            default=4,
+            min=1,
+            max=64,
+            )
+    rc_cache = BoolProperty(
+            name="Cache RC Output",
+            description="Keep the files RC makes and restore them instead of running RC when a DAE has not changed.",
+            default=False,
+            )
+    rc_cache_directory = StringProperty(
+            name="RC Cache Directory",
+            description="Where RC output is kept, can be shared by several computers. Empty for a temporary directory.",
+            default="",
+            subtype='DIR_PATH',
+            )
+    rc_cache_size = IntProperty(
+            name="RC Cache Size (MB)",
+            description="Least recently used RC output is removed above this size.",
+            default=2048,
+            min=1,
+            )
     do_materials = BoolProperty(
             name="Do Materials",
             description="Create MTL files for materials.",
@@ -1543,6 +1666,11 @@ class Export(bpy.types.Operator, ExportHelper):
             description="Saves TIFF images that are generated during conversion to DDS.",
             default=False,
             )
+    rebuild_textures = BoolProperty(
+            name="Rebuild Textures",
+            description="Convert every texture to DDS, also those which did not change since they were last converted.",
+            default=False,
+            )
     make_chrparams = BoolProperty(
             name="Make CHRPARAMS File",
             description="Create a base CHRPARAMS file for character animations.",
@@ -1588,16 +1716,72 @@ class Export(bpy.types.Operator, ExportHelper):
             description="Select only if you want to profile CryBlend.",
             default=False,
             )
+    exact_floats = BoolProperty(
+            name="Exact Floats",
+            description="Write geometry floats with as many digits as needed to read back the exact values instead of 6 decimals.",
+            default=False,
+            )
+    compact_output = BoolProperty(
+            name="Compact Output",
+            description="Write a smaller DAE: no indentation, no trailing zeros and the precisions below.",
+            default=False,
+            )
+    position_precision = IntProperty(
+            name="Position Decimals",
+            description="Decimals of vertex positions in compact output.",
+            default=6,
+            min=0,
+            max=9,
+            )
+    normal_precision = IntProperty(
+            name="Normal Decimals",
+            description="Decimals of normals in compact output.",
+            default=4,
+            min=0,
+            max=9,
+            )
+    uv_precision = IntProperty(
+            name="UV Decimals",
+            description="Decimals of UVs in compact output.",
+            default=4,
+            min=0,
+            max=9,
+            )
+    color_precision = IntProperty(
+            name="Color Decimals",
+            description="Decimals of vertex colors in compact output.",
+            default=4,
+            min=0,
+            max=9,
+            )
+    per_element_mesh_reading = BoolProperty(
+            name="Per-Element Mesh Reading",
+            description="Read meshes one element at a time instead of in bulk. Slow, use only to check the bulk reader.",
+            default=False,
+            )
 
     class Config:
         def __init__(self, config):
             attributes = (
                 'filepath',
                 'apply_modifiers',
+                'evaluate_modifiers',
                 'donot_merge',
+                'deduplicate_geometry',
+                'instance_shared_meshes',
+                'cache_geometry',
+                'geometry_cache_size',
+                'parallel_geometry',
+                'split_export_nodes',
+                'incremental_export',
+                'rc_jobs',
+                'rc_cache',
+                'rc_cache_directory',
+                'rc_cache_size',
                 'do_materials',
                 'convert_source_image_to_dds',
                 'save_tiff_during_conversion',
+                'rebuild_textures',
                 'make_chrparams',
                 'make_cdf',
                 'include_ik',
@@ -1606,7 +1790,14 @@ class Export(bpy.types.Operator, ExportHelper):
                 'make_layer',
                 'disable_rc',
                 'save_dae',
-                'run_in_profiler'
+                'run_in_profiler',
+                'per_element_mesh_reading',
+                'exact_floats',
+                'compact_output',
+                'position_precision',
+                'normal_precision',
+                'uv_precision',
+                'color_precision'
             )
 
             for attribute in attributes:
@@ -1623,12 +1814,20 @@ class Export(bpy.types.Operator, ExportHelper):
         try:
             config = Export.Config(config=self)
 
+            if self.watch_changes and not self.run_in_profiler:
+                return self.__start_watching(context, config)
+
+            if self.background_export and not self.run_in_profiler:
+                return self.__start_background_export(context, config)
+
             if self.run_in_profiler:
                 import cProfile
                 cProfile.runctx('export.save(config)', {},
                                 {'export': export, 'config': config})
             else:
-                export.save(config)
+                summary = export.save(config)
+                if summary is not None:
+                    self.report({'INFO'}, summary)
 
             self.filepath = '//'
 
@@ -1638,20 +1837,169 @@ class Export(bpy.types.Operator, ExportHelper):
 
         return {'FINISHED'}
 
+    def __start_background_export(self, context, config):
+        self._background_export = export.BackgroundExport(config)
+
+        window_manager = context.window_manager
+        self._timer = window_manager.event_timer_add(
+            export.BACKGROUND_TIMER_STEP, context.window)
+        window_manager.progress_begin(0, 100)
+        window_manager.modal_handler_add(self)
+        self.filepath = '//'
+
+        return {'RUNNING_MODAL'}
+
+    def __start_watching(self, context, config):
+        # a DAE per node, only the changed ones are exported again
+        config.split_export_nodes = True
+        self._config = config
+        self._background_export = export.BackgroundExport(config)
+        context.window_manager.progress_begin(0, 100)
+
+        watch.stop()
+        self._watcher = watch.ExportWatcher(self.watch_delay)
+        self._watcher.start()
+
+        window_manager = context.window_manager
+        self._timer = window_manager.event_timer_add(
+            export.BACKGROUND_TIMER_STEP, context.window)
+        window_manager.modal_handler_add(self)
+        self.filepath = '//'
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if self._watcher is not None:
+            try:
+                return self.__watch(context, event)
+            except:
+                self._watcher.stop()
+                context.window_manager.event_timer_remove(self._timer)
+                raise
+
+        if event.type == 'ESC':
+            self._background_export.cancel()
+        elif event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if self._background_export.step(export.BACKGROUND_TIME_SLICE):
+            self.__show_progress(context)
+            return {'PASS_THROUGH'}
+
+        return self.__finish_background_export(context)
+
+    def __watch(self, context, event):
+        # one export at a time, edits made meanwhile wait for the next
+        if self._background_export is not None and (event.type == 'ESC'
+                                                    or self._watcher.stopped):
+            self._background_export.cancel()
+        elif event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if self._background_export is not None:
+            if self._background_export.step(export.BACKGROUND_TIME_SLICE):
+                self.__show_progress(context)
+                return {'PASS_THROUGH'}
+
+            self.__end_background_export(context)
+            self._background_export = None
+
+        if self._watcher.stopped:
+            context.window_manager.event_timer_remove(self._timer)
+            self.report({'INFO'}, "Stopped watching the export nodes.")
+            return {'FINISHED'}
+
+        node_names = self._watcher.take_changed_nodes()
+        if node_names:
+            cbPrint("Exporting changed {}.".format(", ".join(node_names)))
+            try:
+                self._background_export = export.BackgroundExport(
+                                                    self._config, node_names)
+            except exceptions.CryBlendException as exception:
+                self._watcher.stop()
+                cbPrint(exception.what(), 'error')
+                bpy.ops.screen.display_error('INVOKE_DEFAULT', message=exception.what())
+                return {'PASS_THROUGH'}
+            context.window_manager.progress_begin(0, 100)
+
+        return {'PASS_THROUGH'}
+
+    def __show_progress(self, context):
+        stage, done, total = self._background_export.progress.get_state()
+        text = "CryBlend: {}".format(stage)
+        percent = 0
+        if total:
+            text = "{} {:d}/{:d}".format(text, done, total)
+            percent = 100 * done // total
+
+        context.window_manager.progress_update(percent)
+        info_area = get_info_area(context)
+        if info_area is not None:
+            info_area.header_text_set(text + ", Esc to cancel")
+
+    def __finish_background_export(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        return self.__end_background_export(context)
+
+    def __end_background_export(self, context):
+        context.window_manager.progress_end()
+        info_area = get_info_area(context)
+        if info_area is not None:
+            info_area.header_text_set()
+
+        exception = self._background_export.get_error()
+        if exception is None:
+            summary = self._background_export.get_summary()
+            self.report({'INFO'}, summary or "Export finished.")
+            return {'FINISHED'}
+
+        if isinstance(exception, exceptions.ExportCancelledException):
+            cbPrint(exception.what(), 'warning')
+            self.report({'WARNING'}, exception.what())
+        elif isinstance(exception, exceptions.CryBlendException):
+            cbPrint(exception.what(), 'error')
+            bpy.ops.screen.display_error('INVOKE_DEFAULT', message=exception.what())
+        else:
+            raise exception
+
+        return {'CANCELLED'}
+
     def draw(self, context):
         layout = self.layout
         col = layout.column()
 
         box = col.box()
         box.label("General", icon="WORLD")
+        box.prop(self, "background_export")
+        box.prop(self, "watch_changes")
+        box.prop(self, "watch_delay")
         box.prop(self, "apply_modifiers")
+        box.prop(self, "evaluate_modifiers")
         box.prop(self, "donot_merge")
+        box.prop(self, "deduplicate_geometry")
+        box.prop(self, "exact_floats")
+        box.prop(self, "compact_output")
+        box.prop(self, "position_precision")
+        box.prop(self, "normal_precision")
+        box.prop(self, "uv_precision")
+        box.prop(self, "color_precision")
+        box.prop(self, "instance_shared_meshes")
+        box.prop(self, "cache_geometry")
+        box.prop(self, "geometry_cache_size")
+        box.prop(self, "parallel_geometry")
+        box.prop(self, "split_export_nodes")
+        box.prop(self, "incremental_export")
+        box.prop(self, "rc_jobs")
+        box.prop(self, "rc_cache")
+        box.prop(self, "rc_cache_directory")
+        box.prop(self, "rc_cache_size")
 
         box = col.box()
         box.label("Image and Material", icon="TEXTURE")
         box.prop(self, "do_materials")
         box.prop(self, "convert_source_image_to_dds")
         box.prop(self, "save_tiff_during_conversion")
+        box.prop(self, "rebuild_textures")
 
         box = col.box()
         box.label("Character", icon="ARMATURE_DATA")
@@ -1673,6 +2021,21 @@ class Export(bpy.types.Operator, ExportHelper):
         box.prop(self, "disable_rc")
         box.prop(self, "save_dae")
         box.prop(self, "run_in_profiler")
+        box.prop(self, "per_element_mesh_reading")
+
+
+class StopWatching(bpy.types.Operator):
+    '''Stop exporting the export nodes which change.'''
+    bl_label = "Stop Watching"
+    bl_idname = "scene.stop_watching_export_nodes"
+
+    @classmethod
+    def poll(cls, context):
+        return watch.is_watching()
+
+    def execute(self, context):
+        watch.stop()
+        return {'FINISHED'}
 
 
 class ErrorHandler(bpy.types.Operator):
@@ -1702,6 +2065,15 @@ def multiline_label(col, text):
         row = col.split()
         row.label(line)
 
+
+def get_info_area(context):
+    # the header of the info editor is Blender's status bar
+    for area in context.screen.areas:
+        if area.type == 'INFO':
+            return area
+
+    return None
+
 #------------------------------------------------------------------------------
 # CryBlend Tab
 #------------------------------------------------------------------------------
@@ -1736,6 +2108,7 @@ class ExportUtilitiesPanel(View3DPanel, Panel):
         row = col.row(align=True)
         row.operator("object.add_cry_export_node", text="Add ExportNode")
         col.operator("object.selected_to_cry_export_nodes", text="ExportNodes from Objects")
+        col.operator("object.set_cry_export_node_lods", text="Set ExportNode LODs")
         col.separator()
         col.operator("object.apply_transforms", text="Apply All Transforms")
 
@@ -1862,6 +2235,7 @@ class CryBlendMainMenu(bpy.types.Menu):
         # layout.operator("open_donate.wp", icon='FORCE_DRAG')
         layout.operator("object.add_cry_export_node", text="Add ExportNode", icon="GROUP")
         layout.operator("object.selected_to_cry_export_nodes", text="ExportNodes from Objects")
+        layout.operator("object.set_cry_export_node_lods", text="Set ExportNode LODs")
         layout.separator()
         layout.operator("material.set_material_names", text="Do Material Convention", icon="MATERIAL")
         layout.operator("material.remove_cry_blend_properties", text="Undo Material Convention")
@@ -1888,6 +2262,7 @@ class CryBlendMainMenu(bpy.types.Menu):
         layout.separator()
         layout.separator()
         layout.operator("scene.export_to_game", icon="GAME")
+        layout.operator("scene.stop_watching_export_nodes", icon="CANCEL")
 
 
 class AddPhysicsProxyMenu(bpy.types.Menu):
@@ -2120,6 +2495,7 @@ def get_classes_to_register():
 
         AddCryExportNode,
         SelectedToCryExportNodes,
+        SetCryExportNodeLods,
         SetMaterialNames,
         RemoveCryBlendProperties,
         AddRootBone,
@@ -2181,6 +2557,7 @@ def get_classes_to_register():
         RemoveBoneGeometry,
 
         Export,
+        StopWatching,
         ErrorHandler,
 
         ExportUtilitiesPanel,
@@ -2241,6 +2618,7 @@ def unregister():
     # you guys already know this but for my reference,
     # unregister your classes or when you do new scene
     # your script wont import other modules properly.
+    watch.stop()
     for classToRegister in get_classes_to_register():
         bpy.utils.unregister_class(classToRegister)
         wm = bpy.context.window_manager
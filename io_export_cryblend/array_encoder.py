@@ -0,0 +1,118 @@
+#------------------------------------------------------------------------------
+# Name:        array_encoder.py
+# Purpose:     Fast conversion of number and name arrays to COLLADA text
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from array import array
+import re
+import struct
+
+
+FLOAT_TYPES = {"float", "float4x4"}
+INT_TYPES = {"int", "bool"}
+
+# values formatted by one '%' operation, big enough to make the per
+# call overhead vanish, small enough to keep the tuples cheap
+BATCH_SIZE = 4096
+
+# values encoded at a time by iter_array_chunks(), bounds the memory of
+# the text of one array
+CHUNK_SIZE = 16 * BATCH_SIZE
+
+DEFAULT_PRECISION = 6
+
+
+def encode_array(type_, values, precision=DEFAULT_PRECISION,
+                 round_trip=False, trim_zeros=False, separator=" "):
+    '''Returns the text of a <type__array> element.'''
+    if type_ in FLOAT_TYPES:
+        return encode_floats(values, precision, round_trip, trim_zeros,
+                             separator)
+    if type_ in INT_TYPES:
+        return encode_ints(values, separator)
+
+    return encode_names(values, separator)
+
+
+def iter_array_chunks(type_, values, precision=DEFAULT_PRECISION,
+                      round_trip=False, trim_zeros=False, separator=" ",
+                      chunk_size=CHUNK_SIZE):
+    '''Yields the text of encode_array() in pieces of 'chunk_size' values,
+    separators included.
+    '''
+    for start in range(0, len(values), chunk_size):
+        text = encode_array(type_, values[start:start + chunk_size],
+                            precision, round_trip, trim_zeros, separator)
+        yield text if start == 0 else separator + text
+
+
+def encode_floats(values, precision=DEFAULT_PRECISION, round_trip=False,
+                  trim_zeros=False, separator=" "):
+    '''Fixed 'precision' decimals like "%.6f", or with 'round_trip' the
+    shortest text that reads back to exactly the same value. 'trim_zeros'
+    drops zeros at the end of the decimals, 1.500000 is written as 1.5.
+    '''
+    if round_trip:
+        if isinstance(values, array) and values.typecode == 'f':
+            return separator.join(map(_shortest_float32, values))
+        return separator.join(map(repr, map(float, values)))
+
+    text = _encode_batched(values, "%.{:d}f".format(precision), separator)
+    if trim_zeros and precision > 0:
+        text = _TRAILING_ZEROS.sub("", text)
+
+    return text
+
+
+def encode_ints(values, separator=" "):
+    return separator.join(map(str, values))
+
+
+def encode_names(values, separator=" "):
+    return separator.join(values)
+
+
+def _encode_batched(values, value_format, separator):
+    length = len(values)
+    if length == 0:
+        return ""
+
+    batch_size = min(length, BATCH_SIZE)
+    batch_format = separator.join((value_format,) * batch_size)
+    parts = []
+    for start in range(0, length - batch_size + 1, batch_size):
+        parts.append(batch_format % tuple(values[start:start + batch_size]))
+
+    rest = length % batch_size
+    if rest:
+        rest_format = separator.join((value_format,) * rest)
+        parts.append(rest_format % tuple(values[length - rest:]))
+
+    return separator.join(parts)
+
+
+# zeros, and the point if nothing is left behind it, before a separator
+_TRAILING_ZEROS = re.compile(r"\.?0+(?=\s|$)")
+
+_FLOAT32 = struct.Struct('<f')
+
+
+def _shortest_float32(value):
+    # repr() would print the double the float was widened to,
+    # 0.1 in a float array would come out as 0.10000000149011612
+    packed = _FLOAT32.pack(value)
+    for digits in range(6, 9):
+        text = "%.*g" % (digits, value)
+        if _FLOAT32.pack(float(text)) == packed:
+            return text
+
+    return "%.9g" % value
@@ -0,0 +1,277 @@
+#------------------------------------------------------------------------------
+# Name:        build_graph.py
+# Purpose:     Runs the steps of an export which are out of date, in the
+#              order of their dependencies
+#
+# Author:      CryBlend contributors
+#
+# Created:     17/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from io_export_cryblend import cache
+from io_export_cryblend.outPipe import cbPrint
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
+import os
+import threading
+
+
+MANIFEST_EXTENSION = ".build.json"
+
+# seconds between two looks at the cancel event while targets run
+POLL_INTERVAL = 0.05
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+UP_TO_DATE = 'UP_TO_DATE'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+SKIPPED = 'SKIPPED'
+CANCELLED = 'CANCELLED'
+
+DONE_STATES = {UP_TO_DATE, SUCCEEDED}
+FINISHED_STATES = {UP_TO_DATE, SUCCEEDED, FAILED, SKIPPED, CANCELLED}
+
+
+class BuildTarget:
+    '''One step of a build. 'action' makes the files in 'outputs' and
+    raises if it can not. 'inputs' are the strings, numbers and buffers
+    it depends on besides the targets in 'depends_on'. A local target runs
+    on the thread which runs the build, e.g. because it uses Blender data.
+    A forced target is built even if it is up to date.
+    '''
+
+    def __init__(self, name, inputs, outputs, action, depends_on=(),
+                 local=False, force=False):
+        self.name = name
+        self.outputs = list(outputs)
+        self.action = action
+        self.depends_on = list(depends_on)
+        self.local = local
+        self.force = force
+        # the fingerprint of the target covers those of its dependencies
+        self.key = cache.hash_items(name, inputs,
+                                    [target.key for target in depends_on])
+        self.stale = False
+        self.state = PENDING
+        self.error = None
+
+
+class BuildGraph:
+    '''Targets of an export and the keys they had when they were last built,
+    kept in the manifest at 'manifest_path'. A target is stale if its key
+    changed, one of its outputs is missing or a target it depends on is
+    stale. Targets without outputs only run when they are stale themselves
+    or a stale target needs them.
+    '''
+
+    def __init__(self, manifest_path):
+        self.__manifest_path = manifest_path
+        self.__targets = []
+        self.__built_keys = _read_manifest(manifest_path)
+        self.__lock = threading.Lock()
+        # stale targets are found once, before the first of them is built
+        self.__checked = False
+
+    @property
+    def targets(self):
+        return list(self.__targets)
+
+    def add(self, name, inputs, outputs, action, depends_on=(), local=False,
+            force=False):
+        '''Adds a target, the targets it depends on have to be added
+        first.
+        '''
+        target = BuildTarget(name, inputs, outputs, action, depends_on,
+                             local, force)
+        self.__targets.append(target)
+        return target
+
+    def get_stale_targets(self):
+        self.__check()
+        return [target for target in self.__targets if target.stale]
+
+    def run(self, max_jobs, cancel_event=None, on_finished=None,
+            targets=None):
+        '''Runs the stale ones of 'targets', all pending targets if it is
+        None, with up to 'max_jobs' at a time and saves the manifest.
+        Targets they depend on have to be finished before. 'on_finished'
+        is called with every target which ran.
+        '''
+        self.__check()
+        if targets is None:
+            targets = self.__targets
+        pending = [target for target in targets if target.state == PENDING]
+        for target in pending:
+            if not target.stale:
+                target.state = UP_TO_DATE
+        pending = [target for target in pending if target.state == PENDING]
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_jobs)) as executor:
+            while pending or running:
+                if cancel_event is not None and cancel_event.is_set():
+                    for target in pending:
+                        target.state = CANCELLED
+                    del pending[:]
+                    for future in running:
+                        future.cancel()
+
+                started = self.__start(pending, running, executor,
+                                       on_finished)
+                if running:
+                    done, _ = wait(list(running), POLL_INTERVAL,
+                                   FIRST_COMPLETED)
+                    for future in done:
+                        self.__finish(running.pop(future), future,
+                                      on_finished)
+
+                # the rest waits for targets which are not part of this run
+                elif not started:
+                    for target in pending:
+                        target.state = SKIPPED
+                    del pending[:]
+
+        self.__save_manifest()
+
+    def __start(self, pending, running, executor, on_finished):
+        '''Starts the targets which can start, returns whether there were
+        any.
+        '''
+        started = False
+        for target in list(pending):
+            states = [dependency.state for dependency in target.depends_on]
+            if any(state in FINISHED_STATES and state not in DONE_STATES
+                   for state in states):
+                target.state = SKIPPED
+                pending.remove(target)
+                started = True
+
+            elif all(state in DONE_STATES for state in states):
+                pending.remove(target)
+                target.state = RUNNING
+                started = True
+                if target.local:
+                    self.__run_local(target, on_finished)
+                else:
+                    running[executor.submit(target.action)] = target
+
+        return started
+
+    def __run_local(self, target, on_finished):
+        try:
+            target.action()
+            self.__set_built(target)
+        except Exception as exception:
+            self.__set_failed(target, exception)
+
+        if on_finished is not None:
+            on_finished(target)
+
+    def __finish(self, target, future, on_finished):
+        if future.cancelled():
+            target.state = CANCELLED
+        elif future.exception() is not None:
+            self.__set_failed(target, future.exception())
+        else:
+            self.__set_built(target)
+
+        if on_finished is not None:
+            on_finished(target)
+
+    def __set_built(self, target):
+        target.state = SUCCEEDED
+        with self.__lock:
+            self.__built_keys[target.name] = target.key
+
+    def __set_failed(self, target, exception):
+        target.state = FAILED
+        target.error = exception
+        with self.__lock:
+            self.__built_keys.pop(target.name, None)
+
+    def __check(self):
+        if self.__checked:
+            return
+        self.__checked = True
+
+        for target in self.__targets:
+            target.stale = (
+                target.force
+                or self.__built_keys.get(target.name) != target.key
+                or not all(os.path.exists(path) for path in target.outputs))
+
+        # until nothing changes: stale dependencies make a target stale,
+        # stale targets need the targets they depend on which keep nothing
+        changed = True
+        while changed:
+            changed = False
+            for target in self.__targets:
+                if not target.stale and any(dependency.stale for dependency
+                                            in target.depends_on):
+                    target.stale = changed = True
+            for target in reversed(self.__targets):
+                if target.stale:
+                    for dependency in target.depends_on:
+                        if not dependency.stale and not dependency.outputs:
+                            dependency.stale = changed = True
+
+    def __save_manifest(self):
+        # an export of some nodes must keep the entries of the others, so
+        # only the targets of this graph are replaced or dropped
+        built_keys = _read_manifest(self.__manifest_path)
+        with self.__lock:
+            for target in self.__targets:
+                key = self.__built_keys.get(target.name)
+                if key is None:
+                    built_keys.pop(target.name, None)
+                else:
+                    built_keys[target.name] = key
+
+        manifest = {"targets": built_keys}
+        try:
+            with open(self.__manifest_path, "w") as manifest_file:
+                json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+                manifest_file.write("\n")
+
+        except (IOError, OSError) as exception:
+            cbPrint("Can not write build manifest {!r}: {!s}".format(
+                    self.__manifest_path, exception), 'warning')
+
+    def print_summary(self):
+        counts = {}
+        for target in self.__targets:
+            counts[target.state] = counts.get(target.state, 0) + 1
+
+        cbPrint("Build: {:d} targets, {}".format(
+                len(self.__targets),
+                ", ".join("{:d} {}".format(count, state.lower().replace(
+                                                                "_", " "))
+                          for state, count in sorted(counts.items()))))
+
+        for target in self.__targets:
+            if target.state == FAILED:
+                cbPrint("Building {!r} failed: {!s}".format(target.name,
+                                                             target.error),
+                        'error')
+            elif target.state == SKIPPED:
+                cbPrint("Building {!r} skipped, a target before it "
+                        "failed.".format(target.name), 'warning')
+
+
+def get_manifest_path(filepath):
+    return os.path.splitext(filepath)[0] + MANIFEST_EXTENSION
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path) as manifest_file:
+            return dict(json.load(manifest_file)["targets"])
+
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return {}
@@ -0,0 +1,233 @@
+#------------------------------------------------------------------------------
+# Name:        cache.py
+# Purpose:     Size bounded on-disk caches
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from io_export_cryblend.outPipe import cbPrint
+import hashlib
+import io
+import os
+import re
+import tempfile
+import zipfile
+
+
+class FileCache:
+    '''Stores one file per key in 'directory'. Once the files take more than
+    'max_size' bytes the least recently used ones are removed by trim().
+    Reading an entry counts as using it.
+    '''
+
+    def __init__(self, directory, max_size):
+        self.__directory = directory
+        self.__max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    def get(self, key):
+        path = self.__get_path(key)
+        try:
+            with open(path, 'rb') as entry:
+                data = entry.read()
+            os.utime(path, None)
+
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        # write next to the entry and rename, readers never see half files
+        descriptor, tmp_path = tempfile.mkstemp(dir=self.__directory,
+                                                suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, 'wb') as entry:
+                entry.write(data)
+            os.replace(tmp_path, self.__get_path(key))
+
+        except (IOError, OSError) as exception:
+            cbPrint("Can not write cache entry {!r}: {!s}".format(
+                    key, exception), 'warning')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def trim(self):
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.__directory):
+            path = os.path.join(self.__directory, file_name)
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            entries.append((status.st_mtime, status.st_size, path))
+            total_size += status.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total_size <= self.__max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+    def __get_path(self, key):
+        return os.path.join(self.__directory, key)
+
+
+class RcOutputCache:
+    '''Keeps the files RC made from a DAE in a FileCache, so an unchanged
+    DAE does not have to go through RC again. 'directory' can be shared,
+    e.g. on a network drive, so entries are plain zip archives and only
+    hold files, never code or paths.
+    '''
+
+    def __init__(self, directory, max_size):
+        self.__files = FileCache(directory, max_size)
+
+    @property
+    def hits(self):
+        return self.__files.hits
+
+    @property
+    def misses(self):
+        return self.__files.misses
+
+    def get_key(self, dae_path, rc_path, params):
+        return hash_items("rc-zip",
+                          hash_dae(dae_path),
+                          *(get_program_stamp(rc_path) + (params,)))
+
+    def restore(self, key, directory):
+        '''Writes the files stored under 'key' to 'directory'. Returns their
+        names, None if there are none.
+        '''
+        data = self.__files.get(key)
+        if data is None:
+            return None
+
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                file_names = archive.namelist()
+                # a name with a directory in it would leave 'directory'
+                if not all(_is_plain_file_name(file_name)
+                           for file_name in file_names):
+                    cbPrint("Ignoring RC cache entry {!r}, it has paths in "
+                            "it.".format(key), 'warning')
+                    return None
+                outputs = [(file_name, archive.read(file_name))
+                           for file_name in file_names]
+
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, KeyError) as \
+                exception:
+            cbPrint("Ignoring RC cache entry {!r}: {!s}".format(
+                    key, exception), 'warning')
+            return None
+
+        for file_name, contents in outputs:
+            with open(os.path.join(directory, file_name), 'wb') as output:
+                output.write(contents)
+
+        return sorted(file_names)
+
+    def store(self, key, directory, file_names):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for file_name in file_names:
+                archive.write(os.path.join(directory, file_name), file_name)
+
+        self.__files.put(key, data.getvalue())
+
+    def trim(self):
+        self.__files.trim()
+
+
+# read for the header of a DAE, it is in the first lines
+DAE_HEADER_SIZE = 64 * 1024
+DAE_BLOCK_SIZE = 1024 * 1024
+
+# time stamps, which change with every export
+_DAE_TIMES = re.compile(br"<(created|modified)>[^<]*</\1>")
+
+
+def _is_plain_file_name(file_name):
+    return (os.path.basename(file_name) == file_name
+            and file_name not in ("", os.curdir, os.pardir)
+            and "\\" not in file_name and ":" not in file_name)
+
+
+def hash_dae(path):
+    '''Returns a hex digest of the DAE at 'path', leaving out the times.'''
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as dae:
+        hasher.update(remove_dae_times(dae.read(DAE_HEADER_SIZE)))
+        for block in iter(lambda: dae.read(DAE_BLOCK_SIZE), b""):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+
+def remove_dae_times(data):
+    return _DAE_TIMES.sub(b"", data)
+
+
+def hash_file(path):
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(DAE_BLOCK_SIZE), b""):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+
+def get_program_stamp(path):
+    '''The name, size and time stamp of the program at 'path', they stand
+    for its version.
+    '''
+    status = os.stat(path)
+    return (os.path.basename(path), status.st_size, status.st_mtime)
+
+
+def hash_items(*items):
+    '''Returns a hex digest of strings, numbers and buffers.'''
+    hasher = hashlib.sha1()
+    for item in items:
+        update_hash(hasher, item)
+
+    return hasher.hexdigest()
+
+
+def update_hash(hasher, item):
+    if isinstance(item, str):
+        data = item.encode('utf-8')
+    elif isinstance(item, (bytes, bytearray)):
+        data = bytes(item)
+    elif hasattr(item, 'tobytes'):
+        data = item.tobytes()
+    else:
+        data = repr(item).encode('utf-8')
+
+    # the length keeps ("ab", "c") and ("a", "bc") apart
+    hasher.update(str(len(data)).encode('ascii'))
+    hasher.update(b':')
+    hasher.update(data)
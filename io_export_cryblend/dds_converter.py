@@ -15,56 +15,222 @@
 if "bpy" in locals():
     import imp
     imp.reload(utils)
+    imp.reload(exceptions)
+    imp.reload(cache)
 else:
     import bpy
-    from io_export_cryblend import utils
+    from io_export_cryblend import utils, exceptions, cache
 
 from io_export_cryblend.outPipe import cbPrint
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import json
 import os
 import shutil
 import threading
 import tempfile
 
 
+# seconds for callers to wait on a DdsConversion between other work
+POLL_INTERVAL = 0.05
+
+TEXTURE_MANIFEST_EXTENSION = ".textures.json"
+
+
 class DdsConverterRunner:
-    def __init__(self, rc_exe):
+    def __init__(self, rc_exe, max_jobs=1, texture_cache=None):
         self.__rc_exe = rc_exe
+        self.__max_jobs = max_jobs
+        self.__texture_cache = texture_cache
 
     def start_conversion(self, images_to_convert, save_tiff):
-        converter = _DdsConverter(self.__rc_exe)
-
-        conversion_thread = threading.Thread(
-            target=converter, args=(images_to_convert, save_tiff)
-        )
-        conversion_thread.start()
-
-        return conversion_thread
+        '''Saves the TIFFs for RC on this thread, as they are made from
+        Blender data, and returns a DdsConversion which converts them with
+        up to 'max_jobs' RC processes at a time. Images which are up to
+        date in the TextureCache are left out.
+        '''
+        converter = _DdsConverter(self.__rc_exe, self.__max_jobs,
+                                  self.__texture_cache)
+
+        return converter(images_to_convert, save_tiff)
+
+
+class TextureCache:
+    '''What every DDS was converted from, kept in the manifest at
+    'manifest_path': the hash of the source image, the RC parameters and
+    whether the green channel was inverted. A DDS is up to date while it
+    exists and these did not change. With 'force' none is.
+    '''
+
+    def __init__(self, manifest_path, force=False):
+        self.__manifest_path = manifest_path
+        self.__force = force
+        self.__entries = _read_texture_manifest(manifest_path)
+        self.__lock = threading.Lock()
+        self.skipped = 0
+
+    def get_entry(self, image, dds_path):
+        '''Returns the entry 'image' makes for the DDS at 'dds_path', None
+        if its pixels are not those of its source file.
+        '''
+        if is_changed_from_file(image):
+            return None
+
+        source_path = utils.get_absolute_path(image.filepath)
+        try:
+            source_hash = cache.hash_file(source_path)
+        except (IOError, OSError):
+            return None
+
+        return {"source": source_path,
+                "source_hash": source_hash,
+                "rc_params": get_rc_params(dds_path),
+                "invert_green": "_ddn" in image.name}
+
+    def is_up_to_date(self, dds_path, entry):
+        if self.__force or entry is None or not os.path.isfile(dds_path):
+            return False
+
+        with self.__lock:
+            return self.__entries.get(dds_path) == entry
+
+    def put(self, dds_path, entry):
+        with self.__lock:
+            if entry is None:
+                self.__entries.pop(dds_path, None)
+            else:
+                self.__entries[dds_path] = entry
+
+    def remove_stale_entries(self):
+        '''Drops the entries of DDS files or sources which are gone,
+        returns how many there were.
+        '''
+        with self.__lock:
+            stale_paths = [dds_path for dds_path, entry
+                           in self.__entries.items()
+                           if not os.path.isfile(dds_path)
+                           or not os.path.isfile(entry["source"])]
+            for dds_path in stale_paths:
+                del self.__entries[dds_path]
+
+        return len(stale_paths)
+
+    def save(self):
+        with self.__lock:
+            manifest = {"textures": dict(self.__entries)}
+        try:
+            with open(self.__manifest_path, "w") as manifest_file:
+                json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+                manifest_file.write("\n")
+
+        except (IOError, OSError) as exception:
+            cbPrint("Can not write texture manifest {!r}: {!s}".format(
+                    self.__manifest_path, exception), 'warning')
+
+
+class DdsConversion:
+    '''The DDS conversions of some images, running in a pool of worker
+    threads. 'jobs' are pairs of an image name and the function which
+    converts it, 'on_finished' is called once all of them have ended.
+    '''
+
+    def __init__(self, max_jobs, jobs, on_finished):
+        self.__on_finished = on_finished
+        self.__lock = threading.Lock()
+        self.__remaining = len(jobs)
+        self.__finished = threading.Event()
+        # image name: future of its conversion
+        self.__futures = {}
+
+        if not jobs:
+            self.__finish()
+            return
+
+        executor = ThreadPoolExecutor(max_workers=max(1, max_jobs))
+        for image_name, convert in jobs:
+            self.__futures[image_name] = executor.submit(convert)
+        for future in list(self.__futures.values()):
+            future.add_done_callback(self.__on_job_done)
+        # the conversions queued so far still run
+        executor.shutdown(wait=False)
+
+    def __on_job_done(self, future):
+        with self.__lock:
+            self.__remaining -= 1
+            if self.__remaining:
+                return
+
+        self.__finish()
+
+    def __finish(self):
+        try:
+            self.__on_finished()
+        except Exception as exception:
+            cbPrint("Cleaning up after DDS conversion failed: {!s}".format(
+                    exception), 'error')
+        finally:
+            self.__finished.set()
+
+    def done(self):
+        return self.__finished.is_set()
+
+    def wait(self, timeout=None):
+        '''Waits for all conversions to end, returns False if 'timeout'
+        seconds passed before.
+        '''
+        return self.__finished.wait(timeout)
+
+    def cancel(self):
+        '''Drops the conversions which have not started yet.'''
+        for future in self.__futures.values():
+            future.cancel()
+
+    def get_results(self):
+        '''Returns the image names of the conversions which ended, with
+        None for those which made a DDS and the exception of the others.
+        '''
+        results = {}
+        for image_name, future in self.__futures.items():
+            if not future.done():
+                continue
+            if future.cancelled():
+                results[image_name] = exceptions.ExportCancelledException()
+            else:
+                results[image_name] = future.exception()
+
+        return results
 
 
 class _DdsConverter:
-    def __init__(self, rc_exe):
+    def __init__(self, rc_exe, max_jobs=1, texture_cache=None):
         self.__rc_exe = rc_exe
+        self.__max_jobs = max_jobs
+        self.__texture_cache = texture_cache
         self.__tmp_images = {}
         self.__tmp_dir = tempfile.mkdtemp("CryBlend")
 
     def __call__(self, images_to_convert, save_tiff):
-
+        jobs = []
         for image in images_to_convert:
-            rc_params = self.__get_rc_params(image.filepath)
-            tiff_image_path = self.__get_temp_tiff_image_path(image)
+            dds_path = utils.get_absolute_path(
+                    utils.get_path_with_new_extension(image.filepath, "dds"))
+            entry = None
+            if self.__texture_cache is not None:
+                entry = self.__texture_cache.get_entry(image, dds_path)
+                if self.__texture_cache.is_up_to_date(dds_path, entry):
+                    cbPrint("Texture {!r} is up to date.".format(image.name),
+                            'debug')
+                    self.__texture_cache.skipped += 1
+                    continue
 
-            tiff_image_for_rc = utils.get_absolute_path_for_rc(tiff_image_path)
+            tiff_image_path = self.__get_temp_tiff_image_path(image)
 
             try:
                 create_normal_texture()
             except:
                 cbPrint("Failed to invert green channel")
 
-            rc_process = utils.run_rc(self.__rc_exe,
-                                      tiff_image_for_rc,
-                                      rc_params)
-
-            # re-save the original image after running the RC to
+            # re-save the original image after saving the TIFF to
             # prevent the original one from getting lost
             try:
                 if ("_ddn" in image.name):
@@ -72,8 +238,26 @@ class _DdsConverter:
             except:
                 cbPrint("Failed to invert green channel")
 
-            rc_process.wait()
+            # the workers leave Blender data alone, paths are resolved here
+            jobs.append((image.name, functools.partial(
+                    self.__convert, utils.get_absolute_path(tiff_image_path),
+                    utils.get_absolute_path(image.filepath), dds_path,
+                    entry)))
+
+        return DdsConversion(self.__max_jobs, jobs,
+                             functools.partial(self.__finish, save_tiff))
+
+    def __convert(self, image_path, destination_path, dds_path, entry):
+        if self.__texture_cache is None:
+            convert_to_dds(self.__rc_exe, image_path, destination_path)
+            return
+
+        # a DDS which failed may be half written
+        self.__texture_cache.put(dds_path, None)
+        convert_to_dds(self.__rc_exe, image_path, destination_path)
+        self.__texture_cache.put(dds_path, entry)
 
+    def __finish(self, save_tiff):
         if save_tiff:
             self.__save_tiffs()
 
@@ -89,16 +273,6 @@ class _DdsConverter:
             temp_normal_image.save_render(filepath=new_normal_image_path)
             bpy.data.images.remove(temp_normal_image)
 
-    def __get_rc_params(self, destination_path):
-        rc_params = ["/verbose", "/threads=cores", "/userdialog=1", "/refresh"]
-
-        image_directory = os.path.dirname(utils.get_absolute_path_for_rc(
-                destination_path))
-
-        rc_params.append("/targetroot={!s}".format(image_directory))
-
-        return rc_params
-
     def __invert_green_channel(self, image):
         override = {'edit_image': bpy.data.images[image.name]}
         bpy.ops.image.invert(override, invert_g=True)
@@ -127,15 +301,7 @@ class _DdsConverter:
         return tmp_file_path
 
     def __save_as_tiff(self, image, tiff_file_path):
-        originalPath = image.filepath
-
-        try:
-            image.filepath_raw = tiff_file_path
-            image.file_format = 'TIFF'
-            image.save()
-
-        finally:
-            image.filepath = originalPath
+        save_as_tiff(image, tiff_file_path)
 
     def __save_tiffs(self):
         for tmp_image, dest_image in self.__tmp_images.items():
@@ -154,3 +320,60 @@ class _DdsConverter:
 
         os.removedirs(self.__tmp_dir)
         self.__tmp_images.clear()
+
+
+def is_changed_from_file(image):
+    '''Whether the pixels of 'image', which the TIFF is saved from, may
+    differ from its file: it has unsaved edits or is packed.
+    '''
+    return image.is_dirty or image.packed_file is not None
+
+
+def get_texture_manifest_path(filepath):
+    return os.path.splitext(filepath)[0] + TEXTURE_MANIFEST_EXTENSION
+
+
+def _read_texture_manifest(manifest_path):
+    try:
+        with open(manifest_path) as manifest_file:
+            return dict(json.load(manifest_file)["textures"])
+
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def get_rc_params(destination_path):
+    rc_params = ["/verbose", "/threads=cores", "/userdialog=1", "/refresh"]
+
+    image_directory = os.path.dirname(utils.get_absolute_path_for_rc(
+            destination_path))
+
+    rc_params.append("/targetroot={!s}".format(image_directory))
+
+    return rc_params
+
+
+def save_as_tiff(image, tiff_file_path):
+    originalPath = image.filepath
+
+    try:
+        image.filepath_raw = tiff_file_path
+        image.file_format = 'TIFF'
+        image.save()
+
+    finally:
+        image.filepath = originalPath
+
+
+def convert_to_dds(rc_exe, image_path, destination_path):
+    '''Runs RC on the image at 'image_path' and waits for it, the DDS is
+    put next to 'destination_path'. Does not use Blender data.
+    '''
+    rc_process = utils.run_rc(rc_exe,
+                              utils.get_absolute_path_for_rc(image_path),
+                              get_rc_params(destination_path))
+    return_code = rc_process.wait()
+    if return_code != 0:
+        raise exceptions.CryBlendException(
+                "RC failed to convert {!r} to DDS, exit code {:d}.".format(
+                    os.path.basename(image_path), return_code))
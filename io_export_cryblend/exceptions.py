@@ -49,3 +49,10 @@ Usually located in 'CryEngine\\Bin32\\rc\\rc.exe'
 """
 
         CryBlendException.__init__(self, message)
+
+
+class ExportCancelledException(CryBlendException):
+    def __init__(self):
+        message = "Export was cancelled."
+
+        CryBlendException.__init__(self, message)
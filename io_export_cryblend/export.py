@@ -33,9 +33,18 @@ if "bpy" in locals():
     import imp
     imp.reload(utils)
     imp.reload(exceptions)
+    imp.reload(geometry)
+    imp.reload(cache)
+    imp.reload(geometry_writer)
+    imp.reload(rc_scheduler)
+    imp.reload(export_log)
+    imp.reload(build_graph)
+    imp.reload(dds_converter)
 else:
     import bpy
-    from io_export_cryblend import utils, exceptions
+    from io_export_cryblend import utils, exceptions, geometry, cache, \
+        geometry_writer, rc_scheduler, export_log, build_graph, \
+        dds_converter
 
 from io_export_cryblend.dds_converter import DdsConverterRunner
 from io_export_cryblend.outPipe import cbPrint
@@ -44,13 +53,20 @@ from io_export_cryblend.utils import join
 from bpy_extras.io_utils import ExportHelper
 from datetime import datetime
 from mathutils import Matrix, Vector
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from time import clock
 from xml.dom.minidom import Document, Element, parse, parseString
 import bmesh
 import copy
+import functools
+import hashlib
 import os
-import threading
+import pickle
+import shutil
 import subprocess
+import tempfile
+import threading
 import time
 import xml.dom.minidom
 
@@ -62,14 +78,44 @@ AXES = {
 }
 
 
+# big enough to write the long number arrays in few system calls
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# export nodes whose files get the second RC pass
+RC_SECOND_PASS_TYPES = {"cgf", "cga", "chr", "skin"}
+
+# files RC makes, which the RC cache keeps
+RC_OUTPUT_EXTENSIONS = {".cgf", ".cgfm", ".cga", ".cgam", ".chr", ".chrm",
+                        ".skin", ".skinm", ".caf", ".anm", ".mtl"}
+
+# seconds, some file systems store modification times this coarsely
+MTIME_RESOLUTION = 2.0
+
+# longer RC command lines get their files from a list file, cmd.exe takes
+# 8191 characters
+MAX_COMMAND_LENGTH = 8000
+
+# build targets which save images as TIFFs, they have to run on the thread
+# which has the Blender data
+TIFF_TARGET_PREFIX = "tiff:"
+
+# seconds a background export works with Blender data per timer event,
+# and between its timer events
+BACKGROUND_TIME_SLICE = 0.05
+BACKGROUND_TIMER_STEP = 0.1
+
+# the background exports whose steps still read Blender data
+_exports_in_steps = []
+
 # replace minidom's function with ours
 xml.dom.minidom.Element.writexml = utils.fix_write_xml
 
 
 class CrytekDaeExporter:
-    def __init__(self, config):
+    def __init__(self, config, progress=None):
         self.__config = config
         self.__doc = Document()
+        self.__progress = progress or ExportProgress()
 
         # If you have all your textures in 'Texture', then path should be like:
         # Textures/some/path
@@ -82,49 +128,503 @@ class CrytekDaeExporter:
                                             self.__textures_parent_directory),
                 'debug')
 
+        self.__fragment_cache = None
+        if config.cache_geometry:
+            self.__fragment_cache = cache.FileCache(
+                                    utils.get_cache_directory("fragments"),
+                                    config.geometry_cache_size * 1024 * 1024)
+
+        self.__number_format = get_number_format(config)
+        self.__indent = get_indent(config)
+        # objects which use the geometry of another object
+        self.__geometry_ids = {}
+        # object name: geometry ids of its generated LODs
+        self.__lod_geometry_ids = {}
+        # kind: FileCache of MeshData, made when first needed
+        self.__mesh_caches = {}
+        # geometries are left to write_exported()
+        self.__defer_geometry = False
+        # set by export_in_steps() for write_exported()
+        self.__filepath = None
+        self.__recorded_daes = []
+        self.__dae_nodes = {}
+        self.__failed_nodes = []
+        self.__node_count = 0
+        self.__layer = None
+        self.__rc_cache = None
+        # names of the images converted by the build graph
+        self.__image_names_to_convert = set()
+        self.__graph = None
+        # DAE path: its targets in the build graph
+        self.__dae_targets = {}
+        self.__tiff_directory = None
+        # DdsConversions of the textures of every DAE written
+        self.__dds_conversions = []
+        self.__texture_cache = None
+        # names of the images converted by this export
+        self.__converted_images = set()
+        # one line about RC for the UI, set once its log is written
+        self.__summary = None
+
     def export(self):
+        # only a build graph of the recorded DAEs knows what is out of date
+        if self.__config.incremental_export:
+            for _ in self.export_in_steps():
+                pass
+            self.write_exported()
+            return
+
+        self.__prepare_for_export()
+
+        filepath = bpy.path.ensure_ext(self.__config.filepath, ".dae")
+        if self.__config.split_export_nodes:
+            self.__export_nodes_separately(filepath)
+        else:
+            self.__write_dae(filepath)
+            self.__trim_caches()
+            process_dae(self.__config, filepath, self.__config.rc_path,
+                        self.__progress)
+
+        write_scripts(self.__config, filepath)
+        self.__wait_for_dds_conversion()
+        self.__write_log(filepath)
+
+    def get_summary(self):
+        return self.__summary
+
+    def export_in_steps(self, node_names=None):
+        '''The part of export() which works with Blender data, as a
+        generator which stops after every short piece of work. The DAEs
+        are put together in memory, with their geometries as snapshots of
+        the meshes. write_exported() does the rest without Blender data,
+        so it can run on another thread. Only the export nodes named in
+        'node_names' are exported, all if it is None.
+        '''
         self.__prepare_for_export()
+        yield
+
+        # between two steps the artist may delete or undo, only names are
+        # kept and Blender data is looked up again in every step
+        filepath = bpy.path.ensure_ext(self.__config.filepath, ".dae")
+        export_node_names = [group.name for group in utils.get_export_nodes()
+                             if node_names is None or group.name in node_names]
+        self.__defer_geometry = True
+        self.__filepath = filepath
+        self.__node_count = len(export_node_names)
+        if self.__config.split_export_nodes:
+            for node_name in export_node_names:
+                export_nodes = get_export_nodes_named([node_name])
+                if not export_nodes:
+                    self.__add_failed_node(node_name, get_removed_exception(
+                                                    "Export node", node_name))
+                    continue
+                dae_path = get_node_dae_path(filepath, export_nodes[0])
+                rc_nodes = get_rc_nodes(export_nodes)
+                recorder = utils.XmlRecorder()
+                try:
+                    yield from run_steps_for_nodes(
+                                    [node_name],
+                                    self.__write_document(recorder))
+                except Exception as exception:
+                    self.__add_failed_node(node_name, exception)
+                    continue
+
+                self.__recorded_daes.append((dae_path, recorder))
+                self.__dae_nodes[dae_path] = rc_nodes
+        else:
+            rc_nodes = get_rc_nodes(get_export_nodes_named(export_node_names))
+            recorder = utils.XmlRecorder()
+            yield from run_steps_for_nodes(export_node_names,
+                                           self.__write_document(recorder))
+            self.__recorded_daes.append((filepath, recorder))
+            self.__dae_nodes[filepath] = rc_nodes
+
+        if self.__config.make_layer:
+            self.__layer = make_layer(filepath)
+        write_scripts(self.__config, filepath)
+
+        if not self.__config.incremental_export:
+            self.__rc_cache = get_rc_cache(self.__config)
+            return
+
+        self.__graph = self.__make_build_graph(filepath)
+        # TIFFs are saved from the images, the rest is left to
+        # write_exported()
+        tiff_targets = [target for target in self.__graph.targets
+                        if target.local and target.stale
+                        and target.name.startswith(TIFF_TARGET_PREFIX)]
+        if tiff_targets:
+            self.__progress.start_stage("Saving TIFFs", len(tiff_targets))
+        for target in tiff_targets:
+            yield
+            self.__graph.run(1, self.__progress.cancel_event,
+                             targets=[target])
+            self.__progress.advance()
+
+    def write_exported(self):
+        '''Writes the DAEs put together by export_in_steps() and runs RC
+        on them. Raises ExportCancelledException once the progress is
+        cancelled.
+        '''
+        if self.__graph is not None:
+            self.__build()
+        else:
+            self.__write_and_process_daes()
+
+        if self.__config.split_export_nodes:
+            report_failed_nodes(self.__failed_nodes, self.__node_count)
+
+        if self.__layer is not None:
+            write_layer(self.__filepath, self.__layer)
+
+        self.__wait_for_dds_conversion()
+        self.__write_log(self.__filepath)
+        self.__progress.check_cancelled()
+
+    def __write_and_process_daes(self):
+        recorded_daes = self.__recorded_daes
+        self.__recorded_daes = []
+        for dae_path, recorder in recorded_daes:
+            self.__progress.check_cancelled()
+            try:
+                self.__write_dae(dae_path, recorder)
+            except exceptions.ExportCancelledException:
+                raise
+            except Exception as exception:
+                if not self.__config.split_export_nodes:
+                    raise
+                for node in self.__dae_nodes.pop(dae_path):
+                    self.__add_failed_node(node.name, exception)
+
+        self.__trim_caches()
+
+        self.__failed_nodes.extend(process_node_daes(self.__config,
+                                                     self.__dae_nodes,
+                                                     self.__config.rc_path,
+                                                     self.__rc_cache,
+                                                     self.__progress))
+
+    def __make_build_graph(self, filepath):
+        config = self.__config
+        graph = build_graph.BuildGraph(build_graph.get_manifest_path(filepath))
+
+        images = []
+        for image_name in sorted(self.__image_names_to_convert):
+            image = bpy.data.images.get(image_name)
+            if image is None:
+                cbPrint(get_removed_exception("Image", image_name).what(),
+                        'warning')
+            else:
+                images.append(image)
+        self.__image_names_to_convert = set()
+        if images and not os.path.isfile(
+                config.rc_for_textures_conversion_path):
+            cbPrint("RC for texture conversion was not found, textures are "
+                    "not converted.", 'error')
+            images = []
+        for image in images:
+            self.__add_texture_targets(graph, image)
+
+        for dae_path, recorder in self.__recorded_daes:
+            dae_target = graph.add(
+                    "dae:{}".format(os.path.basename(dae_path)),
+                    [config.cryblend_version,
+                     self.__get_document_key(recorder)],
+                    # a DAE which is not kept is written when RC needs it
+                    [dae_path] if config.save_dae else [],
+                    functools.partial(self.__write_dae, dae_path, recorder,
+                                      False),
+                    local=True)
+            self.__dae_targets[dae_path] = [dae_target]
+            if not config.disable_rc:
+                self.__dae_targets[dae_path].extend(add_rc_targets(
+                        graph, config, dae_target, dae_path,
+                        self.__dae_nodes[dae_path], self.__progress))
+        self.__recorded_daes = []
+
+        return graph
+
+    def __add_texture_targets(self, graph, image):
+        config = self.__config
+        exe = config.rc_for_textures_conversion_path
+        image_path = utils.get_absolute_path(image.filepath)
+        dds_path = utils.get_path_with_new_extension(image_path, "dds")
+        # the TIFF is saved from the pixels, the file may not have them
+        force = (config.rebuild_textures
+                 or dds_converter.is_changed_from_file(image))
+        try:
+            inputs = [cache.hash_file(image_path)]
+        except (IOError, OSError):
+            # generated, hashing the pixels would take longer than
+            # converting them
+            inputs = []
+            force = True
+
+        depends_on = []
+        if utils.get_extension_from_path(image_path) != ".tif":
+            if config.save_tiff_during_conversion:
+                tiff_path = utils.get_path_with_new_extension(image_path,
+                                                              "tif")
+                outputs = [tiff_path]
+            else:
+                if self.__tiff_directory is None:
+                    self.__tiff_directory = tempfile.mkdtemp("CryBlend")
+                tiff_path = os.path.join(self.__tiff_directory,
+                                         os.path.basename(
+                                            utils.get_path_with_new_extension(
+                                                image_path, "tif")))
+                outputs = []
+            depends_on.append(graph.add(
+                    "{}{}".format(TIFF_TARGET_PREFIX, image.name),
+                    inputs,
+                    outputs,
+                    functools.partial(save_image_as_tiff, image.name,
+                                      tiff_path),
+                    local=True,
+                    force=force))
+            inputs = []
+            image_path = tiff_path
+
+        # the target runs on a worker, it only gets resolved paths
+        graph.add("dds:{}".format(image.name),
+                  inputs + [cache.get_program_stamp(exe),
+                            dds_converter.get_rc_params(dds_path)],
+                  [dds_path],
+                  functools.partial(dds_converter.convert_to_dds, exe,
+                                    image_path, dds_path),
+                  depends_on,
+                  force=force)
+
+    def __get_document_key(self, recorder):
+        '''A hex digest of the recorded document, as written by
+        __replay_document() but without its times, without writing its
+        geometries.
+        '''
+        hasher = hashlib.sha1()
+        for name, element in recorder.get_calls():
+            cache.update_hash(hasher, name)
+            if isinstance(element, DeferredGeometry):
+                key = element.key
+                if key is None:
+                    key = self.__get_geometry_key(element.job.name,
+                                                  element.job.keep_positions,
+                                                  element.job.mesh_data)
+                cache.update_hash(hasher, key)
+            elif element is not None:
+                text = utils.element_to_string(element, self.__indent)
+                cache.update_hash(hasher, cache.remove_dae_times(
+                                                    text.encode('utf-8')))
+
+        return hasher.hexdigest()
+
+    def __build(self):
+        stale_targets = [target for target in self.__graph.get_stale_targets()
+                         if target.state == build_graph.PENDING]
+        self.__progress.start_stage("Building", len(stale_targets))
+        try:
+            self.__graph.run(self.__config.rc_jobs,
+                             self.__progress.cancel_event,
+                             lambda target: self.__progress.advance())
+        finally:
+            if self.__tiff_directory is not None:
+                shutil.rmtree(self.__tiff_directory, ignore_errors=True)
+                self.__tiff_directory = None
+        self.__graph.print_summary()
+        self.__trim_caches()
+
+        for dae_path, targets in sorted(self.__dae_targets.items()):
+            dae_target = targets[0]
+            if (dae_target.state == build_graph.FAILED
+                    and not self.__config.split_export_nodes):
+                raise dae_target.error
+            if any(target.state not in build_graph.DONE_STATES
+                   for target in targets):
+                self.__failed_nodes.extend(node.name for node
+                                           in self.__dae_nodes[dae_path])
+
+        if not self.__config.save_dae:
+            for dae_path in self.__dae_targets:
+                remove_dae(utils.get_absolute_path(dae_path))
+
+    def __export_nodes_separately(self, filepath):
+        export_nodes = utils.get_export_nodes()
+        dae_nodes = {}
+        for group in export_nodes:
+            dae_path = get_node_dae_path(filepath, group)
+            try:
+                with utils.export_only([group.name]):
+                    self.__write_dae(dae_path)
+            except Exception as exception:
+                self.__add_failed_node(group.name, exception)
+                continue
+
+            dae_nodes[dae_path] = get_rc_nodes([group])
+
+        self.__trim_caches()
+
+        self.__failed_nodes.extend(process_node_daes(self.__config,
+                                                     dae_nodes,
+                                                     self.__config.rc_path,
+                                                     get_rc_cache(
+                                                         self.__config),
+                                                     self.__progress))
+        report_failed_nodes(self.__failed_nodes, len(export_nodes))
+
+        if self.__config.make_layer:
+            write_layer(filepath)
+
+    def __write_log(self, filepath):
+        self.__progress.finish()
+        for stage, seconds in self.__progress.get_stage_times():
+            cbPrint("{} took {:.4f} sec.".format(stage, seconds))
+
+        # without RC there is no output to look into
+        job_reports = self.__progress.get_rc_reports()
+        if not job_reports:
+            return
+
+        log_path = export_log.get_log_path(filepath)
+        export_log.write_log(log_path, self.__progress.get_stage_times(),
+                             job_reports)
+        self.__summary = export_log.get_summary(job_reports, log_path)
+        cbPrint(self.__summary)
+
+    def __add_failed_node(self, node_name, exception):
+        cbPrint("Export node {!r} failed: {!s}".format(node_name, exception),
+                'error')
+        self.__failed_nodes.append(node_name)
+
+    def __write_dae(self, filepath, recorder=None, track_progress=True):
+        # written next to the DAE and renamed, a failed export leaves the
+        # last good file alone
+        tmp_path = "{}.tmp".format(filepath)
+        try:
+            with open(tmp_path, "w", buffering=WRITE_BUFFER_SIZE) as file:
+                writer = utils.XmlStreamWriter(file, self.__indent)
+                if recorder is None:
+                    for _ in self.__write_document(writer):
+                        pass
+                else:
+                    self.__replay_document(recorder, writer, track_progress)
+            os.replace(tmp_path, filepath)
 
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def __replay_document(self, recorder, writer, track_progress=True):
+        '''Writes the document 'recorder' holds. Without 'track_progress'
+        the progress is left to the caller, e.g. a build.
+        '''
+        deferred_geometries = [element for element in recorder.get_elements()
+                               if isinstance(element, DeferredGeometry)]
+        if track_progress:
+            self.__progress.start_stage("Writing geometry",
+                                        len(deferred_geometries))
+
+        # cached geometries are looked up here, a geometry reused from
+        # the cache changes nothing in the key of a document
+        for deferred in deferred_geometries:
+            if deferred.key is not None:
+                deferred.node = self.__get_cached_fragment(deferred.key,
+                                                           "geometry")
+                if deferred.node is not None:
+                    cbPrint("Reused cached geometry of {!r}.".format(
+                            deferred.job.name))
+        deferred_geometries = [deferred for deferred in deferred_geometries
+                               if deferred.node is None]
+
+        dedup_statistics = {}
+        if self.__config.parallel_geometry and deferred_geometries:
+            pool_jobs = [(index, deferred.job, deferred.key)
+                         for index, deferred in enumerate(deferred_geometries)]
+            geometry_nodes = [None] * len(pool_jobs)
+            self.__write_geometries_in_pool(pool_jobs, geometry_nodes,
+                                            dedup_statistics)
+            for deferred, geometry_node in zip(deferred_geometries,
+                                               geometry_nodes):
+                deferred.node = geometry_node
+        del deferred_geometries[:]
+
+        recorder.replay(writer, lambda element: self.__resolve_element(
+                                element, dedup_statistics, track_progress))
+
+        if dedup_statistics:
+            cbPrint("Deduplication of all geometries: {}".format(
+                    self.__format_shrinkage(dedup_statistics.items())))
+
+    def __resolve_element(self, element, dedup_statistics, track_progress):
+        if not isinstance(element, DeferredGeometry):
+            return element
+
+        self.__progress.check_cancelled()
+        geometry_node = element.node
+        if geometry_node is None:
+            geometry_node = self.__write_geometry(element.job, element.key,
+                                                  dedup_statistics)
+        if track_progress:
+            self.__progress.advance()
+
+        return geometry_node
+
+    def __trim_caches(self):
+        for mesh_cache in self.__mesh_caches.values():
+            mesh_cache.trim()
+
+        if self.__fragment_cache is not None:
+            self.__fragment_cache.trim()
+            cbPrint("Fragment cache: {:d} reused, {:d} written.".format(
+                    self.__fragment_cache.hits, self.__fragment_cache.misses))
+
+    def __write_document(self, writer):
+        # ids are per document, another DAE does not have their geometries
+        self.__geometry_ids = {}
+        self.__lod_geometry_ids = {}
+
+        # elements are written as soon as they are complete, the document
+        # is never held in memory as a whole
+        self.__progress.start_stage("Exporting materials")
+        writer.write_declaration()
         root_element = self.__doc.createElement('collada')
         root_element.setAttribute("xmlns",
                                "http://www.collada.org/2005/11/COLLADASchema")
         root_element.setAttribute("version", "1.4.1")
-        self.__doc.appendChild(root_element)
-        self.__create_file_header(root_element)
+        writer.start_element(root_element)
+        self.__create_file_header(writer)
 
         # Just here for future use:
-        self.__export_library_cameras(root_element)
-        self.__export_library_lights(root_element)
+        self.__export_library_cameras(writer)
+        self.__export_library_lights(writer)
         ###
 
-        self.__export_library_images(root_element)
-        self.__export_library_effects(root_element)
-        self.__export_library_materials(root_element)
-        self.__export_library_geometries(root_element)
+        self.__export_library_images(writer)
+        self.__export_library_effects(writer)
+        self.__export_library_materials(writer)
+        yield from self.__export_library_geometries(writer)
 
+        # the fake bones must not stay in the scene between two steps
+        yield
+        self.__progress.start_stage("Exporting scene")
         utils.add_fakebones()
         try:
-            self.__export_library_controllers(root_element)
-            self.__export_library_animation_clips_and_animations(root_element)
-            self.__export_library_visual_scenes(root_element)
+            self.__export_library_controllers(writer)
+            self.__export_library_animation_clips_and_animations(writer)
+            self.__export_library_visual_scenes(writer)
         except RuntimeError:
             pass
         finally:
             utils.remove_fakebones()
 
-        self.__export_scene(root_element)
-
-        filepath = bpy.path.ensure_ext(self.__config.filepath, ".dae")
-        write_to_file(self.__config,
-                      self.__doc, filepath,
-                      self.__config.rc_path)
-
-        write_scripts(self.__config, filepath)
+        self.__export_scene(writer)
+        writer.end_element()
 
     def __prepare_for_export(self):
+        self.__progress.start_stage("Preparing")
         utils.clean_file()
 
-        if self.__config.apply_modifiers:
+        if self.__config.evaluate_modifiers:
+            cbPrint("Evaluating modifiers instead of applying them.")
+        elif self.__config.apply_modifiers:
             utils.apply_modifiers()
 
         if self.__config.fix_weights:
@@ -180,7 +680,11 @@ class CrytekDaeExporter:
             library_images.appendChild(image_element)
 
         if self.__config.convert_source_image_to_dds:
-            self.__convert_images_to_dds(images_to_convert)
+            if self.__config.incremental_export:
+                self.__image_names_to_convert.update(
+                    image.name for image in images_to_convert)
+            else:
+                self.__convert_images_to_dds(images_to_convert)
 
     def __export_library_image(self, images_to_convert, image):
         if self.__config.convert_source_image_to_dds:
@@ -218,13 +722,56 @@ class CrytekDaeExporter:
                 pass
 
         # return only unique images
-        return list(set(images))
+        return sorted(set(images), key=lambda image: image.name)
 
     def __convert_images_to_dds(self, images_to_convert):
+        if self.__texture_cache is None:
+            self.__texture_cache = dds_converter.TextureCache(
+                    dds_converter.get_texture_manifest_path(
+                        self.__config.filepath),
+                    self.__config.rebuild_textures)
+        # every DAE of a split export has the same images
+        images_to_convert = [image for image in images_to_convert
+                             if image.name not in self.__converted_images]
+        self.__converted_images.update(image.name
+                                       for image in images_to_convert)
         converter = DdsConverterRunner(
-                                self.__config.rc_for_textures_conversion_path)
-        converter.start_conversion(images_to_convert,
-                                   self.__config.save_tiff_during_conversion)
+                                self.__config.rc_for_textures_conversion_path,
+                                self.__config.rc_jobs,
+                                self.__texture_cache)
+        self.__dds_conversions.append(converter.start_conversion(
+                                    images_to_convert,
+                                    self.__config.save_tiff_during_conversion))
+
+    def __wait_for_dds_conversion(self):
+        '''Waits for the textures to be converted while RC runs on the
+        DAEs, reports those which failed. Raises ExportCancelledException
+        once the progress is cancelled.
+        '''
+        conversions = self.__dds_conversions
+        if not conversions:
+            return
+        self.__dds_conversions = []
+
+        self.__progress.start_stage("Converting textures")
+        for conversion in conversions:
+            while not conversion.wait(dds_converter.POLL_INTERVAL):
+                if self.__progress.is_cancelled():
+                    for pending in conversions:
+                        pending.cancel()
+                    self.__progress.check_cancelled()
+
+            for image_name, error in sorted(
+                    conversion.get_results().items()):
+                if error is not None:
+                    cbPrint("Converting {!r} to DDS failed: {!s}".format(
+                            image_name, error), 'error')
+
+        texture_cache = self.__texture_cache
+        cbPrint("{:d} textures were up to date.".format(
+                texture_cache.skipped), 'debug')
+        texture_cache.remove_stale_entries()
+        texture_cache.save()
 
     def __export_library_effects(self, parent_element):
         current_element = self.__doc.createElement("library_effects")
@@ -353,16 +900,7 @@ class CrytekDaeExporter:
         return node
 
     def __create_double_sided_extra(self, profile):
-        extra = self.__doc.createElement("extra")
-        technique = self.__doc.createElement("technique")
-        technique.setAttribute("profile", profile)
-        double_sided = self.__doc.createElement("double_sided")
-        double_sided_value = self.__doc.createTextNode("1")
-        double_sided.appendChild(double_sided_value)
-        technique.appendChild(double_sided)
-        extra.appendChild(technique)
-
-        return extra
+        return utils.write_double_sided_extra(profile, self.__doc)
 
     def __export_library_materials(self, parent_element):
         library_materials = self.__doc.createElement("library_materials")
@@ -378,229 +916,313 @@ class CrytekDaeExporter:
 
         parent_element.appendChild(library_materials)
 
-    def __export_library_geometries(self, parent_element):
+    def __export_library_geometries(self, writer):
         libgeo = self.__doc.createElement("library_geometries")
-        parent_element.appendChild(libgeo)
-        for object_ in utils.get_type("geometry"):
-            bpy.context.scene.objects.active = object_
-            if object_.mode != 'OBJECT':
-                bpy.ops.object.mode_set(mode='OBJECT')
+        writer.start_element(libgeo)
+        dedup_statistics = {}
+        # jobs for the process pool leave a gap in 'geometry_nodes'
+        geometry_nodes = []
+        pool_jobs = []
+        shared_geometry_ids = {}
+        # the first object of a shared mesh owns its geometry id, the
+        # order has to be the same in every session
+        object_names = sorted(object_.name
+                              for object_ in utils.get_type("geometry"))
+        self.__progress.start_stage("Exporting geometry", len(object_names))
+        for object_name in object_names:
+            yield
+            self.__progress.advance()
+            object_ = bpy.data.objects.get(object_name)
+            if object_ is None:
+                raise get_removed_exception("Object", object_name)
+
+            # skin weights refer to vertices by their index
+            is_skinned = utils.get_armature_for_object(object_) is not None
+            if self.__config.instance_shared_meshes:
+                # meshes linked from libraries may share a name
+                shared_key = (object_.data.as_pointer(), is_skinned)
+                # linked duplicates may have modifiers of their own
+                if self.__config.evaluate_modifiers:
+                    shared_key += (cache.hash_items(
+                        *utils.get_modifier_items(
+                            object_, utils.get_evaluated_modifiers(object_))),)
+                if shared_key in shared_geometry_ids:
+                    shared_name = shared_geometry_ids[shared_key]
+                    self.__geometry_ids[object_.name] = shared_name
+                    if shared_name in self.__lod_geometry_ids:
+                        self.__lod_geometry_ids[object_.name] = \
+                            self.__lod_geometry_ids[shared_name]
+                    continue
+                shared_geometry_ids[shared_key] = object_.name
+
+            # no operators in here, each one costs a context check, an undo
+            # push and a scene update
+            if object_.mode == 'EDIT':
+                object_.update_from_editmode()
             object_.data.update(calc_tessface=1)
             mesh = object_.data
             object_.name = object_.name
-            geometry_node = self.__doc.createElement("geometry")
-            geometry_node.setAttribute("id", "%s" % (object_.name))
-            mesh_node = self.__doc.createElement("mesh")
-
-            start_time = clock()
-            self.__write_positions(object_, mesh, mesh_node)
-            cbPrint('Positions took %.4f sec.' % (clock() - start_time))
-
-            start_time = clock()
-            self.__write_normals(object_, mesh, mesh_node)
-            cbPrint('Normals took %.4f sec.' % (clock() - start_time))
-
-            start_time = clock()
-            self.__write_uvs(object_, mesh, mesh_node)
-            cbPrint('UVs took %.4f sec.' % (clock() - start_time))
-
-            start_time = clock()
-            self.__write_vertex_colors(object_, mesh, mesh_node)
-            cbPrint('Vertex colors took %.4f sec.' % (clock() - start_time))
+            self.__check_uv_map(object_)
 
             start_time = clock()
-            self.__write_vertices(object_, mesh, mesh_node)
-            cbPrint('Vertices took %.4f sec.' % (clock() - start_time))
+            mesh_data = geometry.read_mesh(
+                mesh, not self.__config.per_element_mesh_reading)
+            cbPrint('Reading mesh took %.4f sec.' % (clock() - start_time))
+
+            geometry_mesh_data = mesh_data
+            if self.__config.evaluate_modifiers:
+                geometry_mesh_data = self.__get_evaluated_mesh_data(
+                    object_, mesh_data, is_skinned)
+
+            self.__add_geometry(object_.name, geometry_mesh_data, is_skinned,
+                                geometry_nodes, pool_jobs, dedup_statistics)
+
+            if not is_skinned:
+                for level, ratio in enumerate(utils.get_lod_ratios(object_),
+                                              1):
+                    lod_name = utils.get_lod_name(object_.name, level)
+                    lod_mesh_data = self.__get_lod_mesh_data(
+                        object_, geometry_mesh_data, ratio)
+                    self.__add_geometry(lod_name, lod_mesh_data, False,
+                                        geometry_nodes, pool_jobs,
+                                        dedup_statistics)
+                    self.__lod_geometry_ids.setdefault(
+                        object_.name, []).append(lod_name)
+
+            # pool results fill the gaps at the end, until then all wait
+            if not pool_jobs:
+                self.__write_geometry_nodes(writer, geometry_nodes)
+
+        if pool_jobs:
+            self.__write_geometries_in_pool(pool_jobs, geometry_nodes,
+                                            dedup_statistics)
+
+        self.__write_geometry_nodes(writer, geometry_nodes)
+        writer.end_element()
+
+        if dedup_statistics:
+            cbPrint("Deduplication of all geometries: {}".format(
+                    self.__format_shrinkage(dedup_statistics.items())))
+
+        if self.__geometry_ids:
+            cbPrint("{:d} objects use the geometry of another object.".format(
+                    len(self.__geometry_ids)))
+
+    def __write_geometry_nodes(self, writer, geometry_nodes):
+        for geometry_node in geometry_nodes:
+            writer.write_element(geometry_node)
+        del geometry_nodes[:]
+
+    def __get_geometry_id(self, object_):
+        return self.__geometry_ids.get(object_.name, object_.name)
+
+    def __add_geometry(self, name, mesh_data, is_skinned, geometry_nodes,
+                       pool_jobs, dedup_statistics):
+        key = None
+        if self.__fragment_cache is not None:
+            key = self.__get_geometry_key(name, is_skinned, mesh_data)
+            # deferred geometries are looked up when they are written
+            fragment = None
+            if not self.__defer_geometry:
+                fragment = self.__get_cached_fragment(key, "geometry")
+            if fragment is not None:
+                cbPrint("Reused cached geometry of {!r}.".format(name))
+                geometry_nodes.append(fragment)
+                return
 
+        job = geometry_writer.GeometryJob(name,
+                                          mesh_data,
+                                          self.__config.average_planar,
+                                          self.__config.deduplicate_geometry,
+                                          is_skinned,
+                                          self.__number_format,
+                                          self.__indent)
+
+        if self.__defer_geometry:
+            geometry_nodes.append(DeferredGeometry(job, key))
+        elif self.__config.parallel_geometry:
+            pool_jobs.append((len(geometry_nodes), job, key))
+            geometry_nodes.append(None)
+        else:
+            geometry_nodes.append(
+                self.__write_geometry(job, key, dedup_statistics))
+
+    def __get_mesh_cache(self, kind):
+        if kind not in self.__mesh_caches:
+            self.__mesh_caches[kind] = cache.FileCache(
+                                    utils.get_cache_directory(kind),
+                                    self.__config.geometry_cache_size
+                                    * 1024 * 1024)
+
+        return self.__mesh_caches[kind]
+
+    def __get_evaluated_mesh_data(self, object_, mesh_data, is_skinned):
+        modifiers = utils.get_evaluated_modifiers(object_)
+        if not modifiers:
+            return mesh_data
+
+        # evaluation is slow, results are kept for unchanged inputs
+        modifier_cache = self.__get_mesh_cache("modifiers")
+        key = cache.hash_items("modifiers",
+                               self.__config.cryblend_version,
+                               utils.get_deform_items(object_),
+                               *(utils.get_modifier_items(object_, modifiers)
+                                 + self.__get_mesh_data_items(mesh_data)))
+        data = modifier_cache.get(key)
+        if data is not None:
+            evaluated_mesh_data = pickle.loads(data)
+        else:
             start_time = clock()
-            self.__write_polylist(object_, mesh, mesh_node)
-            cbPrint('Polylist took %.4f sec.' % (clock() - start_time))
-
-            extra = self.__create_double_sided_extra("MAYA")
-            mesh_node.appendChild(extra)
-            geometry_node.appendChild(mesh_node)
-            libgeo.appendChild(geometry_node)
-
-    def __write_positions(self, object_, mesh, root):
-        float_positions = []
-        for vertex in mesh.vertices:
-            float_positions.extend(vertex.co)
-
-        id_ = "{!s}-positions".format(object_.name)
-        source = utils.write_source(id_,
-                                    "float",
-                                    float_positions,
-                                    "XYZ",
-                                    self.__doc)
-        root.appendChild(source)
-
-    def __write_normals(self, object_, mesh, root):
-        float_normals = []
-        float_normals_count = ""
-
-        for face in mesh.tessfaces:
-            if face.use_smooth:
-                for vert in face.vertices:
-                    vertex = mesh.vertices[vert]
-                    normal = utils.veckey3d21(vertex.normal)
-                    float_normals.extend(normal)
-
-            else:
-                if self.__config.average_planar:
-                    count = 1
-                    nx = face.normal.x
-                    ny = face.normal.y
-                    nz = face.normal.z
-
-                    for planar_face in mesh.tessfaces:
-                        angle = face.normal.angle(planar_face.normal)
-                        if (-.052 < angle and angle < .052):
-                            nx += planar_face.normal.x
-                            ny += planar_face.normal.y
-                            nz += planar_face.normal.z
-                            count += 1
-
-                    float_normals.append(nx / count)
-                    float_normals.append(ny / count)
-                    float_normals.append(nz / count)
-                else:
-                    normal = utils.veckey3d21(face.normal)
-                    float_normals.extend(normal)
+            evaluated_mesh = utils.get_evaluated_mesh(object_)
+            try:
+                evaluated_mesh_data = geometry.read_mesh(
+                    evaluated_mesh, not self.__config.per_element_mesh_reading)
+            finally:
+                bpy.data.meshes.remove(evaluated_mesh)
+            cbPrint("Evaluating modifiers of {!r} took {:.4f} sec.".format(
+                    object_.name, clock() - start_time))
+
+            modifier_cache.put(key, pickle.dumps(evaluated_mesh_data,
+                                                 pickle.HIGHEST_PROTOCOL))
+
+        # skin weights are read from the object's own vertices
+        if is_skinned and (len(evaluated_mesh_data.positions)
+                           != len(mesh_data.positions)):
+            cbPrint("Modifiers of skinned {!r} change its vertices, exporting "
+                    "it without them.".format(object_.name), 'warning')
+            return mesh_data
+
+        return evaluated_mesh_data
+
+    def __get_lod_mesh_data(self, object_, mesh_data, ratio):
+        '''Returns 'mesh_data', the mesh of LOD0, decimated to 'ratio'.'''
+        # decimation is slow, results are kept for unchanged meshes
+        lod_cache = self.__get_mesh_cache("lods")
+        key = cache.hash_items("lod", self.__config.cryblend_version, ratio,
+                               *self.__get_mesh_data_items(mesh_data))
+        data = lod_cache.get(key)
+        if data is not None:
+            return pickle.loads(data)
+
+        start_time = clock()
+        # LOD0 has the modifiers, decimating the base would drop them
+        lod_mesh = utils.get_decimated_mesh(
+            object_, ratio, self.__config.evaluate_modifiers)
+        try:
+            lod_mesh_data = geometry.read_mesh(
+                lod_mesh, not self.__config.per_element_mesh_reading)
+        finally:
+            bpy.data.meshes.remove(lod_mesh)
+        cbPrint("Decimating {!r} to {:g} took {:.4f} sec.".format(
+                object_.name, ratio, clock() - start_time))
 
-        id_ = "{!s}-normals".format(object_.name)
-        source = utils.write_source(id_,
-                                    "float",
-                                    float_normals,
-                                    "XYZ",
-                                    self.__doc)
-        root.appendChild(source)
+        lod_cache.put(key, pickle.dumps(lod_mesh_data,
+                                        pickle.HIGHEST_PROTOCOL))
+        return lod_mesh_data
 
-    def __write_uvs(self, object_, mesh, root):
+    def __check_uv_map(self, object_):
         uvdata = object_.data.tessface_uv_textures
         if uvdata is None:
             cbPrint("Your UV map is missing, adding...")
-            bpy.ops.mesh.uv_texture_add()
+            object_.data.uv_textures.new()
+            object_.data.update(calc_tessface=1)
         else:
             cbPrint("Found UV map.")
 
-        float_uvs = []
-        for uvindex, uvlayer in enumerate(uvdata):
-            mapslot = uvindex
-            mapname = uvlayer.name
-            uvid = "{!s}-{!s}-{!s}".format(object_.name, mapname, mapslot)
+    def __write_geometry(self, job, key, dedup_statistics):
+        streams, statistics = geometry_writer.create_streams(job)
+        geometry_node = geometry_writer.write_geometry(job.name, streams,
+                                                       self.__doc,
+                                                       job.number_format)
 
-            for uf in uvlayer.data:
-                for uv in uf.uv:
-                    float_uvs.extend(uv)
+        if key is not None:
+            self.__store_fragment(key, geometry_node)
+        self.__add_dedup_statistics(job.name, statistics, dedup_statistics)
 
-        id_ = "{!s}-UVMap-0".format(object_.name)
-        source = utils.write_source(id_,
-                                    "float",
-                                    float_uvs,
-                                    "ST",
-                                    self.__doc)
-        root.appendChild(source)
-
-    def __write_vertex_colors(self, object_, mesh, root):
-        float_colors = []
-        alpha_found = False
-
-        if object_.data.tessface_vertex_colors:
-            color_layers = object_.data.tessface_vertex_colors
-            for color_layer in color_layers:
-                for fi, face in enumerate(color_layer.data):
-                    colors = [face.color1[:], face.color2[:], face.color3[:]]
-                    if len(mesh.tessfaces[fi].vertices) == 4:
-                        colors.append(face.color4[:])
-
-                    for color in colors:
-                        if color_layer.name.lower() == "alpha":
-                            alpha_found = True
-                            alpha = (color[0] + color[1] + color[2])/3
-                            float_colors.extend([1, 1, 1, alpha])
-                        else:
-                            float_colors.extend(color)
-
-        if float_colors:
-            id_ = "{!s}-colors".format(object_.name)
-            params = ("RGBA" if alpha_found else "RGB")
-            source = utils.write_source(id_,
-                                        "float",
-                                        float_colors,
-                                        params,
-                                        self.__doc)
-            root.appendChild(source)
-
-    def __write_vertices(self, object_, mesh, root):
-        vertices = self.__doc.createElement("vertices")
-        vertices.setAttribute("id", "%s-vertices" % (object_.name))
-        input = utils.write_input(object_.name, None,
-                                    "positions", "POSITION")
-        vertices.appendChild(input)
-        root.appendChild(vertices)
-
-    def __write_polylist(self, object_, mesh, root):
-        materials = mesh.materials[:]
-        if materials:
-            for matindex, material in enumerate(materials):
-                vert_data = ""
-                verts_per_poly = ""
-                poly_count = normal = texcoord = 0
-
-                for face in mesh.tessfaces:
-                    if face.material_index == matindex:
-                        verts_per_poly = join(verts_per_poly, len(face.vertices), " ")
-                        poly_count += 1
-                        for vert in face.vertices:
-                            data = self.__write_vertex_data(mesh, face, vert, normal, texcoord)
-                            vert_data = join(vert_data, data)
-                            texcoord += 1
-                    else:
-                        texcoord += len(face.vertices)
-
-                    if face.use_smooth:
-                        normal += len(face.vertices)
-                    else:
-                        normal += 1
-
-                polylist = self.__doc.createElement("polylist")
-                polylist.setAttribute("material", material.name)
-                polylist.setAttribute("count", str(poly_count))
-
-                inputs = []
-                inputs.append(utils.write_input(object_.name, 0,
-                                            "vertices", "VERTEX"))
-                inputs.append(utils.write_input(object_.name, 1,
-                                            "normals", "NORMAL"))
-                inputs.append(utils.write_input(object_.name, 2,
-                                            "UVMap-0", "TEXCOORD"))
-                if mesh.vertex_colors:
-                    inputs.append(utils.write_input(object_.name, 3,
-                                                    "colors", "COLOR"))
-
-                for input in inputs:
-                    polylist.appendChild(input)
-
-                vcount = self.__doc.createElement("vcount")
-                vcount_text = self.__doc.createTextNode(verts_per_poly)
-                vcount.appendChild(vcount_text)
-
-                p = self.__doc.createElement("p")
-                p_text = self.__doc.createTextNode(vert_data)
-                p.appendChild(p_text)
-
-                polylist.appendChild(vcount)
-                polylist.appendChild(p)
-                root.appendChild(polylist)
-
-    def __write_vertex_data(self, mesh, face, vert, normal, texcoord):
-        if face.use_smooth:
-            normal = vert
-
-        if mesh.vertex_colors:
-            return "{:d} {:d} {:d} {:d} ".format(vert, normal, texcoord, texcoord)
+        return geometry_node
+
+    def __write_geometries_in_pool(self, pool_jobs, geometry_nodes,
+                                   dedup_statistics):
+        jobs = [job for index, job, key in pool_jobs]
+        processes = min(len(jobs), os.cpu_count() or 1)
+
+        start_time = time.time()
+        if processes > 1:
+            results = geometry_writer.serialise_geometries(
+                                jobs, processes, bpy.app.binary_path_python)
         else:
-            return "{:d} {:d} {:d} ".format(vert, normal, texcoord)
+            results = [geometry_writer.serialise_geometry(job)
+                       for job in jobs]
+        cbPrint('Writing {:d} geometries in {:d} processes took {:.4f} sec.'
+                .format(len(jobs), processes, time.time() - start_time))
+
+        for (index, job, key), (text, statistics) in zip(pool_jobs, results):
+            geometry_nodes[index] = utils.XmlFragment("geometry", text)
+            if key is not None:
+                self.__fragment_cache.put(key, text.encode('utf-8'))
+            self.__add_dedup_statistics(job.name, statistics,
+                                        dedup_statistics)
+
+    def __get_geometry_key(self, name, is_skinned, mesh_data):
+        return cache.hash_items("geometry",
+                                self.__config.cryblend_version,
+                                name,
+                                self.__config.average_planar,
+                                self.__config.deduplicate_geometry,
+                                self.__number_format.get_key(),
+                                self.__indent,
+                                is_skinned,
+                                *self.__get_mesh_data_items(mesh_data))
+
+    def __get_mesh_data_items(self, mesh_data):
+        items = [mesh_data.positions,
+                 mesh_data.vertex_normals,
+                 mesh_data.face_sizes,
+                 mesh_data.face_vertices,
+                 mesh_data.face_normals,
+                 mesh_data.face_smooth,
+                 mesh_data.face_materials,
+                 mesh_data.material_names]
+        for name, uvs in mesh_data.uv_layers:
+            items.extend((name, uvs))
+        for name, colors in mesh_data.color_layers:
+            items.extend((name, colors))
+
+        return items
+
+    def __get_cached_fragment(self, key, tag_name):
+        text = self.__fragment_cache.get(key)
+        if text is None:
+            return None
+
+        return utils.XmlFragment(tag_name, text.decode('utf-8'))
+
+    def __store_fragment(self, key, node):
+        text = utils.element_to_string(node, self.__indent)
+        self.__fragment_cache.put(key, text.encode('utf-8'))
+
+    def __add_dedup_statistics(self, name, statistics, dedup_statistics):
+        if not statistics:
+            return
+
+        for entry_name, old_count, new_count in statistics:
+            old_total, new_total = dedup_statistics.get(entry_name, (0, 0))
+            dedup_statistics[entry_name] = (old_total + old_count,
+                                            new_total + new_count)
+
+        cbPrint("Deduplication of {!r}: {}".format(name,
+                self.__format_shrinkage(
+                    (entry_name, (old_count, new_count))
+                    for entry_name, old_count, new_count in statistics)))
+
+    def __format_shrinkage(self, statistics):
+        entries = []
+        for name, (old_count, new_count) in statistics:
+            shrinkage = 100.0 * (old_count - new_count) / max(old_count, 1)
+            entries.append("{} {:d} -> {:d} (-{:.1f}%)".format(
+                           name, old_count, new_count, shrinkage))
+
+        return ", ".join(entries)
 
     def __export_library_controllers(self, parent_element):
         library_node = self.__doc.createElement("library_controllers")
@@ -616,7 +1238,33 @@ class CrytekDaeExporter:
         parent_element.appendChild(library_node)
 
     def __process_bones(self, parent_node, object_, armature):
-        mesh = object_.data
+        bones = utils.get_bones(armature)
+        bone_names = [bone.name for bone in bones]
+        bone_matrices = self.__get_bone_matrices(bones)
+        weights, weights_per_vertex, vertex_weights = \
+            self.__get_bone_weights(object_, bone_names)
+
+        key = None
+        if self.__fragment_cache is not None:
+            key = cache.hash_items("controller",
+                                   self.__config.cryblend_version,
+                                   self.__number_format.trim_zeros,
+                                   self.__indent,
+                                   armature.name,
+                                   object_.name,
+                                   self.__get_geometry_id(object_),
+                                   bone_names,
+                                   bone_matrices,
+                                   weights,
+                                   weights_per_vertex,
+                                   vertex_weights)
+            fragment = self.__get_cached_fragment(key, "controller")
+            if fragment is not None:
+                cbPrint("Reused cached controller of {!r}.".format(
+                        object_.name))
+                parent_node.appendChild(fragment)
+                return
+
         id_ = "{!s}_{!s}".format(armature.name, object_.name)
 
         controller_node = self.__doc.createElement("controller")
@@ -624,16 +1272,19 @@ class CrytekDaeExporter:
 
         controller_node.setAttribute("id", id_)
         skin_node = self.__doc.createElement("skin")
-        skin_node.setAttribute("source", "#%s" % object_.name)
+        skin_node.setAttribute("source",
+                               "#%s" % self.__get_geometry_id(object_))
         controller_node.appendChild(skin_node)
 
         bind_shape_matrix = self.__doc.createElement("bind_shape_matrix")
         utils.write_matrix(Matrix(), bind_shape_matrix)
         skin_node.appendChild(bind_shape_matrix)
 
-        self.__process_bone_joints(object_, armature, skin_node)
-        self.__process_bone_matrices(object_, armature, skin_node)
-        self.__process_bone_weights(object_, armature, skin_node)
+        self.__process_bone_joints(object_, armature, skin_node, bone_names)
+        self.__process_bone_matrices(object_, armature, skin_node,
+                                     bone_matrices)
+        self.__process_bone_weights(object_, armature, skin_node, weights,
+                                    weights_per_vertex, vertex_weights)
 
         joints = self.__doc.createElement("joints")
         input = utils.write_input(id_, None, "joints", "JOINT")
@@ -642,11 +1293,46 @@ class CrytekDaeExporter:
         joints.appendChild(input)
         skin_node.appendChild(joints)
 
-    def __process_bone_joints(self, object_, armature, skin_node):
+        if key is not None:
+            self.__store_fragment(key, controller_node)
 
-        bones = utils.get_bones(armature)
+    def __get_bone_matrices(self, bones):
+        bone_matrices = array('d')
+        for bone in bones:
+            fakebone = utils.find_fakebone(bone.name)
+            if fakebone is None:
+                return None
+            matrix_local = copy.deepcopy(fakebone.matrix_local)
+            utils.negate_z_axis_of_matrix(matrix_local)
+            bone_matrices.extend(utils.matrix_to_array(matrix_local))
+
+        return bone_matrices
+
+    def __get_bone_weights(self, object_, bone_names):
+        # joint ids of every vertex group, groups without a bone have none
+        group_joints = {}
+        for vertex_group in object_.vertex_groups:
+            group_joints[vertex_group.index] = [
+                bone_id for bone_id, bone_name in enumerate(bone_names)
+                if bone_name == vertex_group.name]
+
+        weights = array('d')
+        weights_per_vertex = array('i')
+        vertex_weights = array('i')
+
+        for vertex in object_.data.vertices:
+            for group in vertex.groups:
+                vertex_weights.extend(group_joints.get(group.group, ()))
+                vertex_weights.append(len(weights))
+                weights.append(group.weight)
+
+            weights_per_vertex.append(len(vertex.groups))
+
+        return weights, weights_per_vertex, vertex_weights
+
+    def __process_bone_joints(self, object_, armature, skin_node,
+                              bone_names):
         id_ = "{!s}_{!s}-joints".format(armature.name, object_.name)
-        bone_names = [bone.name for bone in bones]
         source = utils.write_source(id_,
                                     "IDREF",
                                     bone_names,
@@ -654,76 +1340,54 @@ class CrytekDaeExporter:
                                     self.__doc)
         skin_node.appendChild(source)
 
-    def __process_bone_matrices(self, object_, armature, skin_node):
-        
-        bones = utils.get_bones(armature)
-        bone_matrices = []
-        for bone in bones:
-            fakebone = utils.find_fakebone(bone.name)
-            if fakebone is None:
-                return
-            matrix_local = copy.deepcopy(fakebone.matrix_local)
-            utils.negate_z_axis_of_matrix(matrix_local)
-            bone_matrices.extend(utils.matrix_to_array(matrix_local))
+    def __process_bone_matrices(self, object_, armature, skin_node,
+                                bone_matrices):
+        if bone_matrices is None:
+            return
 
         id_ = "{!s}_{!s}-matrices".format(armature.name, object_.name)
+        trim_zeros = self.__number_format.trim_zeros
         source = utils.write_source(id_,
                                     "float4x4",
                                     bone_matrices,
                                     [],
-                                    self.__doc)
+                                    self.__doc,
+                                    trim_zeros=trim_zeros)
         skin_node.appendChild(source)
 
-    def __process_bone_weights(self, object_, armature, skin_node):
-
-        bones = utils.get_bones(armature)
-        group_weights = []
-        vw = ""
-        vertex_groups_lengths = ""
-        vertex_count = 0
-
-        for vertex in object_.data.vertices:
-            for group in vertex.groups:
-                group_weights.append(group.weight)
-                for vertex_group in object_.vertex_groups:
-                    if vertex_group.index == group.group:
-                        for bone_id, bone in enumerate(bones):
-                            if bone.name == vertex_group.name:
-                                vw += "%s " % bone_id
-
-                vw += "%s " % vertex_count
-                vertex_count += 1
-
-            vertex_groups_lengths += "%s " % len(vertex.groups)
-
+    def __process_bone_weights(self, object_, armature, skin_node, weights,
+                               weights_per_vertex, vertex_weights):
         id_ = "{!s}_{!s}-weights".format(armature.name, object_.name)
+        trim_zeros = self.__number_format.trim_zeros
         source = utils.write_source(id_,
                                     "float",
-                                    group_weights,
+                                    weights,
                                     [],
-                                    self.__doc)
+                                    self.__doc,
+                                    trim_zeros=trim_zeros)
         skin_node.appendChild(source)
 
-        vertex_weights = self.__doc.createElement("vertex_weights")
-        vertex_weights.setAttribute("count", str(len(object_.data.vertices)))
+        vertex_weights_node = self.__doc.createElement("vertex_weights")
+        vertex_weights_node.setAttribute("count",
+                                         str(len(object_.data.vertices)))
 
         id_ = "{!s}_{!s}".format(armature.name, object_.name)
         input = utils.write_input(id_, 0, "joints", "JOINT")
-        vertex_weights.appendChild(input)
+        vertex_weights_node.appendChild(input)
         input = utils.write_input(id_, 1, "weights", "WEIGHT")
-        vertex_weights.appendChild(input)
+        vertex_weights_node.appendChild(input)
 
         vcount = self.__doc.createElement("vcount")
-        vcount_text = self.__doc.createTextNode(vertex_groups_lengths)
+        vcount_text = geometry_writer.ints_to_text(weights_per_vertex)
         vcount.appendChild(vcount_text)
-        vertex_weights.appendChild(vcount)
+        vertex_weights_node.appendChild(vcount)
 
         v = self.__doc.createElement("v")
-        v_text = self.__doc.createTextNode(vw)
+        v_text = geometry_writer.ints_to_text(vertex_weights)
         v.appendChild(v_text)
-        vertex_weights.appendChild(v)
+        vertex_weights_node.appendChild(v)
 
-        skin_node.appendChild(vertex_weights)
+        skin_node.appendChild(vertex_weights_node)
 
     def __export_library_animation_clips_and_animations(self, parent_element):
         libanmcl = self.__doc.createElement("library_animation_clips")
@@ -936,9 +1600,8 @@ class CrytekDaeExporter:
         node.setAttribute("id", nodename)
         node.setIdAttribute("id")
 
-        bpy.ops.mesh.primitive_cube_add(location=(0, 0, 0))
-        self.__write_transforms(bpy.context.active_object, node)
-        bpy.ops.object.delete(use_global=False)
+        self.__write_transform_values((0.0, 0.0, 0.0), (0.0, 0.0, 0.0),
+                                      (1.0, 1.0, 1.0), node)
 
         root_objects = []
         for object_ in group.objects:
@@ -970,6 +1633,13 @@ class CrytekDaeExporter:
                 if extra is not None:
                     node.appendChild(extra)
 
+                lod_geometry_ids = self.__lod_geometry_ids.get(object_.name,
+                                                               [])
+                for level, geometry_id in enumerate(lod_geometry_ids, 1):
+                    lod_node = self.__create_lod_node(object_, level,
+                                                      geometry_id)
+                    node.appendChild(lod_node)
+
                 nodeparent.appendChild(node)
 
             if object_.children:
@@ -1006,10 +1676,34 @@ class CrytekDaeExporter:
             if object_.children:
                 self.__write_bone_list(bone.children, object_, node, root)
 
+    def __create_lod_node(self, object_, level, geometry_id):
+        node = self.__doc.createElement("node")
+        node.setAttribute("id", utils.get_lod_name(object_.name, level))
+        node.setIdAttribute("id")
+
+        # placed by the parent node, the object itself
+        self.__write_transform_values((0.0, 0.0, 0.0), (0.0, 0.0, 0.0),
+                                      (1.0, 1.0, 1.0), node)
+
+        instance = self.__doc.createElement("instance_geometry")
+        instance.setAttribute("url", "#{!s}".format(geometry_id))
+        bind_material = self.__create_bind_material(object_)
+        instance.appendChild(bind_material)
+        node.appendChild(instance)
+
+        return node
+
     def __write_transforms(self, object_, node):
-        trans = self.__create_translation_node(object_)
-        rotx, roty, rotz = self.__create_rotation_node(object_)
-        scale = self.__create_scale_node(object_)
+        self.__write_transform_values(object_.location,
+                                      object_.rotation_euler,
+                                      object_.scale,
+                                      node)
+
+    def __write_transform_values(self, location, rotation_euler, scale_,
+                                 node):
+        trans = self.__create_translation_node(location)
+        rotx, roty, rotz = self.__create_rotation_node(rotation_euler)
+        scale = self.__create_scale_node(scale_)
 
         node.appendChild(trans)
         node.appendChild(rotx)
@@ -1017,19 +1711,19 @@ class CrytekDaeExporter:
         node.appendChild(rotz)
         node.appendChild(scale)
 
-    def __create_translation_node(self, object_):
+    def __create_translation_node(self, location):
         trans = self.__doc.createElement("translate")
         trans.setAttribute("sid", "translation")
         trans_text = self.__doc.createTextNode("{:f} {:f} {:f}".format(
-                                                    * object_.location))
+                                                    * location))
         trans.appendChild(trans_text)
 
         return trans
 
-    def __create_rotation_node(self, object_):
-        rotx = self.__write_rotation("X", "1 0 0 {:f}", object_.rotation_euler[0])
-        roty = self.__write_rotation("Y", "0 1 0 {:f}", object_.rotation_euler[1])
-        rotz = self.__write_rotation("Z", "0 0 1 {:f}", object_.rotation_euler[2])
+    def __create_rotation_node(self, rotation_euler):
+        rotx = self.__write_rotation("X", "1 0 0 {:f}", rotation_euler[0])
+        roty = self.__write_rotation("Y", "0 1 0 {:f}", rotation_euler[1])
+        rotz = self.__write_rotation("Z", "0 0 1 {:f}", rotation_euler[2])
 
         return rotx, roty, rotz
 
@@ -1042,11 +1736,11 @@ class CrytekDaeExporter:
 
         return rot
 
-    def __create_scale_node(self, object_):
+    def __create_scale_node(self, scale_):
         scale = self.__doc.createElement("scale")
         scale.setAttribute("sid", "scale")
         scale_text = self.__doc.createTextNode(
-                    utils.floats_to_string(object_.scale, " ", "%s"))
+                    utils.floats_to_string(scale_, " ", "%s"))
         scale.appendChild(scale_text)
 
         return scale
@@ -1062,7 +1756,8 @@ class CrytekDaeExporter:
                                         object_.name))
         elif object_.name[:6] != "_joint" and object_.type == "MESH":
             instance = self.__doc.createElement("instance_geometry")
-            instance.setAttribute("url", "#{!s}".format(object_.name))
+            instance.setAttribute("url", "#{!s}".format(
+                                        self.__get_geometry_id(object_)))
 
         if instance is not None:
             bind_material = self.__create_bind_material(object_)
@@ -1112,7 +1807,7 @@ class CrytekDaeExporter:
             if not node.rna_type.id_data.items():
                 return
         for prop in node.rna_type.id_data.items():
-            if prop:
+            if prop and prop[0] != utils.LOD_RATIOS_PROPERTY:
                 user_defined_property = self.__doc.createTextNode("{!s}".format(prop[1]))
                 properties.appendChild(user_defined_property)
         technique.appendChild(properties)
@@ -1185,55 +1880,652 @@ class CrytekDaeExporter:
         parent_element.appendChild(scene)
 
 
-def write_to_file(config, doc, filepath, exe):
-    xml_string = doc.toprettyxml(indent="    ")
-    file = open(filepath, "w")
-    file.write(xml_string)
-    file.close()
+class DeferredGeometry:
+    '''Stands for a <geometry> in a recorded document until it is written
+    from 'job'.
+    '''
+
+    def __init__(self, job, key):
+        self.job = job
+        self.key = key
+        self.node = None
+
+
+class ExportProgress:
+    '''The stage of an export and how far into it the export is, for the
+    export operator while the export runs on another thread. cancel()
+    stops the export at its next check_cancelled(). Time spent in every
+    stage and reports of the RC runs are gathered for the export log.
+    '''
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__stage = ""
+        self.__done = 0
+        self.__total = 0
+        self.__stage_start_time = None
+        # [stage, seconds] in the order of their first start
+        self.__stage_times = []
+        self.__rc_reports = []
+        self.cancel_event = threading.Event()
+
+    def start_stage(self, stage, total=0):
+        with self.__lock:
+            self.__end_stage()
+            self.__stage = stage
+            self.__done = 0
+            self.__total = total
+            self.__stage_start_time = time.time()
+
+    def finish(self):
+        with self.__lock:
+            self.__end_stage()
+            self.__stage = ""
+            self.__stage_start_time = None
+
+    def __end_stage(self):
+        if self.__stage_start_time is None:
+            return
+
+        seconds = time.time() - self.__stage_start_time
+        for stage_time in self.__stage_times:
+            if stage_time[0] == self.__stage:
+                stage_time[1] += seconds
+                break
+        else:
+            self.__stage_times.append([self.__stage, seconds])
+
+    def get_stage_times(self):
+        with self.__lock:
+            return [tuple(stage_time) for stage_time in self.__stage_times]
+
+    def add_rc_report(self, report):
+        with self.__lock:
+            self.__rc_reports.append(report)
+
+    def get_rc_reports(self):
+        with self.__lock:
+            return list(self.__rc_reports)
+
+    def advance(self, count=1):
+        with self.__lock:
+            self.__done += count
+
+    def get_state(self):
+        '''Returns the stage, the work done in it and all of its work.'''
+        with self.__lock:
+            return self.__stage, self.__done, self.__total
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.is_cancelled():
+            raise exceptions.ExportCancelledException()
+
+
+class BackgroundExport:
+    '''Runs an export for a modal operator. step() works with Blender
+    data a slice of time at a time on the main thread, then the DAEs are
+    written and RC is run on a worker thread. 'node_names' limits the
+    export to these export nodes.
+    '''
+
+    def __init__(self, config, node_names=None):
+        # prevent wasting time for exporting if RC was not found
+        if not os.path.isfile(config.rc_path):
+            raise exceptions.NoRcSelectedException
+
+        self.progress = ExportProgress()
+        self.__exporter = CrytekDaeExporter(config, self.progress)
+        self.__steps = self.__exporter.export_in_steps(node_names)
+        self.__thread = None
+        self.__error = None
+        _add_export_in_steps(self)
+
+    def step(self, time_slice):
+        '''Works for about 'time_slice' seconds if Blender data is still
+        needed. Returns False once the export is over.
+        '''
+        if self.__steps is None:
+            return self.__thread is not None and self.__thread.is_alive()
+
+        end_time = time.time() + time_slice
+        try:
+            next(self.__steps)
+            while time.time() < end_time:
+                next(self.__steps)
+
+        except StopIteration:
+            self.__end_steps()
+            self.progress.start_stage("Writing DAE")
+            self.__thread = threading.Thread(target=self.__write)
+            self.__thread.start()
+
+        except Exception as exception:
+            self.__end_steps()
+            self.__error = exception
+            return False
+
+        return True
+
+    def cancel(self):
+        self.progress.cancel()
+        if self.__steps is not None:
+            # the steps restore the scene on the way out
+            self.__steps.close()
+            self.__end_steps()
+            self.__error = exceptions.ExportCancelledException()
+
+    def get_error(self):
+        return self.__error
+
+    def get_summary(self):
+        return self.__exporter.get_summary()
+
+    def __write(self):
+        try:
+            self.__exporter.write_exported()
+        except Exception as exception:
+            self.__error = exception
+
+    def __end_steps(self):
+        self.__steps = None
+        _remove_export_in_steps(self)
 
-    dae_path = utils.get_absolute_path_for_rc(filepath)
-    rc_params = ["/verbose", "/threads=processors", "/refresh"]
 
-    if not config.disable_rc:
-        if config.do_materials:
-            rc_params.append("/createmtl=1")
+def _add_export_in_steps(background_export):
+    if not _exports_in_steps:
+        bpy.app.handlers.undo_pre.append(_on_undo_or_load)
+        bpy.app.handlers.load_pre.append(_on_undo_or_load)
+    _exports_in_steps.append(background_export)
 
-        rc_process = utils.run_rc(exe, dae_path, rc_params)
 
-        if rc_process is not None:
-            rc_process.wait()
-            components = dae_path.split("\\")
-            name = components[len(components)-1]
-            output_path = dae_path[:-len(name)]
-            for group in utils.get_export_nodes():
-                node_type = utils.get_node_type(group.name)
-                allowed = {"cgf", "cga", "chr", "skin"}
-                if node_type in allowed:
-                    out_file = "{0}{1}".format(output_path,
-                                                group.name)
-                    args = [exe, "/refresh", "/vertexindexformat=u16", out_file]
-                    rc_second_pass = subprocess.Popen(args)
-
-        if config.do_materials:
-            mtl_fix_thread = threading.Thread(
-                target=fix_normalmap_in_mtls,
-                args=(rc_process, filepath)
-            )
-            mtl_fix_thread.start()
+def _remove_export_in_steps(background_export):
+    if background_export in _exports_in_steps:
+        _exports_in_steps.remove(background_export)
+    if not _exports_in_steps:
+        for handlers in (bpy.app.handlers.undo_pre,
+                         bpy.app.handlers.load_pre):
+            if _on_undo_or_load in handlers:
+                handlers.remove(_on_undo_or_load)
 
-    if not config.save_dae:
-        rcdone_path = "{}.rcdone".format(dae_path)
-        if os.path.exists(dae_path):
-            os.remove(dae_path)
-        if os.path.exists(rcdone_path):
-            os.remove(rcdone_path)
+
+@bpy.app.handlers.persistent
+def _on_undo_or_load(scene):
+    # the steps keep names between them, but undo and loading a file free
+    # the data they are in the middle of reading
+    for background_export in list(_exports_in_steps):
+        cbPrint("Export cancelled, undo or loading a file would change the "
+                "data it reads.", 'warning')
+        background_export.cancel()
+
+
+def run_steps_for_nodes(node_names, steps):
+    '''Runs the generator 'steps' with get_export_nodes() limited to the
+    export nodes named in 'node_names'. The limit is lifted while the
+    steps wait, other operators run in between.
+    '''
+    try:
+        while True:
+            with utils.export_only(node_names):
+                try:
+                    next(steps)
+                except StopIteration:
+                    return
+            yield
+
+    finally:
+        # a cancelled export restores the scene on the way out
+        with utils.export_only(node_names):
+            steps.close()
+
+
+def get_export_nodes_named(node_names):
+    with utils.export_only(node_names):
+        return utils.get_export_nodes()
+
+
+def get_removed_exception(kind, name):
+    return exceptions.CryBlendException(
+                "{} {!r} was removed during the export.".format(kind, name))
+
+
+def save_image_as_tiff(image_name, tiff_file_path):
+    '''Saves the image named 'image_name' as a TIFF. It is looked up when
+    the target runs, steps of the export may have passed since it was
+    added.
+    '''
+    image = bpy.data.images.get(image_name)
+    if image is None:
+        raise get_removed_exception("Image", image_name)
+
+    dds_converter.save_as_tiff(image, tiff_file_path)
+
+
+def get_number_format(config):
+    if not config.compact_output:
+        return geometry_writer.NumberFormat(config.exact_floats)
+
+    precisions = {
+        "positions": config.position_precision,
+        "normals": config.normal_precision,
+        "uvs": config.uv_precision,
+        "colors": config.color_precision,
+    }
+    return geometry_writer.NumberFormat(config.exact_floats, True, precisions)
+
+
+def get_indent(config):
+    if config.compact_output:
+        return ""
+
+    return "    "
+
+
+def process_dae(config, filepath, exe, progress=None):
+    process_node_daes(config,
+                      {filepath: get_rc_nodes(utils.get_export_nodes())},
+                      exe,
+                      get_rc_cache(config),
+                      progress)
 
     if config.make_layer:
+        write_layer(filepath)
+
+
+def get_node_dae_path(filepath, group):
+    # the node name in the file name keeps "a.cgf" and "a.chr" apart
+    return os.path.join(os.path.dirname(filepath), "{}.dae".format(group.name))
+
+
+def process_node_daes(config, dae_nodes, exe, rc_cache, progress=None):
+    '''Runs RC on the DAEs in 'dae_nodes', see run_rc_on_daes(), and
+    removes them unless they are to be saved. Returns the names of the
+    export nodes RC failed on.
+    '''
+    failed_nodes = run_rc_on_daes(config, dae_nodes, exe, rc_cache, progress)
+
+    if not config.save_dae:
+        for dae_path in dae_nodes:
+            remove_dae(utils.get_absolute_path(dae_path))
+
+    return failed_nodes
+
+
+def run_rc_on_daes(config, dae_nodes, exe, rc_cache, progress=None):
+    '''Runs RC on every DAE in 'dae_nodes', which maps DAE paths to the
+    RcNodes of the export nodes in them, then the second pass on the files
+    made for the nodes. Files are batched into at most 'config.rc_jobs' RC
+    runs per pass, which run in parallel. Returns the names of the export
+    nodes which failed.
+    '''
+    failed_nodes = []
+    if config.disable_rc or not dae_nodes:
+        return failed_nodes
+
+    if progress is None:
+        progress = ExportProgress()
+    progress.start_stage("Running RC")
+
+    rc_params, second_pass_params = get_rc_params(config)
+
+    keys = {}
+    queued_paths = []
+    for dae_path in sorted(dae_nodes):
+        if rc_cache is not None:
+            key = rc_cache.get_key(dae_path, exe,
+                                   [rc_params, second_pass_params])
+            directory = os.path.dirname(utils.get_absolute_path(dae_path))
+            file_names = rc_cache.restore(key, directory)
+            if file_names is not None:
+                cbPrint("Restored {} from the RC cache.".format(
+                        ", ".join(file_names)))
+                continue
+            keys[dae_path] = key
+
+        queued_paths.append(dae_path)
+
+    start_time = time.time()
+    batches = get_rc_batches(queued_paths, config.rc_jobs)
+    results, launches = run_rc_batches(config.rc_jobs, batches, dae_nodes,
+                                       exe, rc_params, second_pass_params,
+                                       progress)
+
+    # a failed batch does not tell which of its DAEs failed
+    retried_paths = []
+    if not progress.is_cancelled():
+        retried_paths = [dae_path for dae_paths in batches
+                         if len(dae_paths) > 1
+                         for dae_path in dae_paths if not results[dae_path]]
+    if retried_paths:
+        cbPrint("Running RC on the DAEs of failed batches one by one.",
+                'warning')
+        retried_results, retried_launches = run_rc_batches(
+                config.rc_jobs, [[dae_path] for dae_path in retried_paths],
+                dae_nodes, exe, rc_params, second_pass_params, progress)
+        results.update(retried_results)
+        launches += retried_launches
+
+    unbatched_launches = len(queued_paths) + len(
+        get_second_pass_files(queued_paths, dae_nodes))
+    if queued_paths:
+        cbPrint("RC batching: {:d} launches instead of {:d}, {:d} saved."
+                .format(launches, unbatched_launches,
+                        max(0, unbatched_launches - launches)))
+
+    for dae_path in queued_paths:
+        nodes = dae_nodes[dae_path]
+        if not results[dae_path]:
+            failed_nodes.extend(node.name for node in nodes)
+            continue
+
+        if dae_path in keys:
+            directory = os.path.dirname(utils.get_absolute_path(dae_path))
+            file_names = get_rc_output_names(directory, nodes, start_time)
+            if file_names:
+                rc_cache.store(keys[dae_path], directory, file_names)
+
+    if rc_cache is not None:
+        rc_cache.trim()
+        cbPrint("RC cache: {:d} restored, {:d} run.".format(rc_cache.hits,
+                                                           rc_cache.misses))
+
+    if config.do_materials and len(failed_nodes) < sum(
+            len(nodes) for nodes in dae_nodes.values()):
+        progress.start_stage("Fixing materials")
+        mtl_files = set()
+        for dae_path, nodes in dae_nodes.items():
+            directory = os.path.dirname(utils.get_absolute_path(dae_path))
+            mtl_files.update(get_node_mtl_files(
+                    directory, [node for node in nodes
+                                if node.name not in failed_nodes]))
+        fix_normalmap_in_mtls(sorted(mtl_files), config.rc_jobs)
+
+    return failed_nodes
+
+
+def get_rc_params(config):
+    '''Returns the parameters of the first and the second RC pass.'''
+    rc_params = ["/verbose", "/threads=processors", "/refresh"]
+    if config.do_materials:
+        rc_params.append("/createmtl=1")
+    second_pass_params = ["/refresh", "/vertexindexformat=u16"]
+
+    return rc_params, second_pass_params
+
+
+def add_rc_targets(graph, config, dae_target, dae_path, nodes, progress):
+    '''Adds the RC passes on the DAE of 'dae_target' and the normal map
+    fix of the MTLs RC makes for the RcNodes in 'nodes' to 'graph'.
+    Returns the targets.
+    '''
+    exe = config.rc_path
+    name = os.path.basename(dae_path)
+    directory = os.path.dirname(utils.get_absolute_path(dae_path))
+    rc_params, second_pass_params = get_rc_params(config)
+    node_files = [os.path.join(directory, node.name) for node in nodes
+                  if utils.get_node_type(node.name) in RC_SECOND_PASS_TYPES]
+
+    rc_target = graph.add("rc:{}".format(name),
+                          [cache.get_program_stamp(exe), rc_params],
+                          node_files,
+                          functools.partial(run_rc_job, exe,
+                                            [utils.get_absolute_path_for_rc(
+                                                dae_path)],
+                                            rc_params, progress),
+                          [dae_target])
+    targets = [rc_target]
+
+    if node_files:
+        targets.append(graph.add(
+                "rc2:{}".format(name),
+                [second_pass_params],
+                node_files,
+                functools.partial(run_rc_job, exe,
+                                  [utils.get_absolute_path_for_rc(node_file)
+                                   for node_file in node_files],
+                                  second_pass_params, progress),
+                [rc_target]))
+
+    if config.do_materials:
+        targets.append(graph.add(
+                "mtl:{}".format(name),
+                [],
+                [],
+                lambda: fix_normalmap_in_mtls(get_node_mtl_files(directory,
+                                                                 nodes)),
+                [rc_target]))
+
+    return targets
+
+
+def run_rc_job(exe, files, params, progress):
+    '''Runs RC once on 'files' and reports its output to 'progress'.
+    Raises CryBlendException if it fails.
+    '''
+    scheduler = rc_scheduler.RcScheduler(1,
+                                         cancel_event=progress.cancel_event)
+    list_files = []
+    try:
+        job = add_rc_job(scheduler, exe, files, params, list_files)
+        scheduler.run()
+
+    finally:
+        for list_file in list_files:
+            os.remove(list_file)
+
+    report_rc_jobs([job], {job: files}, progress)
+    if job.state == rc_scheduler.CANCELLED:
+        raise exceptions.ExportCancelledException()
+    if job.state != rc_scheduler.SUCCEEDED:
+        if job.error is not None:
+            reason = job.error
+        else:
+            reason = "exit code {:d}".format(job.return_code)
+        raise exceptions.CryBlendException("RC failed on {!r}: {}".format(
+                                           job.name, reason))
+
+
+def get_rc_batches(dae_paths, batch_count):
+    '''Splits 'dae_paths' into at most 'batch_count' lists of about the
+    same length.
+    '''
+    batch_count = min(batch_count, len(dae_paths))
+    return [dae_paths[index::batch_count] for index in range(batch_count)]
+
+
+def get_second_pass_files(dae_paths, dae_nodes):
+    files = []
+    for dae_path in dae_paths:
+        directory = os.path.dirname(utils.get_absolute_path(dae_path))
+        for node in dae_nodes[dae_path]:
+            if utils.get_node_type(node.name) in RC_SECOND_PASS_TYPES:
+                files.append(utils.get_absolute_path_for_rc(
+                                os.path.join(directory, node.name)))
+
+    return files
+
+
+def run_rc_batches(max_jobs, batches, dae_nodes, exe, rc_params,
+                   second_pass_params, progress):
+    '''Runs both RC passes on every batch of DAE paths. Returns whether
+    each DAE succeeded and how many times RC was started.
+    '''
+    scheduler = rc_scheduler.RcScheduler(
+                    max_jobs,
+                    cancel_event=progress.cancel_event,
+                    on_finished=lambda job: progress.advance())
+    list_files = []
+    batch_jobs = []
+    # job: the files it runs on
+    job_files = {}
+    try:
+        for dae_paths in batches:
+            dae_files = [utils.get_absolute_path_for_rc(dae_path)
+                         for dae_path in dae_paths]
+            dae_job = add_rc_job(scheduler, exe, dae_files, rc_params,
+                                 list_files)
+            job_files[dae_job] = dae_files
+            jobs = [dae_job]
+
+            second_pass_files = get_second_pass_files(dae_paths, dae_nodes)
+            if second_pass_files:
+                second_pass_job = add_rc_job(scheduler, exe,
+                                             second_pass_files,
+                                             second_pass_params, list_files,
+                                             [dae_job])
+                job_files[second_pass_job] = second_pass_files
+                jobs.append(second_pass_job)
+            batch_jobs.append((dae_paths, jobs))
+
+        progress.start_stage("Running RC", len(scheduler.jobs))
+        scheduler.run()
+
+    finally:
+        for list_file in list_files:
+            os.remove(list_file)
+
+    scheduler.print_summary()
+    report_rc_jobs(scheduler.jobs, job_files, progress)
+
+    results = {}
+    for dae_paths, jobs in batch_jobs:
+        succeeded = all(job.state == rc_scheduler.SUCCEEDED for job in jobs)
+        for dae_path in dae_paths:
+            results[dae_path] = succeeded
+
+    return results, len(scheduler.jobs)
+
+
+def report_rc_jobs(jobs, job_files, progress):
+    '''Prints the messages of the RcJobs in 'jobs' which ran and adds
+    their reports to 'progress'. 'job_files' maps them to their files.
+    '''
+    for job in jobs:
+        if job.state in (rc_scheduler.SKIPPED, rc_scheduler.PENDING):
+            continue
+        report = export_log.get_job_report(job, job_files[job])
+        print_rc_messages(report)
+        progress.add_rc_report(report)
+
+
+def print_rc_messages(report):
+    for file_report in [report] + report["files"]:
+        name = file_report.get("file", report["name"])
+        for error in file_report["errors"]:
+            cbPrint("RC on {!r}: {}".format(name, error), 'error')
+        if file_report["warnings"]:
+            cbPrint("RC on {!r}: {:d} warnings, see the export log.".format(
+                    name, len(file_report["warnings"])), 'warning')
+
+
+def add_rc_job(scheduler, exe, files, params, list_files, depends_on=()):
+    '''Queues one RC run on all 'files'. They are passed in a list file
+    if the command line would get too long, its path is added to
+    'list_files'.
+    '''
+    names = [os.path.basename(file_name) for file_name in files]
+    if len(names) > 1:
+        name = "{} and {:d} more".format(names[0], len(names) - 1)
+    else:
+        name = names[0]
+
+    command = utils.get_rc_command(exe, files, params)
+    if len(subprocess.list2cmdline(command)) > MAX_COMMAND_LENGTH:
+        descriptor, list_file = tempfile.mkstemp(prefix="CryBlend-",
+                                                 suffix=".txt")
+        with os.fdopen(descriptor, "w") as listing:
+            listing.write("\n".join(files) + "\n")
+        list_files.append(list_file)
+
+        list_param = "/listfile={}".format(
+                                utils.get_absolute_path_for_rc(list_file))
+        command = utils.get_rc_command(exe, [], params + [list_param])
+
+    return scheduler.add(name, command, depends_on)
+
+
+def get_rc_cache(config):
+    if not config.rc_cache:
+        return None
+
+    if config.rc_cache_directory:
+        directory = utils.get_absolute_path(config.rc_cache_directory)
+    else:
+        directory = utils.get_cache_directory("rc")
+
+    return cache.RcOutputCache(directory,
+                               config.rc_cache_size * 1024 * 1024)
+
+
+class RcNode:
+    '''What RC needs to know of an export node. It is read from Blender
+    beforehand, RC may run on another thread.
+    '''
+
+    def __init__(self, group):
+        self.name = group.name
+        # RC names its files after the export nodes and material libraries
+        self.output_stems = {utils.get_node_name(group.name)}
+        for object_ in group.objects:
+            for material_slot in object_.material_slots:
+                if material_slot.material is None:
+                    continue
+                properties = utils.extract_cryblend_properties(
+                                                    material_slot.material.name)
+                if properties is not None:
+                    self.output_stems.add(properties["ExportNode"])
+
+
+def get_rc_nodes(groups):
+    return [RcNode(group) for group in groups]
+
+
+def report_failed_nodes(failed_nodes, node_count):
+    if failed_nodes:
+        cbPrint("{:d} of {:d} export nodes failed: {}".format(
+                len(failed_nodes), node_count,
+                ", ".join(sorted(failed_nodes))), 'warning')
+
+
+def get_rc_output_names(directory, nodes, start_time):
+    '''Returns the names of the files RC made in 'directory' for the
+    RcNodes in 'nodes' since 'start_time'.
+    '''
+    stems = set()
+    for node in nodes:
+        stems.update(node.output_stems)
+
+    file_names = []
+    for file_name in os.listdir(directory):
+        stem, extension = os.path.splitext(file_name)
+        if stem in stems and extension.lower() in RC_OUTPUT_EXTENSIONS:
+            mtime = os.path.getmtime(os.path.join(directory, file_name))
+            if mtime >= start_time - MTIME_RESOLUTION:
+                file_names.append(file_name)
+
+    return sorted(file_names)
+
+
+def remove_dae(dae_path):
+    rcdone_path = "{}.rcdone".format(dae_path)
+    if os.path.exists(dae_path):
+        os.remove(dae_path)
+    if os.path.exists(rcdone_path):
+        os.remove(rcdone_path)
+
+
+def write_layer(filepath, layer=None):
+    if layer is None:
         layer = make_layer(filepath)
-        lyr_file_name = os.path.splitext(filepath)[0] + ".lyr"
-        file = open(lyr_file_name, 'w')
-        file.write(layer)
-        file.close()
+    lyr_file_name = os.path.splitext(filepath)[0] + ".lyr"
+    file = open(lyr_file_name, 'w')
+    file.write(layer)
+    file.close()
 
 
 def write_scripts(config, filepath):
@@ -1351,38 +2643,60 @@ def make_layer(fname):
     return layerDoc.toprettyxml(indent="  ")
 
 
-def fix_normalmap_in_mtls(rc_process, dae_file):
-    SUCCESS = 0
+def get_node_mtl_files(directory, nodes):
+    '''Returns the paths of the MTL files in 'directory' which RC made for
+    the RcNodes in 'nodes', other MTLs in a shared directory are left alone.
+    '''
+    mtl_files = []
+    for node in nodes:
+        for stem in node.output_stems:
+            mtl_file_name = os.path.join(directory, "{}.mtl".format(stem))
+            if os.path.isfile(mtl_file_name):
+                mtl_files.append(mtl_file_name)
 
-    return_code = rc_process.wait()
+    return mtl_files
 
-    if return_code == SUCCESS:
-        export_directory = os.path.dirname(dae_file)
 
-        mtl_files = utils.get_mtl_files_in_directory(export_directory)
+def fix_normalmap_in_mtls(mtl_files, max_jobs=1):
+    '''Fixes the files in 'mtl_files' with up to 'max_jobs' threads, which
+    are joined before it returns. Returns the number of files changed.
+    '''
+    with ThreadPoolExecutor(max_workers=max(1, max_jobs)) as executor:
+        futures = [(mtl_file_name,
+                    executor.submit(fix_normalmap_in_mtl, mtl_file_name))
+                   for mtl_file_name in mtl_files]
 
-        for mtl_file_name in mtl_files:
-            fix_normalmap_in_mtl(mtl_file_name)
+    fixed_count = 0
+    for mtl_file_name, future in futures:
+        try:
+            if future.result():
+                fixed_count += 1
+        except (IOError, OSError) as exception:
+            cbPrint("Could not fix the normal maps in {}: {}".format(
+                    mtl_file_name, exception), 'error')
+
+    cbPrint("Fixed normal maps in {:d} of {:d} MTL files.".format(
+            fixed_count, len(mtl_files)), 'debug')
+    return fixed_count
 
 
 def fix_normalmap_in_mtl(mtl_file_name):
+    '''Returns whether 'mtl_file_name' had to be changed.'''
     TMP_FILE_SUFFIX = ".tmp"
-    BAD_TAG_NAME = "<Texture Map=\"NormalMap\" File=\""
-    GOOD_TAG_NAME = "<Texture Map=\"Bumpmap\" File=\""
-
-    tmp_mtl_file_name = mtl_file_name + TMP_FILE_SUFFIX
-    mtl_old_file = open(mtl_file_name, "r")
-    mtl_new_file = open(tmp_mtl_file_name, "w")
+    BAD_TAG_NAME = b"<Texture Map=\"NormalMap\" File=\""
+    GOOD_TAG_NAME = b"<Texture Map=\"Bumpmap\" File=\""
 
-    for line in mtl_old_file:
-        line = line.replace(BAD_TAG_NAME, GOOD_TAG_NAME)
-        mtl_new_file.write(line)
+    with open(mtl_file_name, "rb") as mtl_old_file:
+        content = mtl_old_file.read()
+    if BAD_TAG_NAME not in content:
+        return False
 
-    mtl_old_file.close()
-    mtl_new_file.close()
+    tmp_mtl_file_name = mtl_file_name + TMP_FILE_SUFFIX
+    with open(tmp_mtl_file_name, "wb") as mtl_new_file:
+        mtl_new_file.write(content.replace(BAD_TAG_NAME, GOOD_TAG_NAME))
 
-    os.remove(mtl_file_name)
-    os.rename(tmp_mtl_file_name, mtl_file_name)
+    os.replace(tmp_mtl_file_name, mtl_file_name)
+    return True
 
 
 def save(config):
@@ -1391,7 +2705,11 @@ def save(config):
         raise exceptions.NoRcSelectedException
 
     exporter = CrytekDaeExporter(config)
-    exporter.export()
+    with utils.OperatorCounter() as operator_counter:
+        exporter.export()
+    cbPrint(operator_counter.get_report())
+
+    return exporter.get_summary()
 
 
 def menu_function_export(self, context):
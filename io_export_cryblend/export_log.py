@@ -0,0 +1,137 @@
+#------------------------------------------------------------------------------
+# Name:        export_log.py
+# Purpose:     Reads warnings, errors and file times from RC output and
+#              writes them with the export stage times to a JSON log
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from datetime import datetime
+import json
+import os
+import re
+
+
+# RC puts the time and "W:" or "E:" in front of its log lines, older
+# versions write the word
+WARNING_PATTERN = re.compile(r"^\s*(?:\d+:\d+\s+)?(?:W:|warning\b)",
+                             re.IGNORECASE)
+ERROR_PATTERN = re.compile(r"^\s*(?:\d+:\d+\s+)?(?:E:|error\b)",
+                           re.IGNORECASE)
+
+LOG_EXTENSION = ".rclog.json"
+
+
+def get_job_report(job, files):
+    '''Returns what is known of the finished RcJob 'job' which ran on the
+    paths in 'files', as a dictionary for the log.
+
+    RC works through its files one by one: a file's time runs from the
+    first output line naming it to the first line naming another file.
+    Warnings and errors count for the file named last before them.
+    '''
+    file_reports = []
+    reports_by_name = {}
+    for file_path in files:
+        name = os.path.basename(file_path)
+        report = {"file": name, "time": None, "warnings": [], "errors": []}
+        file_reports.append(report)
+        reports_by_name[name] = report
+    # "a.chr" is in "a.chr.dae" as well, the longest name wins
+    names = sorted(reports_by_name, key=len, reverse=True)
+
+    job_report = {"name": job.name,
+                  "command": list(job.command),
+                  "state": job.state.lower(),
+                  "return_code": job.return_code,
+                  "time": None,
+                  "files": file_reports,
+                  "warnings": [],
+                  "errors": [],
+                  "output": [[round(seconds, 3), stream, text]
+                             for seconds, stream, text in job.output]}
+
+    current = None
+    current_start = 0.0
+    for seconds, stream, text in job.output:
+        named = _find_name(text, names)
+        if named is not None and reports_by_name[named] is not current:
+            _add_time(current, seconds - current_start)
+            current = reports_by_name[named]
+            current_start = seconds
+
+        target = current if current is not None else job_report
+        if ERROR_PATTERN.match(text):
+            target["errors"].append(text)
+        elif WARNING_PATTERN.match(text):
+            target["warnings"].append(text)
+
+    if job.wall_time is not None:
+        _add_time(current, job.wall_time - current_start)
+        job_report["time"] = round(job.wall_time, 3)
+    for file_report in file_reports:
+        if file_report["time"] is not None:
+            file_report["time"] = round(file_report["time"], 3)
+
+    return job_report
+
+
+def _find_name(text, names):
+    for name in names:
+        if name in text:
+            return name
+
+    return None
+
+
+def _add_time(file_report, seconds):
+    if file_report is not None:
+        file_report["time"] = (file_report["time"] or 0.0) + seconds
+
+
+def get_log_path(filepath):
+    return os.path.splitext(filepath)[0] + LOG_EXTENSION
+
+
+def write_log(log_path, stage_times, job_reports):
+    log = {"created": datetime.now().replace(microsecond=0).isoformat(),
+           "stages": [{"stage": stage, "time": round(seconds, 3)}
+                      for stage, seconds in stage_times],
+           "rc_jobs": job_reports}
+
+    with open(log_path, "w") as log_file:
+        json.dump(log, log_file, indent=2)
+        log_file.write("\n")
+
+
+def get_summary(job_reports, log_path):
+    '''Returns one line about the RC runs in 'job_reports' for the UI.'''
+    rc_time = 0.0
+    warnings = 0
+    errors = 0
+    slowest = None
+    for job_report in job_reports:
+        rc_time += job_report["time"] or 0.0
+        warnings += len(job_report["warnings"])
+        errors += len(job_report["errors"])
+        for file_report in job_report["files"]:
+            warnings += len(file_report["warnings"])
+            errors += len(file_report["errors"])
+            if file_report["time"] is not None and (
+                    slowest is None or file_report["time"] > slowest["time"]):
+                slowest = file_report
+
+    summary = "RC ran {:d} times for {:.1f} sec: {:d} warnings, {:d} " \
+              "errors.".format(len(job_reports), rc_time, warnings, errors)
+    if slowest is not None:
+        summary += " Slowest {} took {:.1f} sec.".format(slowest["file"],
+                                                         slowest["time"])
+
+    return "{} Log: {}".format(summary, os.path.basename(log_path))
@@ -0,0 +1,437 @@
+#------------------------------------------------------------------------------
+# Name:        geometry.py
+# Purpose:     Mesh attribute snapshots and sources for the geometry export
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from array import array
+import math
+
+
+# Faces whose normals are closer than this angle (radians) are planar.
+PLANAR_ANGLE_TOLERANCE = 0.052
+
+
+class MeshData:
+    '''Flat snapshot of the tessellated mesh attributes the exporter uses.
+
+    Every stream is stored in a flat buffer, e.g. positions are kept as
+    x0 y0 z0 x1 y1 z1 ... and face corners are stored face after face.
+    '''
+
+    def __init__(self):
+        self.positions = array('f')
+        self.vertex_normals = array('f')
+        self.face_sizes = array('i')
+        self.face_vertices = array('i')
+        self.face_normals = array('f')
+        self.face_smooth = array('b')
+        self.face_materials = array('i')
+        # (name, buffer) pairs, 2 floats per corner for UVs
+        # and 3 floats per corner for colors.
+        self.uv_layers = []
+        self.color_layers = []
+        self.material_names = []
+
+    @property
+    def vertex_count(self):
+        return len(self.positions) // 3
+
+    @property
+    def face_count(self):
+        return len(self.face_sizes)
+
+    @property
+    def corner_count(self):
+        return len(self.face_vertices)
+
+
+def read_mesh(mesh, bulk=True):
+    '''Returns MeshData for a mesh with tessfaces already calculated.
+
+    The bulk reader pulls every attribute stream with a single foreach_get
+    call. The per-element reader walks the mesh one item at a time and is
+    kept to check the bulk reader against.
+    '''
+    if bulk:
+        return _read_mesh_bulk(mesh)
+    else:
+        return _read_mesh_per_element(mesh)
+
+
+def _foreach_get(collection, attribute, typecode, length):
+    buffer = _allocate(typecode, length)
+    if length:
+        collection.foreach_get(attribute, buffer)
+
+    return buffer
+
+
+def _read_mesh_bulk(mesh):
+    data = MeshData()
+    vertex_count = len(mesh.vertices)
+    face_count = len(mesh.tessfaces)
+
+    data.positions = _foreach_get(mesh.vertices, "co", 'f', vertex_count * 3)
+    data.vertex_normals = _foreach_get(mesh.vertices, "normal", 'f',
+                                       vertex_count * 3)
+
+    data.face_normals = _foreach_get(mesh.tessfaces, "normal", 'f',
+                                     face_count * 3)
+    data.face_smooth = _foreach_get(mesh.tessfaces, "use_smooth", 'b',
+                                    face_count)
+    data.face_materials = _foreach_get(mesh.tessfaces, "material_index", 'i',
+                                       face_count)
+
+    # Tessfaces always have 4 vertex slots. Triangles leave the last one
+    # at 0, quads are rotated by Blender so that it never is.
+    raw_vertices = _foreach_get(mesh.tessfaces, "vertices_raw", 'i',
+                                face_count * 4)
+    is_quad = [raw_vertices[index] != 0
+               for index in range(3, face_count * 4, 4)]
+    data.face_sizes = array('i', [4 if quad else 3 for quad in is_quad])
+    data.face_vertices = array('i', [
+        vertex for index, vertex in enumerate(raw_vertices)
+        if index & 3 != 3 or is_quad[index >> 2]])
+
+    for uv_layer in mesh.tessface_uv_textures:
+        raw_uvs = _foreach_get(uv_layer.data, "uv_raw", 'f', face_count * 8)
+        uvs = array('f', [
+            uv for index, uv in enumerate(raw_uvs)
+            if index & 7 < 6 or is_quad[index >> 3]])
+        data.uv_layers.append((uv_layer.name, uvs))
+
+    for color_layer in mesh.tessface_vertex_colors:
+        corner_colors = [_foreach_get(color_layer.data, name, 'f',
+                                      face_count * 3)
+                         for name in ("color1", "color2", "color3", "color4")]
+        colors = array('f')
+        for face_index, size in enumerate(data.face_sizes):
+            start = face_index * 3
+            for corner in range(size):
+                colors.extend(corner_colors[corner][start:start + 3])
+        data.color_layers.append((color_layer.name, colors))
+
+    data.material_names = [material.name for material in mesh.materials]
+
+    return data
+
+
+def _read_mesh_per_element(mesh):
+    data = MeshData()
+
+    for vertex in mesh.vertices:
+        data.positions.extend(vertex.co)
+        data.vertex_normals.extend(vertex.normal)
+
+    for face in mesh.tessfaces:
+        data.face_sizes.append(len(face.vertices))
+        data.face_vertices.extend(face.vertices)
+        data.face_normals.extend(face.normal)
+        data.face_smooth.append(face.use_smooth)
+        data.face_materials.append(face.material_index)
+
+    for uv_layer in mesh.tessface_uv_textures:
+        uvs = array('f')
+        for uv_face in uv_layer.data:
+            for uv in uv_face.uv:
+                uvs.extend(uv)
+        data.uv_layers.append((uv_layer.name, uvs))
+
+    for color_layer in mesh.tessface_vertex_colors:
+        colors = array('f')
+        for face_index, face in enumerate(color_layer.data):
+            corners = [face.color1, face.color2, face.color3, face.color4]
+            for color in corners[:data.face_sizes[face_index]]:
+                colors.extend(color[:])
+        data.color_layers.append((color_layer.name, colors))
+
+    data.material_names = [material.name for material in mesh.materials]
+
+    return data
+
+
+class GeometryStreams:
+    '''Float sources and polylists of one <geometry>. Polylist corners hold
+    indices into the sources in the order positions, normals, uvs and, if
+    there are any, colors.
+    '''
+
+    def __init__(self, mesh_data, average_planar=False):
+        self.positions = mesh_data.positions
+        self.normals = get_normals(mesh_data, average_planar)
+        self.uvs = get_uvs(mesh_data)
+        self.colors, self.color_params = get_colors(mesh_data)
+        self.has_colors = bool(mesh_data.color_layers)
+        self.polylists = build_polylists(mesh_data, self.has_colors)
+
+    def deduplicate(self, keep_positions=False, precision=6):
+        '''Merges normals, uvs and colors that are equal when rounded to
+        'precision' decimals, drops source entries no corner refers to and
+        remaps the polylist indices. Positions are only compacted, never
+        merged, and are left alone with 'keep_positions' since skin weights
+        refer to them by index.
+
+        Returns [(source name, old count, new count)].
+        '''
+        index_stride = 4 if self.has_colors else 3
+        sources = [("positions", 3), ("normals", 3), ("uvs", 2)]
+        if self.has_colors:
+            sources.append(("colors", len(self.color_params)))
+
+        statistics = []
+        for slot, (name, stride) in enumerate(sources):
+            if name == "positions" and keep_positions:
+                continue
+
+            values = getattr(self, name)
+            compacted = _compact_source(values, stride, self.polylists, slot,
+                                        index_stride,
+                                        None if name == "positions"
+                                        else precision)
+            statistics.append((name, len(values) // stride,
+                               len(compacted) // stride))
+            setattr(self, name, compacted)
+
+        return statistics
+
+
+def get_normals(mesh_data, average_planar=False):
+    '''Returns one normal per corner for smooth faces and one per face for
+    flat faces, in face order.'''
+    float_normals = []
+    vertex_normals = mesh_data.vertex_normals
+    face_normals = mesh_data.face_normals
+    corner = 0
+
+    if average_planar:
+        flat_faces = [face_index
+                      for face_index in range(mesh_data.face_count)
+                      if not mesh_data.face_smooth[face_index]]
+        face_normals = average_planar_normals(face_normals, flat_faces)
+
+    for face_index, face_size in enumerate(mesh_data.face_sizes):
+        if mesh_data.face_smooth[face_index]:
+            for vert in mesh_data.face_vertices[corner:corner + face_size]:
+                float_normals.extend(vertex_normals[vert * 3:vert * 3 + 3])
+
+        else:
+            if average_planar:
+                float_normals.extend(face_normals[face_index])
+            else:
+                float_normals.extend(face_normals[face_index * 3:
+                                                  face_index * 3 + 3])
+
+        corner += face_size
+
+    return float_normals
+
+
+def get_uvs(mesh_data):
+    '''Returns the corner uvs of all layers, one layer after another.'''
+    float_uvs = []
+    for uv_name, uvs in mesh_data.uv_layers:
+        float_uvs.extend(uvs)
+
+    return float_uvs
+
+
+def get_colors(mesh_data):
+    '''Returns (corner colors of all layers, accessor params). A layer named
+    'alpha' is turned into white with the layer's gray value as alpha.'''
+    float_colors = []
+    alpha_found = False
+
+    for color_name, colors in mesh_data.color_layers:
+        if color_name.lower() == "alpha":
+            alpha_found = True
+            for index in range(0, len(colors), 3):
+                alpha = (colors[index] + colors[index + 1]
+                         + colors[index + 2]) / 3
+                float_colors.extend([1, 1, 1, alpha])
+        else:
+            float_colors.extend(colors)
+
+    return float_colors, ("RGBA" if alpha_found else "RGB")
+
+
+def _compact_source(values, stride, polylists, slot, index_stride,
+                    precision):
+    # precision None keeps every referenced entry, merging nothing
+    remap = {}
+    unique = {}
+    compacted = []
+
+    for material_name, vcount, indices in polylists:
+        for position in range(slot, len(indices), index_stride):
+            old_index = indices[position]
+            new_index = remap.get(old_index)
+
+            if new_index is None:
+                element = values[old_index * stride:
+                                 old_index * stride + stride]
+                if precision is None:
+                    key = old_index
+                else:
+                    key = tuple(round(value, precision)
+                                for value in element)
+
+                new_index = unique.get(key)
+                if new_index is None:
+                    new_index = len(compacted) // stride
+                    unique[key] = new_index
+                    compacted.extend(element)
+
+                remap[old_index] = new_index
+
+            indices[position] = new_index
+
+    return compacted
+
+
+def build_polylists(mesh_data, with_colors):
+    '''Returns [(material name, vcount buffer, p buffer)], one entry per
+    material, built in a single pass over the faces.
+
+    Each corner in p holds the vertex, normal and texcoord indices, plus
+    the color index when 'with_colors' is set. Smooth faces use the
+    vertex index as the normal index.
+    '''
+    material_count = len(mesh_data.material_names)
+    stride = 4 if with_colors else 3
+    face_sizes = mesh_data.face_sizes
+    face_materials = mesh_data.face_materials
+    face_smooth = mesh_data.face_smooth
+    face_vertices = mesh_data.face_vertices
+
+    face_counts = [0] * material_count
+    corner_counts = [0] * material_count
+    for material, face_size in zip(face_materials, face_sizes):
+        if material < material_count:
+            face_counts[material] += 1
+            corner_counts[material] += face_size
+
+    vcounts = [_allocate('i', count) for count in face_counts]
+    indices = [_allocate('i', count * stride) for count in corner_counts]
+    face_cursors = [0] * material_count
+    index_cursors = [0] * material_count
+
+    normal = corner = 0
+    for face_index, face_size in enumerate(face_sizes):
+        material = face_materials[face_index]
+        use_smooth = face_smooth[face_index]
+
+        if material < material_count:
+            vcounts[material][face_cursors[material]] = face_size
+            face_cursors[material] += 1
+
+            buffer = indices[material]
+            cursor = index_cursors[material]
+            for texcoord in range(corner, corner + face_size):
+                vert = face_vertices[texcoord]
+                buffer[cursor] = vert
+                buffer[cursor + 1] = vert if use_smooth else normal
+                buffer[cursor + 2] = texcoord
+                if with_colors:
+                    buffer[cursor + 3] = texcoord
+                cursor += stride
+            index_cursors[material] = cursor
+
+        if use_smooth:
+            normal += face_size
+        else:
+            normal += 1
+
+        corner += face_size
+
+    return list(zip(mesh_data.material_names, vcounts, indices))
+
+
+def _allocate(typecode, length):
+    return array(typecode, bytes(array(typecode).itemsize * length))
+
+
+def average_planar_normals(face_normals, faces,
+                           tolerance=PLANAR_ANGLE_TOLERANCE):
+    '''Returns {face index: (x, y, z)} with the averaged normal of each face
+    from 'faces'. Every face normal within 'tolerance' of the face normal is
+    averaged in, and the face normal itself is counted once more.
+
+    Equal normals are merged first, then the distinct ones are bucketed on
+    a grid over the unit sphere. A cell is as wide as the chord of
+    'tolerance', so every match is found in the 27 cells around a normal
+    instead of by comparing against all faces.
+    '''
+    cell_size = 2.0 * math.sin(tolerance / 2.0)
+    min_cos = math.cos(tolerance)
+
+    # normal -> number of faces using it
+    normal_counts = {}
+    for index in range(len(face_normals) // 3):
+        normal = tuple(face_normals[index * 3:index * 3 + 3])
+        normal_counts[normal] = normal_counts.get(normal, 0) + 1
+
+    grid = {}
+    for normal in normal_counts:
+        cell = _get_sphere_cell(normal, cell_size)
+        if cell is not None:
+            grid.setdefault(cell, []).append(normal)
+
+    averaged = {}
+    by_normal = {}
+    for index in faces:
+        normal = tuple(face_normals[index * 3:index * 3 + 3])
+        if normal not in by_normal:
+            by_normal[normal] = _average_planar_normal(
+                normal, normal_counts, grid, cell_size, min_cos)
+
+        averaged[index] = by_normal[normal]
+
+    return averaged
+
+
+def _get_sphere_cell(normal, cell_size):
+    x, y, z = normal
+    length = math.sqrt(x * x + y * y + z * z)
+    if length == 0.0:
+        # zero length normals have no angle to anything
+        return None
+
+    return (math.floor(x / length / cell_size),
+            math.floor(y / length / cell_size),
+            math.floor(z / length / cell_size))
+
+
+def _average_planar_normal(normal, normal_counts, grid, cell_size, min_cos):
+    x, y, z = normal
+    nx, ny, nz = normal
+    count = 1
+
+    cell = _get_sphere_cell(normal, cell_size)
+    if cell is not None:
+        length_squared = x * x + y * y + z * z
+        cx, cy, cz = cell
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for other in grid.get((cx + dx, cy + dy, cz + dz), ()):
+                        ox, oy, oz = other
+                        dot = x * ox + y * oy + z * oz
+                        if (dot > 0.0 and dot * dot > min_cos * min_cos
+                                * length_squared
+                                * (ox * ox + oy * oy + oz * oz)):
+                            other_count = normal_counts[other]
+                            nx += ox * other_count
+                            ny += oy * other_count
+                            nz += oz * other_count
+                            count += other_count
+
+    return (nx / count, ny / count, nz / count)
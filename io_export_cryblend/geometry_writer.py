@@ -0,0 +1,243 @@
+#------------------------------------------------------------------------------
+# Name:        geometry_writer.py
+# Purpose:     Writes <geometry> elements from mesh snapshots, optionally
+#              in a pool of worker processes
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from io_export_cryblend import array_encoder, geometry, xml_utils
+from io_export_cryblend.outPipe import cbPrint
+
+from time import clock
+from xml.dom.minidom import Document
+import multiprocessing
+import os
+import xml.dom.minidom
+
+
+# Workers are fresh interpreters without Blender, importing the add-on
+# package would run __init__.py and fail on 'import bpy'. An empty package
+# module lets them import the modules below which do not need Blender.
+WORKER_SETUP = '''
+import sys
+import types
+package = types.ModuleType("io_export_cryblend")
+package.__path__ = [{!r}]
+sys.modules["io_export_cryblend"] = package
+from io_export_cryblend import geometry_writer
+geometry_writer.initialise_worker()
+'''
+
+
+class NumberFormat:
+    '''How the floats of the sources are written. Precisions are decimals
+    per source: 'positions', 'normals', 'uvs' and 'colors'.
+    '''
+
+    def __init__(self, exact=False, trim_zeros=False, precisions=None):
+        self.exact = exact
+        self.trim_zeros = trim_zeros
+        self.precisions = dict(precisions or {})
+
+    def get_precision(self, source):
+        return self.precisions.get(source, array_encoder.DEFAULT_PRECISION)
+
+    def get_key(self):
+        return (self.exact, self.trim_zeros, sorted(self.precisions.items()))
+
+
+class GeometryJob:
+    '''Everything needed to write one geometry, it has to be picklable.'''
+
+    def __init__(self, name, mesh_data, average_planar, deduplicate,
+                 keep_positions, number_format=None, indent="    "):
+        self.name = name
+        self.mesh_data = mesh_data
+        self.average_planar = average_planar
+        self.deduplicate = deduplicate
+        self.keep_positions = keep_positions
+        self.number_format = number_format or NumberFormat()
+        self.indent = indent
+
+
+def create_streams(job):
+    start_time = clock()
+    streams = geometry.GeometryStreams(job.mesh_data, job.average_planar)
+    cbPrint('Sources took %.4f sec.' % (clock() - start_time))
+
+    statistics = []
+    if job.deduplicate:
+        start_time = clock()
+        statistics = streams.deduplicate(keep_positions=job.keep_positions)
+        cbPrint('Deduplication took %.4f sec.' % (clock() - start_time))
+
+    return streams, statistics
+
+
+def write_geometry(name, streams, doc, number_format=None):
+    if number_format is None:
+        number_format = NumberFormat()
+
+    geometry_node = doc.createElement("geometry")
+    geometry_node.setAttribute("id", "%s" % (name))
+    mesh_node = doc.createElement("mesh")
+
+    start_time = clock()
+    write_positions(name, streams, mesh_node, doc, number_format)
+    cbPrint('Positions took %.4f sec.' % (clock() - start_time))
+
+    start_time = clock()
+    write_normals(name, streams, mesh_node, doc, number_format)
+    cbPrint('Normals took %.4f sec.' % (clock() - start_time))
+
+    start_time = clock()
+    write_uvs(name, streams, mesh_node, doc, number_format)
+    cbPrint('UVs took %.4f sec.' % (clock() - start_time))
+
+    start_time = clock()
+    write_vertex_colors(name, streams, mesh_node, doc, number_format)
+    cbPrint('Vertex colors took %.4f sec.' % (clock() - start_time))
+
+    start_time = clock()
+    write_vertices(name, streams, mesh_node, doc)
+    cbPrint('Vertices took %.4f sec.' % (clock() - start_time))
+
+    start_time = clock()
+    write_polylist(name, streams, mesh_node, doc)
+    cbPrint('Polylist took %.4f sec.' % (clock() - start_time))
+
+    extra = xml_utils.write_double_sided_extra("MAYA", doc)
+    mesh_node.appendChild(extra)
+    geometry_node.appendChild(mesh_node)
+
+    return geometry_node
+
+
+def write_positions(name, streams, root, doc, number_format):
+    id_ = "{!s}-positions".format(name)
+    source = write_float_source(id_, streams.positions, "XYZ", doc,
+                                number_format, "positions")
+    root.appendChild(source)
+
+
+def write_normals(name, streams, root, doc, number_format):
+    id_ = "{!s}-normals".format(name)
+    source = write_float_source(id_, streams.normals, "XYZ", doc,
+                                number_format, "normals")
+    root.appendChild(source)
+
+
+def write_uvs(name, streams, root, doc, number_format):
+    id_ = "{!s}-UVMap-0".format(name)
+    source = write_float_source(id_, streams.uvs, "ST", doc,
+                                number_format, "uvs")
+    root.appendChild(source)
+
+
+def write_vertex_colors(name, streams, root, doc, number_format):
+    if streams.colors:
+        id_ = "{!s}-colors".format(name)
+        source = write_float_source(id_, streams.colors,
+                                    streams.color_params, doc,
+                                    number_format, "colors")
+        root.appendChild(source)
+
+
+def write_float_source(id_, values, params, doc, number_format, source):
+    return xml_utils.write_source(id_,
+                                  "float",
+                                  values,
+                                  params,
+                                  doc,
+                                  number_format.get_precision(source),
+                                  number_format.exact,
+                                  number_format.trim_zeros)
+
+
+def write_vertices(name, streams, root, doc):
+    vertices = doc.createElement("vertices")
+    vertices.setAttribute("id", "%s-vertices" % (name))
+    input = xml_utils.write_input(name, None, "positions", "POSITION")
+    vertices.appendChild(input)
+    root.appendChild(vertices)
+
+
+def write_polylist(name, streams, root, doc):
+    for material_name, verts_per_poly, vert_data in streams.polylists:
+        polylist = doc.createElement("polylist")
+        polylist.setAttribute("material", material_name)
+        polylist.setAttribute("count", str(len(verts_per_poly)))
+
+        inputs = []
+        inputs.append(xml_utils.write_input(name, 0, "vertices", "VERTEX"))
+        inputs.append(xml_utils.write_input(name, 1, "normals", "NORMAL"))
+        inputs.append(xml_utils.write_input(name, 2, "UVMap-0", "TEXCOORD"))
+        if streams.has_colors:
+            inputs.append(xml_utils.write_input(name, 3, "colors", "COLOR"))
+
+        for input in inputs:
+            polylist.appendChild(input)
+
+        vcount = doc.createElement("vcount")
+        vcount_text = ints_to_text(verts_per_poly)
+        vcount.appendChild(vcount_text)
+
+        p = doc.createElement("p")
+        p_text = ints_to_text(vert_data)
+        p.appendChild(p_text)
+
+        polylist.appendChild(vcount)
+        polylist.appendChild(p)
+        root.appendChild(polylist)
+
+
+def ints_to_text(ints):
+    # every value is followed by a space, RC has always been given that
+    return xml_utils.ArrayText("int", ints, trailing_separator=True)
+
+
+def serialise_geometry(job):
+    '''Returns the <geometry> of 'job' as text for element_to_string()
+    and the deduplication statistics.
+    '''
+    streams, statistics = create_streams(job)
+    geometry_node = write_geometry(job.name, streams, Document(),
+                                   job.number_format)
+    text = xml_utils.element_to_string(geometry_node, job.indent)
+
+    return text, statistics
+
+
+def serialise_geometries(jobs, processes, executable=None):
+    '''Runs serialise_geometry() for every job in a pool of 'processes'
+    workers. Results come back in the order of 'jobs'.
+    '''
+    # 'fork' would copy the whole of Blender into every worker
+    context = multiprocessing.get_context('spawn')
+    if executable:
+        context.set_executable(executable)
+
+    package_directory = os.path.dirname(os.path.abspath(__file__))
+    pool = context.Pool(processes,
+                        initializer=exec,
+                        initargs=(WORKER_SETUP.format(package_directory),))
+    try:
+        # one job at a time, a single big mesh must not hold up a batch
+        return pool.map(serialise_geometry, jobs, chunksize=1)
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def initialise_worker():
+    # the exporter does this on import, output has to be identical
+    xml.dom.minidom.Element.writexml = xml_utils.fix_write_xml
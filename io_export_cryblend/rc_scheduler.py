@@ -0,0 +1,217 @@
+#------------------------------------------------------------------------------
+# Name:        rc_scheduler.py
+# Purpose:     Runs RC processes in parallel, in the order of their
+#              dependencies
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from io_export_cryblend.outPipe import cbPrint
+import locale
+import subprocess
+import threading
+import time
+
+
+# seconds between two looks at the running processes
+POLL_INTERVAL = 0.05
+
+# seconds to wait for the output of a finished process, a process it
+# started may keep the pipes open
+OUTPUT_TIMEOUT = 1.0
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+SKIPPED = 'SKIPPED'
+CANCELLED = 'CANCELLED'
+
+FINISHED_STATES = {SUCCEEDED, FAILED, SKIPPED, CANCELLED}
+
+
+class RcJob:
+    '''One RC process. 'command' is its argument list. 'output' gets the
+    lines the process writes as (seconds since its start, 'stdout' or
+    'stderr', text).
+    '''
+
+    def __init__(self, name, command, depends_on=()):
+        self.name = name
+        self.command = command
+        self.depends_on = list(depends_on)
+        self.state = PENDING
+        self.return_code = None
+        self.wall_time = None
+        self.error = None
+        self.output = []
+
+
+class RcScheduler:
+    '''Runs jobs with at most 'max_jobs' processes at a time. A job starts
+    once the jobs it depends on succeeded, it is skipped if one of them
+    did not. cancel() may be called from any thread, or 'cancel_event'
+    set. 'on_finished' is called with every job which is finished.
+    '''
+
+    def __init__(self, max_jobs, launch=subprocess.Popen, cancel_event=None,
+                 on_finished=None):
+        self.__max_jobs = max(1, max_jobs)
+        self.__launch = launch
+        self.__jobs = []
+        self.__cancel_event = cancel_event or threading.Event()
+        self.__on_finished = on_finished
+        self.wall_time = 0.0
+
+    @property
+    def jobs(self):
+        return list(self.__jobs)
+
+    def add(self, name, command, depends_on=()):
+        job = RcJob(name, command, depends_on)
+        self.__jobs.append(job)
+        return job
+
+    def cancel(self):
+        self.__cancel_event.set()
+
+    def is_cancelled(self):
+        return self.__cancel_event.is_set()
+
+    def run(self):
+        '''Runs all jobs and returns when every one of them is finished.'''
+        start_time = time.time()
+        pending = [job for job in self.__jobs if job.state == PENDING]
+        running = {}
+        while pending or running:
+            if self.is_cancelled():
+                self.__stop(pending, running)
+                break
+
+            self.__collect(running)
+            self.__start(pending, running)
+            if running:
+                time.sleep(POLL_INTERVAL)
+
+        self.wall_time = time.time() - start_time
+
+    def __collect(self, running):
+        for job, (process, job_start_time, readers) in list(running.items()):
+            return_code = process.poll()
+            if return_code is not None:
+                del running[job]
+                job.return_code = return_code
+                job.wall_time = time.time() - job_start_time
+                _join_readers(readers)
+                self.__finish(job, SUCCEEDED if return_code == 0 else FAILED)
+
+    def __start(self, pending, running):
+        for job in list(pending):
+            states = [dependency.state for dependency in job.depends_on]
+            if any(state in FINISHED_STATES and state != SUCCEEDED
+                   for state in states):
+                self.__finish(job, SKIPPED)
+                pending.remove(job)
+
+            elif (all(state == SUCCEEDED for state in states)
+                    and len(running) < self.__max_jobs):
+                pending.remove(job)
+                try:
+                    running[job] = self.__start_process(job)
+                    job.state = RUNNING
+                except OSError as exception:
+                    job.error = str(exception)
+                    self.__finish(job, FAILED)
+
+        # nothing runs, so the rest waits for jobs which never will
+        if pending and not running:
+            for job in pending:
+                self.__finish(job, SKIPPED)
+            del pending[:]
+
+    def __start_process(self, job):
+        # pipes are drained by threads, a full pipe would stop RC and
+        # reading them here would stop the other jobs
+        process = self.__launch(job.command, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        start_time = time.time()
+        readers = []
+        for stream, pipe in (("stdout", process.stdout),
+                             ("stderr", process.stderr)):
+            reader = threading.Thread(target=_read_lines,
+                                      args=(pipe, stream, start_time,
+                                            job.output))
+            reader.daemon = True
+            reader.start()
+            readers.append(reader)
+
+        return process, start_time, readers
+
+    def __stop(self, pending, running):
+        for job, (process, job_start_time, readers) in running.items():
+            process.terminate()
+            process.wait()
+            job.wall_time = time.time() - job_start_time
+            _join_readers(readers)
+            self.__finish(job, CANCELLED)
+
+        for job in pending:
+            self.__finish(job, CANCELLED)
+
+        running.clear()
+        del pending[:]
+
+    def __finish(self, job, state):
+        job.state = state
+        if self.__on_finished is not None:
+            self.__on_finished(job)
+
+    def print_summary(self):
+        counts = {}
+        process_time = 0.0
+        for job in self.__jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+            process_time += job.wall_time or 0.0
+
+        cbPrint("RC: {:d} jobs in {:.2f} sec, {:.2f} sec of process time. "
+                "{}".format(len(self.__jobs), self.wall_time, process_time,
+                            ", ".join("{:d} {}".format(count, state.lower())
+                                      for state, count
+                                      in sorted(counts.items()))))
+
+        for job in self.__jobs:
+            if job.state == FAILED:
+                if job.error is not None:
+                    reason = job.error
+                else:
+                    reason = "exit code {:d}".format(job.return_code)
+                cbPrint("RC failed on {!r}: {}".format(job.name, reason),
+                        'error')
+            elif job.state == SKIPPED:
+                cbPrint("RC skipped {!r}, a job before it failed.".format(
+                        job.name), 'warning')
+            elif job.wall_time is not None:
+                cbPrint("RC on {!r} took {:.2f} sec.".format(
+                        job.name, job.wall_time), 'debug')
+
+
+def _read_lines(pipe, stream, start_time, lines):
+    encoding = locale.getpreferredencoding(False)
+    try:
+        for line in pipe:
+            text = line.decode(encoding, 'replace').rstrip()
+            lines.append((time.time() - start_time, stream, text))
+    finally:
+        pipe.close()
+
+
+def _join_readers(readers):
+    for reader in readers:
+        reader.join(OUTPUT_TIMEOUT)
@@ -15,28 +15,46 @@
 if "bpy" in locals():
     import imp
     imp.reload(exceptions)
+    imp.reload(xml_utils)
 else:
     import bpy
-    from io_export_cryblend import exceptions
+    from io_export_cryblend import exceptions, xml_utils
 
 
+from array import array
 from io_export_cryblend.outPipe import cbPrint
+from io_export_cryblend.xml_utils import (fix_write_xml, XmlFragment,
+                                          XmlStreamWriter, XmlRecorder,
+                                          element_to_string,
+                                          floats_to_string, ints_to_string,
+                                          strings_to_string, write_source,
+                                          write_input,
+                                          write_double_sided_extra, join)
 from mathutils import Matrix, Vector
 from xml.dom.minidom import Document, parseString
 import bpy
+import contextlib
 import fnmatch
+import hashlib
 import math
 import os
 import random
 import re
 import subprocess
 import sys
+import tempfile
 import xml.dom.minidom
 
 
 # globals
 toDegrees = 180.0 / math.pi
 
+# custom property of export nodes, not passed to CryEngine
+LOD_RATIOS_PROPERTY = "cryblend_lod_ratios"
+
+# names of the export nodes get_export_nodes() is limited to, None for all
+__exported_node_names = None
+
 
 def color_to_string(r, g, b, a):
     return "{:f} {:f} {:f} {:f}".format(r, g, b, a)
@@ -48,36 +66,6 @@ def convert_time(frame):
     return (fps_base * frame) / fps
 
 
-# the following func is from
-# http://ronrothman.com/
-#    public/leftbraned/xml-dom-minidom-toprettyxml-and-silly-whitespace/
-# modified to use the current ver of shipped python
-def fix_write_xml(self, writer, indent="", addindent="", newl=""):
-    # indent = current indentation
-    # addindent = indentation to add to higher levels
-    # newl = newline string
-        writer.write(indent + "<" + self.tagName)
-        attrs = self._get_attributes()
-        for a_name in sorted(attrs.keys()):
-            writer.write(" %s=\"" % a_name)
-            xml.dom.minidom._write_data(writer, attrs[a_name].value)
-            writer.write("\"")
-        if self.childNodes:
-            if (len(self.childNodes) == 1
-                and self.childNodes[0].nodeType
-                    == xml.dom.minidom.Node.TEXT_NODE):
-                writer.write(">")
-                self.childNodes[0].writexml(writer, "", "", "")
-                writer.write("</%s>%s" % (self.tagName, newl))
-                return
-            writer.write(">%s" % (newl))
-            for node in self.childNodes:
-                node.writexml(writer, indent + addindent, addindent, newl)
-            writer.write("%s</%s>%s" % (indent, self.tagName, newl))
-        else:
-            writer.write("/>%s" % (newl))
-
-
 def get_guid():
     GUID = "{%s-%s-%s-%s-%s}" % (random_hex_sector(8),
                                  random_hex_sector(4),
@@ -126,14 +114,6 @@ def matrix_to_string(matrix):
     return " ".join(rows)
 
 
-def floats_to_string(floats, separator=" ", precision="%.6f"):
-    return separator.join(precision % x for x in floats)
-
-
-def strings_to_string(strings, separator=" "):
-    return separator.join(string for string in strings)
-
-
 def matrix_to_array(matrix):
     array = []
     for row in matrix:
@@ -214,6 +194,19 @@ def make_relative_path(filepath, start):
         raise exceptions.TextureAndBlendDiskMismatchException(start, filepath)
 
 
+def get_cache_directory(kind):
+    # every blend file gets its own cache, files with the same name
+    # in different directories must not share entries
+    blend_file_path = os.path.abspath(bpy.data.filepath)
+    blend_name = os.path.splitext(os.path.basename(bpy.data.filepath))[0]
+    if not blend_name:
+        blend_name = "untitled"
+    path_hash = hashlib.sha1(blend_file_path.encode('utf-8')).hexdigest()
+
+    return os.path.join(tempfile.gettempdir(), "CryBlend",
+                        "{}-{}".format(blend_name, path_hash[:8]), kind)
+
+
 def get_mtl_files_in_directory(directory):
     MTL_MATCH_STRING = "*.{!s}".format("mtl")
 
@@ -228,14 +221,7 @@ def get_mtl_files_in_directory(directory):
 
 def run_rc(rc_path, files_to_process, params=None):
     cbPrint(rc_path)
-    process_params = [rc_path]
-
-    if isinstance(files_to_process, list):
-        process_params.extend(files_to_process)
-    else:
-        process_params.append(files_to_process)
-
-    process_params.extend(params)
+    process_params = get_rc_command(rc_path, files_to_process, params)
 
     cbPrint(params)
     cbPrint(files_to_process)
@@ -248,6 +234,19 @@ def run_rc(rc_path, files_to_process, params=None):
     return run_object
 
 
+def get_rc_command(rc_path, files_to_process, params=None):
+    process_params = [rc_path]
+
+    if isinstance(files_to_process, list):
+        process_params.extend(files_to_process)
+    else:
+        process_params.append(files_to_process)
+
+    process_params.extend(params or [])
+
+    return process_params
+
+
 def get_path_with_new_extension(image_path, extension):
     return "%s.%s" % (os.path.splitext(image_path)[0], extension)
 
@@ -349,7 +348,10 @@ def get_type(type_):
         "texture_slots": __get_texture_slots,
         "textures": __get_textures
     }
-    return list(set(dispatch[type_]()))
+    # bpy structs hash by their address, the order of a set would change
+    # from one session to the next and the DAE with it
+    return sorted(set(dispatch[type_]()),
+                  key=lambda item: (item is None, getattr(item, "name", "")))
 
 def __get_nodes():
     items = []
@@ -439,11 +441,28 @@ def get_export_nodes():
     export_nodes = []
     for group in bpy.context.blend_data.groups:
         if is_export_node(group.name) and len(group.objects) > 0:
-            export_nodes.append(group)
+            if (__exported_node_names is None
+                    or group.name in __exported_node_names):
+                export_nodes.append(group)
 
     return export_nodes
 
 
+@contextlib.contextmanager
+def export_only(node_names):
+    '''Limits get_export_nodes(), and with it get_type(), to the export
+    nodes named in 'node_names' inside a 'with' block.
+    '''
+    global __exported_node_names
+    previous_names = __exported_node_names
+    __exported_node_names = set(node_names)
+    try:
+        yield
+
+    finally:
+        __exported_node_names = previous_names
+
+
 def get_texture_slots_for_material(material):
     texture_slots = []
     for texture_slot in material.texture_slots:
@@ -563,6 +582,47 @@ def get_node_name(groupname):
     return groupname[:-(len(node_type)+1)]
 
 
+def parse_lod_ratios(text):
+    ratios = []
+    for item in text.split():
+        ratio = float(item)
+        if not 0.0 < ratio < 1.0:
+            raise ValueError("LOD ratio {!r} is not between 0 and 1".format(
+                             item))
+        ratios.append(ratio)
+
+    return ratios
+
+
+def get_lod_ratios(object_):
+    '''Triangle ratios of the LODs set on the export node of 'object_'.'''
+    for group in object_.users_group:
+        if is_export_node(group.name):
+            text = group.get(LOD_RATIOS_PROPERTY)
+            if text is None:
+                continue
+            try:
+                return parse_lod_ratios(text)
+            except ValueError as exception:
+                raise exceptions.CryBlendException(
+                    "Export node {!r} has invalid LODs: {!s}".format(
+                        group.name, exception))
+
+    return []
+
+
+def set_lod_ratios(group, ratios):
+    if ratios:
+        group[LOD_RATIOS_PROPERTY] = " ".join("%g" % ratio
+                                              for ratio in ratios)
+    elif LOD_RATIOS_PROPERTY in group:
+        del group[LOD_RATIOS_PROPERTY]
+
+
+def get_lod_name(object_name, level):
+    return "$lod{:d}_{!s}".format(level, object_name)
+
+
 def generate_file_contents(type_):
     if type_ == "chrparams":
         return """<Params>\
@@ -813,71 +873,218 @@ def apply_modifiers():
                     pass
 
 
-def write_source(id_, type_, array, params, doc):
-    length = len(array)
-    if type_ == "float4x4":
-        stride = 16
-    elif len(params) == 0:
-        stride = 1
-    else:
-        stride = len(params)
-    count = int(length / stride)
+def get_decimated_mesh(object_, ratio, with_modifiers=False):
+    '''Returns a new mesh of 'object_' with 'ratio' of its triangles.
+    With 'with_modifiers' the mesh of get_evaluated_mesh() is decimated,
+    else the object's own one. The object is left as it was, remove the
+    mesh when done with it.
+    '''
+    # decimate only what gets exported, not the rest of the modifier stack
+    shown_modifiers = [modifier for modifier in object_.modifiers
+                       if modifier.show_viewport
+                       and (not with_modifiers
+                            or modifier.type == "ARMATURE")]
+    for modifier in shown_modifiers:
+        modifier.show_viewport = False
+
+    decimate = object_.modifiers.new("CryBlend LOD", 'DECIMATE')
+    decimate.decimate_type = 'COLLAPSE'
+    decimate.ratio = ratio
+    try:
+        mesh = object_.to_mesh(bpy.context.scene, True, 'PREVIEW')
+    finally:
+        object_.modifiers.remove(decimate)
+        for modifier in shown_modifiers:
+            modifier.show_viewport = True
 
-    source = doc.createElement("source")
-    source.setAttribute("id", id_)
+    mesh.update(calc_tessface=True)
+    return mesh
+
+
+def get_evaluated_modifiers(object_):
+    '''Returns the shown modifiers of 'object_' which change its exported
+    mesh. Armatures are left to the engine.
+    '''
+    return [modifier for modifier in object_.modifiers
+            if modifier.show_viewport and modifier.type != "ARMATURE"]
+
+
+def get_evaluated_mesh(object_):
+    '''Returns a new mesh of 'object_' with its modifiers, but without
+    armatures. The object is left as it was, remove the mesh when done.
+    '''
+    armatures = [modifier for modifier in object_.modifiers
+                 if modifier.show_viewport and modifier.type == "ARMATURE"]
+    for modifier in armatures:
+        modifier.show_viewport = False
 
-    if type_ == "float4x4":
-        source_data = doc.createElement("float_array")
-    else:
-        source_data = doc.createElement("{!s}_array".format(type_))
-    source_data.setAttribute("id", "{!s}-array".format(id_))
-    source_data.setAttribute("count", str(length))
     try:
-        source_data.appendChild(doc.createTextNode(floats_to_string(array)))
-    except TypeError:
-        source_data.appendChild(doc.createTextNode(strings_to_string(array)))
-    technique_common = doc.createElement("technique_common")
-    accessor = doc.createElement("accessor")
-    accessor.setAttribute("source", "#{!s}-array".format(id_))
-    accessor.setAttribute("count", str(count))
-    accessor.setAttribute("stride", str(stride))
-    for param in params:
-        param_node = doc.createElement("param")
-        param_node.setAttribute("name", param)
-        param_node.setAttribute("type", type_)
-        accessor.appendChild(param_node)
-    if len(params) == 0:
-        param_node = doc.createElement("param")
-        param_node.setAttribute("type", type_)
-        accessor.appendChild(param_node)
-    technique_common.appendChild(accessor)
-
-    source.appendChild(source_data)
-    source.appendChild(technique_common)
-
-    return source
-
-
-def write_input(name, offset, type_, semantic):
-    doc = Document()
-    id_ = "{!s}-{!s}".format(name, type_)
-    input = doc.createElement("input")
+        mesh = object_.to_mesh(bpy.context.scene, True, 'PREVIEW')
+    finally:
+        for modifier in armatures:
+            modifier.show_viewport = True
+
+    mesh.update(calc_tessface=True)
+    return mesh
+
+
+def get_modifier_settings(modifier):
+    '''Returns the values of all properties of 'modifier' as plain values.
+    Objects it refers to are given by name and world matrix.
+    '''
+    return [modifier.type] + get_rna_settings(modifier)
+
+
+def get_rna_settings(struct):
+    '''Returns the values of the properties of 'struct', e.g. a modifier
+    or material, as plain values. Objects it refers to are given by name
+    and world matrix, other data blocks by name. Collections and nested
+    structs are left out.
+    '''
+    settings = []
+    for property_ in struct.bl_rna.properties:
+        identifier = property_.identifier
+        if identifier == "rna_type" or property_.type == 'COLLECTION':
+            continue
+
+        value = getattr(struct, identifier)
+        if property_.type == 'POINTER':
+            if isinstance(value, bpy.types.Object):
+                value = (value.name, matrix_to_array(value.matrix_world))
+            elif isinstance(value, bpy.types.ID):
+                value = value.name
+            elif value is not None:
+                # nested settings of simulations, their repr is an address
+                continue
+        elif getattr(property_, "is_array", False):
+            value = tuple(value)
+        settings.append((identifier, value))
+
+    return settings
+
+
+def get_modifier_objects(modifiers):
+    '''Returns the objects 'modifiers' refer to, e.g. boolean cutters and
+    mirror objects, sorted by name.
+    '''
+    objects = {}
+    for modifier in modifiers:
+        for property_ in modifier.bl_rna.properties:
+            if property_.type != 'POINTER':
+                continue
+            value = getattr(modifier, property_.identifier)
+            if isinstance(value, bpy.types.Object):
+                objects[value.name] = value
+
+    return [objects[name] for name in sorted(objects)]
+
+
+def get_modifier_items(object_, modifiers):
+    '''Returns what the mesh 'modifiers' make of the mesh of 'object_'
+    depends on beside it: their settings and, if they refer to other
+    objects, where 'object_' is and the meshes of those objects.
+    '''
+    items = [get_modifier_settings(modifier) for modifier in modifiers]
+    referenced_objects = get_modifier_objects(modifiers)
+    if referenced_objects:
+        items.append(matrix_to_array(object_.matrix_world))
+    for referenced_object in referenced_objects:
+        items.extend(get_referenced_object_items(referenced_object))
+
+    return items
+
+
+def get_referenced_object_items(object_):
+    '''Returns the world matrix, modifier settings and mesh of 'object_',
+    which is used by another object's modifiers. Its own references are
+    not followed.
+    '''
+    items = [object_.name,
+             matrix_to_array(object_.matrix_world),
+             [get_modifier_settings(modifier)
+              for modifier in get_evaluated_modifiers(object_)]]
+    if object_.type == 'MESH':
+        items.extend(get_mesh_geometry_items(object_.data))
+    elif object_.type == 'LATTICE':
+        points = array('f', [0.0]) * (len(object_.data.points) * 3)
+        object_.data.points.foreach_get("co_deform", points)
+        items.append(points)
 
-    if offset is not None:
-        input.setAttribute("offset", str(offset))
-    input.setAttribute("semantic", semantic)
-    if semantic == "TEXCOORD":
-        input.setAttribute("set", "0")
-    input.setAttribute("source", "#{!s}".format(id_))
+    return items
+
+
+def get_mesh_geometry_items(mesh):
+    '''Returns the vertex positions and faces of 'mesh' as arrays.'''
+    positions = array('f', [0.0]) * (len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get("co", positions)
+    loop_vertices = array('i', [0]) * len(mesh.loops)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    face_sizes = array('i', [0]) * len(mesh.polygons)
+    mesh.polygons.foreach_get("loop_total", face_sizes)
+
+    return [positions, loop_vertices, face_sizes]
+
+
+def get_deform_items(object_):
+    '''Returns the vertex group weights and shape keys of 'object_', what
+    modifiers read beside the mesh and their own settings.
+    '''
+    items = []
+    if object_.vertex_groups:
+        for vertex in object_.data.vertices:
+            items.append([(group.group, group.weight)
+                          for group in vertex.groups])
+
+    shape_keys = object_.data.shape_keys
+    if shape_keys is not None:
+        for key_block in shape_keys.key_blocks:
+            coordinates = array('f', [0.0]) * (len(key_block.data) * 3)
+            key_block.data.foreach_get("co", coordinates)
+            items.append((key_block.name, key_block.value, key_block.mute,
+                          coordinates.tobytes()))
+
+    return items
+
+
+class OperatorCounter:
+    '''Counts the bpy.ops calls made inside a 'with' block per operator.
+    Every operator is an instance of the same class, its __call__ is
+    replaced for the duration of the block.
+    '''
+
+    def __init__(self):
+        self.calls = {}
+
+    def __enter__(self):
+        self.__operator_type = type(bpy.ops.object.mode_set)
+        self.__call = self.__operator_type.__call__
+        calls = self.calls
+        call = self.__call
+
+        def counting_call(operator, *args, **kwargs):
+            name = operator.idname_py()
+            calls[name] = calls.get(name, 0) + 1
+            return call(operator, *args, **kwargs)
+
+        self.__operator_type.__call__ = counting_call
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.__operator_type.__call__ = self.__call
+        return False
 
-    return input
+    def get_count(self):
+        return sum(self.calls.values())
 
+    def get_report(self):
+        # one line, cbPrint() shows the repr
+        report = "Operator calls: {:d}".format(self.get_count())
+        if self.calls:
+            report += " ({})".format(", ".join(
+                "{} {:d}".format(name, count)
+                for name, count in sorted(self.calls.items())))
 
-def join(*items):
-    strings = []
-    for item in items:
-        strings.append(str(item))
-    return "".join(strings)
+        return report
 
 
 # this is needed if you want to access more than the first def
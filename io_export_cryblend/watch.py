@@ -0,0 +1,280 @@
+#------------------------------------------------------------------------------
+# Name:        watch.py
+# Purpose:     Finds the export nodes edited since they were last exported
+#
+# Author:      CryBlend contributors
+#
+# Created:     17/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+if "bpy" in locals():
+    import imp
+    imp.reload(utils)
+    imp.reload(cache)
+else:
+    import bpy
+    from io_export_cryblend import utils, cache
+
+from array import array
+import os
+import time
+
+
+# the watchers which get scene updates, there is one at a time
+_watchers = []
+
+
+class ExportWatcher:
+    '''Collects the export nodes which use objects, materials, textures or
+    images Blender updated. Once no update came for 'delay' seconds,
+    take_changed_nodes() gives those which differ from their last export.
+    The exporter updates objects as well, e.g. with its fake bones, but
+    leaves them as they were.
+    '''
+
+    def __init__(self, delay):
+        self.__delay = delay
+        self.__touched = set()
+        self.__last_update_time = 0.0
+        # node name: fingerprint when it was last exported
+        self.__fingerprints = {}
+        self.stopped = False
+
+    def start(self):
+        '''Starts watching, the export nodes count as exported as they
+        are now.
+        '''
+        for group in utils.get_export_nodes():
+            self.__fingerprints[group.name] = get_node_fingerprint(group)
+
+        if not _watchers:
+            bpy.app.handlers.scene_update_post.append(_on_scene_update)
+        _watchers.append(self)
+
+    def stop(self):
+        self.stopped = True
+        if self in _watchers:
+            _watchers.remove(self)
+        if not _watchers and (_on_scene_update
+                              in bpy.app.handlers.scene_update_post):
+            bpy.app.handlers.scene_update_post.remove(_on_scene_update)
+
+    def on_scene_update(self, scene):
+        updated_keys = get_updated_keys()
+        if not updated_keys:
+            return
+
+        for group in utils.get_export_nodes():
+            if not updated_keys.isdisjoint(get_node_keys(group)):
+                self.__touched.add(group.name)
+                self.__last_update_time = time.time()
+
+    def take_changed_nodes(self):
+        '''Returns the names of the export nodes changed since their last
+        export if the edits paused, they count as exported from then on.
+        Edits while they are exported make them change again.
+        '''
+        if (not self.__touched
+                or time.time() - self.__last_update_time < self.__delay):
+            return []
+
+        changed_names = []
+        for group in utils.get_export_nodes():
+            if group.name not in self.__touched:
+                continue
+            fingerprint = get_node_fingerprint(group)
+            if fingerprint != self.__fingerprints.get(group.name):
+                self.__fingerprints[group.name] = fingerprint
+                changed_names.append(group.name)
+        self.__touched.clear()
+
+        return changed_names
+
+
+def stop():
+    '''Stops every watcher.'''
+    for watcher in list(_watchers):
+        watcher.stop()
+
+
+def is_watching():
+    return bool(_watchers)
+
+
+def _on_scene_update(scene):
+    for watcher in _watchers:
+        watcher.on_scene_update(scene)
+
+
+def get_updated_keys():
+    '''Returns (kind, name) of the data blocks Blender updated.'''
+    updated_keys = set()
+    for kind, collection in (("OBJECT", bpy.data.objects),
+                             ("MATERIAL", bpy.data.materials),
+                             ("TEXTURE", bpy.data.textures),
+                             ("IMAGE", bpy.data.images)):
+        if collection.is_updated:
+            updated_keys.update((kind, id_.name) for id_ in collection
+                                if id_.is_updated or id_.is_updated_data)
+
+    return updated_keys
+
+
+def get_node_keys(group):
+    '''Returns (kind, name) of the data blocks an export of 'group'
+    reads.
+    '''
+    objects, materials, textures, images = get_node_dependencies(group)
+    keys = {("OBJECT", object_.name) for object_ in objects}
+    keys.update(("MATERIAL", material.name) for material in materials)
+    keys.update(("TEXTURE", texture.name) for texture in textures)
+    keys.update(("IMAGE", image.name) for image in images)
+
+    return keys
+
+
+def get_node_dependencies(group):
+    '''Returns the objects of 'group' with the objects they refer to,
+    their parents and modifier objects, then the materials, textures and
+    images of the objects, each sorted by name.
+    '''
+    objects = {}
+    for object_ in group.objects:
+        objects[object_.name] = object_
+        parent = object_.parent
+        while parent is not None:
+            objects[parent.name] = parent
+            parent = parent.parent
+        for referenced_object in utils.get_modifier_objects(
+                                                        object_.modifiers):
+            objects[referenced_object.name] = referenced_object
+
+    materials = {}
+    for object_ in group.objects:
+        for slot in object_.material_slots:
+            if slot.material is not None:
+                materials[slot.material.name] = slot.material
+
+    textures = {}
+    for material in materials.values():
+        for texture_slot in material.texture_slots:
+            if texture_slot is not None and texture_slot.texture is not None:
+                textures[texture_slot.texture.name] = texture_slot.texture
+
+    images = {}
+    for texture in textures.values():
+        image = getattr(texture, "image", None)
+        if image is not None:
+            images[image.name] = image
+
+    return [[data[name] for name in sorted(data)]
+            for data in (objects, materials, textures, images)]
+
+
+def get_node_fingerprint(group):
+    '''Returns a hex digest of what an export reads from the objects of
+    'group' and the data they use, without changing them.
+    '''
+    objects, materials, textures, images = get_node_dependencies(group)
+    node_objects = {object_.name for object_ in group.objects}
+    items = []
+    for object_ in objects:
+        if object_.name in node_objects:
+            items.extend(get_object_items(object_))
+        else:
+            # e.g. a boolean cutter or the armature the node's mesh is in
+            items.extend(utils.get_referenced_object_items(object_))
+            items.extend(get_action_items(object_))
+            if object_.type == 'ARMATURE':
+                items.append(get_bone_items(object_.data))
+
+    for material in materials:
+        items.append(utils.get_rna_settings(material))
+        items.append([utils.get_rna_settings(texture_slot)
+                      for texture_slot in material.texture_slots
+                      if texture_slot is not None])
+    for texture in textures:
+        items.append(utils.get_rna_settings(texture))
+    for image in images:
+        items.append(get_image_items(image))
+
+    return cache.hash_items(*items)
+
+
+def get_object_items(object_):
+    items = [object_.name,
+             object_.type,
+             utils.matrix_to_array(object_.matrix_world),
+             object_.parent.name if object_.parent else "",
+             [utils.get_modifier_settings(modifier)
+              for modifier in object_.modifiers],
+             [slot.material.name if slot.material else ""
+              for slot in object_.material_slots],
+             [vertex_group.name for vertex_group in object_.vertex_groups]]
+    items.extend(get_action_items(object_))
+    if object_.type == 'MESH':
+        items.extend(get_mesh_items(object_.data))
+        if object_.vertex_groups:
+            items.append(get_weight_items(object_.data))
+    elif object_.type == 'ARMATURE':
+        items.append(get_bone_items(object_.data))
+
+    return items
+
+
+def get_bone_items(armature):
+    return [(bone.name, utils.matrix_to_array(bone.matrix_local))
+            for bone in armature.bones]
+
+
+def get_image_items(image):
+    # pixels are too many to hash, a saved file or unsaved edits show
+    items = [image.name, image.filepath, image.is_dirty]
+    try:
+        status = os.stat(utils.get_absolute_path(image.filepath))
+        items.extend((status.st_size, status.st_mtime))
+    except (IOError, OSError):
+        pass
+
+    return items
+
+
+def get_mesh_items(mesh):
+    face_materials = array('i', [0]) * len(mesh.polygons)
+    mesh.polygons.foreach_get("material_index", face_materials)
+
+    items = utils.get_mesh_geometry_items(mesh) + [face_materials]
+    for uv_layer in mesh.uv_layers:
+        uvs = array('f', [0.0]) * (len(uv_layer.data) * 2)
+        uv_layer.data.foreach_get("uv", uvs)
+        items.extend((uv_layer.name, uvs))
+    for color_layer in mesh.vertex_colors:
+        colors = array('f', [0.0]) * (len(color_layer.data) * 3)
+        color_layer.data.foreach_get("color", colors)
+        items.extend((color_layer.name, colors))
+
+    return items
+
+
+def get_weight_items(mesh):
+    return [[(element.group, element.weight) for element in vertex.groups]
+            for vertex in mesh.vertices]
+
+
+def get_action_items(object_):
+    animation_data = object_.animation_data
+    if animation_data is None or animation_data.action is None:
+        return []
+
+    items = []
+    for fcurve in animation_data.action.fcurves:
+        points = array('f', [0.0]) * (len(fcurve.keyframe_points) * 2)
+        fcurve.keyframe_points.foreach_get("co", points)
+        items.extend((fcurve.data_path, fcurve.array_index, points))
+
+    return items
@@ -0,0 +1,345 @@
+#------------------------------------------------------------------------------
+# Name:        xml_utils.py
+# Purpose:     COLLADA element writers which do not need Blender, so they
+#              can also run in worker processes
+#
+# Author:      CryBlend contributors
+#
+# Created:     16/10/2026
+# Copyright:   (c) CryBlend contributors 2026
+# Licence:     GPLv2+
+#------------------------------------------------------------------------------
+
+# <pep8-80 compliant>
+
+
+from io_export_cryblend import array_encoder
+
+from xml.dom.minidom import Document
+import io
+import xml.dom.minidom
+
+
+# owner of elements made outside of a document, e.g. by write_input()
+_DOCUMENT = Document()
+
+
+# the following func is from
+# http://ronrothman.com/
+#    public/leftbraned/xml-dom-minidom-toprettyxml-and-silly-whitespace/
+# modified to use the current ver of shipped python
+def fix_write_xml(self, writer, indent="", addindent="", newl=""):
+    # indent = current indentation
+    # addindent = indentation to add to higher levels
+    # newl = newline string
+        writer.write(indent + "<" + self.tagName)
+        attrs = self._get_attributes()
+        for a_name in sorted(attrs.keys()):
+            writer.write(" %s=\"" % a_name)
+            xml.dom.minidom._write_data(writer, attrs[a_name].value)
+            writer.write("\"")
+        if self.childNodes:
+            if (len(self.childNodes) == 1
+                and self.childNodes[0].nodeType
+                    == xml.dom.minidom.Node.TEXT_NODE):
+                writer.write(">")
+                self.childNodes[0].writexml(writer, "", "", "")
+                writer.write("</%s>%s" % (self.tagName, newl))
+                return
+            writer.write(">%s" % (newl))
+            for node in self.childNodes:
+                node.writexml(writer, indent + addindent, addindent, newl)
+            writer.write("%s</%s>%s" % (indent, self.tagName, newl))
+        else:
+            writer.write("/>%s" % (newl))
+
+
+class XmlFragment(xml.dom.minidom.Element):
+    '''Element that writes already serialised xml, e.g. a cached geometry.
+    'text' has to come from element_to_string().
+    '''
+
+    def __init__(self, tag_name, text):
+        xml.dom.minidom.Element.__init__(self, tag_name)
+        self.__lines = text.splitlines()
+
+    def writexml(self, writer, indent="", addindent="", newl=""):
+        for line in self.__lines:
+            writer.write(indent + line + newl)
+
+
+class XmlStreamWriter:
+    '''Writes a document to 'file' piece by piece, byte for byte like
+    toprettyxml() with fix_write_xml() would, without the whole tree or text
+    in memory.
+
+    Elements opened by start_element() are written when they get their
+    first child. Elements given to appendChild() are queued under the open
+    element, so they can still be filled, and written by flush().
+    '''
+
+    def __init__(self, file, addindent="    ", newl="\n"):
+        self.__file = file
+        self.__addindent = addindent
+        self.__newl = newl
+        # [element, start tag written] of every open element
+        self.__open_elements = []
+        self.__queue = []
+
+    def write_declaration(self):
+        self.__file.write('<?xml version="1.0" ?>' + self.__newl)
+
+    def start_element(self, element):
+        self.flush()
+        self.__write_start_tags()
+        self.__open_elements.append([element, False])
+
+    def end_element(self):
+        self.flush()
+        element, started = self.__open_elements.pop()
+        indent = self.__get_indent()
+        if started:
+            self.__file.write("{}</{}>{}".format(indent, element.tagName,
+                                                 self.__newl))
+        else:
+            _write_start_tag(self.__file, element, indent)
+            self.__file.write("/>" + self.__newl)
+
+    def write_element(self, element):
+        self.flush()
+        self.__write_element(element)
+
+    def appendChild(self, element):
+        self.__queue.append(element)
+        return element
+
+    def flush(self):
+        queue = self.__queue
+        self.__queue = []
+        for element in queue:
+            self.__write_element(element)
+
+    def __write_element(self, element):
+        self.__write_start_tags()
+        element.writexml(self.__file, self.__get_indent(), self.__addindent,
+                         self.__newl)
+
+    def __write_start_tags(self):
+        for depth, open_element in enumerate(self.__open_elements):
+            element, started = open_element
+            if not started:
+                _write_start_tag(self.__file, element,
+                                 self.__addindent * depth)
+                self.__file.write(">" + self.__newl)
+                open_element[1] = True
+
+    def __get_indent(self):
+        return self.__addindent * len(self.__open_elements)
+
+
+class XmlRecorder:
+    '''Takes the calls an XmlStreamWriter would get and makes them on one
+    later in replay(). A document can be put together on one thread and
+    written on another.
+    '''
+
+    def __init__(self):
+        # (method name, element or None)
+        self.__calls = []
+
+    def write_declaration(self):
+        self.__calls.append(("write_declaration", None))
+
+    def start_element(self, element):
+        self.__calls.append(("start_element", element))
+
+    def end_element(self):
+        self.__calls.append(("end_element", None))
+
+    def write_element(self, element):
+        self.__calls.append(("write_element", element))
+
+    def appendChild(self, element):
+        self.__calls.append(("appendChild", element))
+        return element
+
+    def flush(self):
+        self.__calls.append(("flush", None))
+
+    def get_elements(self):
+        return [element for name, element in self.__calls
+                if element is not None]
+
+    def get_calls(self):
+        return list(self.__calls)
+
+    def replay(self, writer, resolve=None):
+        '''Makes the recorded calls on 'writer'. 'resolve' gets every
+        recorded element and returns the one to write in its place.
+        Elements are let go as soon as they are written.
+        '''
+        calls = self.__calls
+        self.__calls = []
+        for index, (name, element) in enumerate(calls):
+            calls[index] = None
+            if element is None:
+                getattr(writer, name)()
+            else:
+                if resolve is not None:
+                    element = resolve(element)
+                getattr(writer, name)(element)
+
+
+def _write_start_tag(writer, element, indent):
+    # the start of fix_write_xml(), without closing the tag
+    writer.write(indent + "<" + element.tagName)
+    attrs = element._get_attributes()
+    for a_name in sorted(attrs.keys()):
+        writer.write(" %s=\"" % a_name)
+        xml.dom.minidom._write_data(writer, attrs[a_name].value)
+        writer.write("\"")
+
+
+class ArrayText(xml.dom.minidom.Text):
+    '''Text of an array which is encoded while it is written, in chunks of
+    'chunk_size' values, instead of being held as one string.
+    With 'trailing_separator' every value is followed by the separator.
+    '''
+
+    def __init__(self, type_, values,
+                 precision=array_encoder.DEFAULT_PRECISION, round_trip=False,
+                 trim_zeros=False, trailing_separator=False,
+                 chunk_size=array_encoder.CHUNK_SIZE):
+        xml.dom.minidom.Text.__init__(self)
+        self.__type = type_
+        self.__values = values
+        self.__precision = precision
+        self.__round_trip = round_trip
+        self.__trim_zeros = trim_zeros
+        self.__trailing_separator = trailing_separator
+        self.__chunk_size = chunk_size
+
+    def _get_data(self):
+        writer = io.StringIO()
+        self.writexml(writer)
+        return writer.getvalue()
+
+    data = nodeValue = property(_get_data)
+
+    def writexml(self, writer, indent="", addindent="", newl=""):
+        # only names can hold characters which need escaping
+        if self.__type in array_encoder.FLOAT_TYPES | array_encoder.INT_TYPES:
+            write = writer.write
+        else:
+            write = lambda text: xml.dom.minidom._write_data(writer, text)
+
+        writer.write(indent)
+        for chunk in array_encoder.iter_array_chunks(self.__type,
+                                                     self.__values,
+                                                     self.__precision,
+                                                     self.__round_trip,
+                                                     self.__trim_zeros,
+                                                     " ",
+                                                     self.__chunk_size):
+            write(chunk)
+        if self.__trailing_separator and len(self.__values):
+            writer.write(" ")
+        writer.write(newl)
+
+
+def element_to_string(element, addindent="    "):
+    writer = io.StringIO()
+    element.writexml(writer, "", addindent, "\n")
+
+    return writer.getvalue()
+
+
+def floats_to_string(floats, separator=" ", precision="%.6f"):
+    return separator.join(precision % x for x in floats)
+
+
+def ints_to_string(ints, separator=" "):
+    return separator.join(map(str, ints))
+
+
+def strings_to_string(strings, separator=" "):
+    return separator.join(string for string in strings)
+
+
+def write_source(id_, type_, array, params, doc,
+                 precision=array_encoder.DEFAULT_PRECISION, round_trip=False,
+                 trim_zeros=False, chunk_size=array_encoder.CHUNK_SIZE):
+    length = len(array)
+    if type_ == "float4x4":
+        stride = 16
+    elif len(params) == 0:
+        stride = 1
+    else:
+        stride = len(params)
+    count = int(length / stride)
+
+    source = doc.createElement("source")
+    source.setAttribute("id", id_)
+
+    if type_ == "float4x4":
+        source_data = doc.createElement("float_array")
+    else:
+        source_data = doc.createElement("{!s}_array".format(type_))
+    source_data.setAttribute("id", "{!s}-array".format(id_))
+    source_data.setAttribute("count", str(length))
+    source_data.appendChild(ArrayText(type_, array, precision, round_trip,
+                                      trim_zeros, chunk_size=chunk_size))
+    technique_common = doc.createElement("technique_common")
+    accessor = doc.createElement("accessor")
+    accessor.setAttribute("source", "#{!s}-array".format(id_))
+    accessor.setAttribute("count", str(count))
+    accessor.setAttribute("stride", str(stride))
+    for param in params:
+        param_node = doc.createElement("param")
+        param_node.setAttribute("name", param)
+        param_node.setAttribute("type", type_)
+        accessor.appendChild(param_node)
+    if len(params) == 0:
+        param_node = doc.createElement("param")
+        param_node.setAttribute("type", type_)
+        accessor.appendChild(param_node)
+    technique_common.appendChild(accessor)
+
+    source.appendChild(source_data)
+    source.appendChild(technique_common)
+
+    return source
+
+
+def write_input(name, offset, type_, semantic):
+    id_ = "{!s}-{!s}".format(name, type_)
+    input = _DOCUMENT.createElement("input")
+
+    if offset is not None:
+        input.setAttribute("offset", str(offset))
+    input.setAttribute("semantic", semantic)
+    if semantic == "TEXCOORD":
+        input.setAttribute("set", "0")
+    input.setAttribute("source", "#{!s}".format(id_))
+
+    return input
+
+
+def write_double_sided_extra(profile, doc):
+    extra = doc.createElement("extra")
+    technique = doc.createElement("technique")
+    technique.setAttribute("profile", profile)
+    double_sided = doc.createElement("double_sided")
+    double_sided_value = doc.createTextNode("1")
+    double_sided.appendChild(double_sided_value)
+    technique.appendChild(double_sided)
+    extra.appendChild(technique)
+
+    return extra
+
+
+def join(*items):
+    strings = []
+    for item in items:
+        strings.append(str(item))
+    return "".join(strings)